@@ -1,11 +1,11 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context, g
 import hashlib
+import json
 import os
+import queue
+import time
 import datetime
-import requests
 from dotenv import load_dotenv
-from darek_core import Darek
 
 # Load environment variables with explicit path
 try:
@@ -14,18 +14,83 @@ except:
     # Fallback if dotenv fails
     pass
 
+# Imported after .env is loaded: these modules read their settings at import
+import logs
+logs.configure()
+import metrics
+metrics.configure()
+from darek_core import Darek, warm_up
+from batch_writer import BatchWriter
+from init_db import create_database
+from intent_router import memo as intent_memo
+import assets
+import dashboard as dashboard_service
+import db
+import upstream_cache
+import retention
+import upstreams
+import user_search
+from scheduler import scheduler, format_event, HEARTBEAT_INTERVAL
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'darek-ai-super-secret-key-2024-production')
 app.config['PERMANENT_SESSION_LIFETIME'] = datetime.timedelta(days=7)
 
-# Initialize Darek AI
+# Initialize Darek AI; other intents load their handlers on first use
 darek = Darek()
+warm_up()
+
+# Command history is written in the background, batched across requests, and
+# indexed for search with each batch
+history_writer = BatchWriter(
+    'INSERT INTO command_history (command, user_id, success, intent) VALUES (?, ?, ?, ?)',
+    batch_size=int(os.getenv('DAREK_HISTORY_BATCH_SIZE', '100')),
+    flush_interval=int(os.getenv('DAREK_HISTORY_FLUSH_MS', '250')) / 1000,
+    name='command-history',
+    after=user_search.index)
+
+# Most messages accepted by one /chat/batch request
+CHAT_BATCH_MAX = int(os.getenv('DAREK_CHAT_BATCH_MAX', '100'))
+
+# Optional bearer token required to scrape /metrics
+METRICS_TOKEN = os.getenv('DAREK_METRICS_TOKEN', '')
+
+# Long-lived streams would swamp the request latency histogram
+UNTIMED_ENDPOINTS = frozenset(['events', 'static', 'asset'])
+
+# Templates link static files through their fingerprinted builds
+app.jinja_env.globals['asset_url'] = assets.asset_url
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def start_retention_worker():
+    # Once per process, including workers forked after import
+    retention.worker.start()
+
+@app.after_request
+def note_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.after_request
+def compress_response(response):
+    return assets.compress(response)
+
+@app.teardown_request
+def record_request_time(error=None):
+    started = g.pop('request_started', None)
+    endpoint = request.endpoint or 'unmatched'
+    if started is None or endpoint in UNTIMED_ENDPOINTS:
+        return
+    failed = error is not None or g.get('response_status', 200) >= 500
+    metrics.observe('request', endpoint, time.perf_counter() - started, failed)
 
 def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect('instance/darek_ai.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get a pooled database connection"""
+    return db.get_connection()
 
 def hash_password(password):
     """Hash password using SHA256"""
@@ -41,6 +106,10 @@ def index():
         return redirect(url_for('login'))
     return render_template('index.html')
 
+@app.route('/static/dist/<path:filename>')
+def asset(filename):
+    return assets.send_asset(filename)
+
 @app.route('/chat')
 def chat_page():
     if 'user_id' not in session:
@@ -119,29 +188,39 @@ def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    
-    # Get user data
-    reminders = conn.execute('SELECT * FROM reminder WHERE user_id = ? ORDER BY remind_at ASC', 
-                           (session['user_id'],)).fetchall()
-    todos = conn.execute('SELECT * FROM todo_item WHERE user_id = ? AND completed = 0', 
-                        (session['user_id'],)).fetchall()
-    shopping_items = conn.execute('SELECT * FROM shopping_item WHERE user_id = ?', 
-                                (session['user_id'],)).fetchall()
-    notes = conn.execute('SELECT * FROM note WHERE user_id = ? ORDER BY created_at DESC', 
-                        (session['user_id'],)).fetchall()
-    timers = conn.execute('SELECT * FROM timer WHERE user_id = ? ORDER BY id DESC LIMIT 5', 
-                         (session['user_id'],)).fetchall()
-    
-    conn.close()
+    view = dashboard_service.get_dashboard(session['user_id'])
     
     return render_template('dashboard.html', 
                          name=session['username'],
-                         reminders=reminders,
-                         todos=todos,
-                         shopping_items=shopping_items,
-                         notes=notes,
-                         timers=timers)
+                         **view)
+
+@app.route('/api/dashboard')
+def api_dashboard():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    user_id = session['user_id']
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'since must be a dashboard version'}), 400
+
+    # A client that is up to date costs one counter lookup
+    if request.if_none_match:
+        current = dashboard_service.version(user_id)
+        if request.if_none_match.contains_weak(dashboard_service.etag(user_id, current)):
+            response = Response(status=304)
+            response.set_etag(dashboard_service.etag(user_id, current))
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+
+    view = dashboard_service.sync(user_id, since)
+    response = jsonify(view)
+    response.set_etag(dashboard_service.etag(user_id, view['version']))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/logout')
 def logout():
@@ -172,21 +251,105 @@ def chat():
         if not response_text or response_text.strip() == '':
             response_text = "I'm not sure how to help with that. Try asking me about weather, reminders, or other tasks!"
         
-        # Log command history
-        try:
-            conn = get_db_connection()
-            conn.execute('INSERT INTO command_history (command, user_id, success) VALUES (?, ?, ?)',
-                        (user_message, user_id, True))
-            conn.commit()
-            conn.close()
-        except:
-            pass  # Continue even if logging fails
+        # Log command history (written in the background, never blocks the reply)
+        history_writer.put((user_message, user_id, True, darek.intent_name(user_message)))
         
         return jsonify({'message': response_text})
         
     except Exception as e:
         return jsonify({'message': f"Sorry, I encountered an error: {str(e)}"}), 500
 
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Process an ordered list of messages; one /chat-style result per message"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True)
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return jsonify({'message': 'Please provide a list of messages'}), 400
+    if len(messages) > CHAT_BATCH_MAX:
+        return jsonify({'message': f'Please send at most {CHAT_BATCH_MAX} messages per batch'}), 413
+        
+    user_id = session['user_id']
+    texts = [message.strip() if isinstance(message, str) else '' for message in messages]
+    results = [{'status': 400, 'message': 'Please provide a valid message'} for _ in texts]
+    valid = [index for index, text in enumerate(texts) if text]
+    
+    try:
+        replies = darek.process_batch([texts[index] for index in valid], user_id)
+    except Exception as e:
+        return jsonify({'message': f"Sorry, I encountered an error: {str(e)}"}), 500
+    
+    for index, (response_text, error) in zip(valid, replies):
+        if error is not None:
+            results[index] = {'status': 500, 'message': f"Sorry, I encountered an error: {str(error)}"}
+            continue
+        if not response_text or response_text.strip() == '':
+            response_text = "I'm not sure how to help with that. Try asking me about weather, reminders, or other tasks!"
+        results[index] = {'status': 200, 'message': response_text}
+        history_writer.put((texts[index], user_id, True, darek.intent_name(texts[index])))
+    
+    return jsonify({'results': results})
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Like /chat, but streams NDJSON events: ack, partials, then final"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return jsonify({'message': 'Please provide a message'}), 400
+        
+    user_message = data['message'].strip()
+    if not user_message:
+        return jsonify({'message': 'Please provide a valid message'}), 400
+        
+    user_id = session['user_id']
+    
+    def generate():
+        try:
+            for event in darek.stream_command(user_message, user_id):
+                if event['type'] == 'final':
+                    if not event['message'] or event['message'].strip() == '':
+                        event['message'] = "I'm not sure how to help with that. Try asking me about weather, reminders, or other tasks!"
+                    history_writer.put((user_message, user_id, True, darek.intent_name(user_message)))
+                yield json.dumps(event) + '\n'
+        except Exception as e:
+            yield json.dumps({'type': 'final', 'message': f"Sorry, I encountered an error: {str(e)}"}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/events')
+def events():
+    """Server-sent events for the user's reminders and timers as they fire"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    scheduler.start()
+    
+    def generate():
+        events = queue.Queue()
+        scheduler.broker.subscribe(user_id, events.put)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = events.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event(event)
+        finally:
+            scheduler.broker.unsubscribe(user_id, events.put)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/weather')
 def get_weather():
     if 'user_id' not in session:
@@ -199,11 +362,9 @@ def get_weather():
         return jsonify({'error': 'Weather API key not configured'}), 500
     
     try:
-        url = f'http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric'
-        response = requests.get(url)
-        data = response.json()
+        data = upstreams.get_weather(city, api_key)
         
-        if response.status_code == 200:
+        if data is not None:
             weather_info = {
                 'city': data['name'],
                 'temperature': data['main']['temp'],
@@ -229,11 +390,9 @@ def get_news():
         return jsonify({'error': 'News API key not configured'}), 500
     
     try:
-        url = f'https://newsapi.org/v2/top-headlines?country=us&apiKey={api_key}'
-        response = requests.get(url)
-        data = response.json()
+        data = upstreams.get_news(api_key)
         
-        if response.status_code == 200:
+        if data is not None:
             articles = data.get('articles', [])[:5]
             news_items = []
             for article in articles:
@@ -249,9 +408,64 @@ def get_news():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/cache/stats')
+def cache_stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    return jsonify({**upstream_cache.stats(), 'intent_memo': intent_memo.stats()})
+
+@app.route('/search')
+def search():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Please provide a query'}), 400
+    kinds = [kind for value in request.args.getlist('kind') for kind in value.split(',') if kind]
+    try:
+        limit = int(request.args.get('limit', 20))
+        before = int(request.args['cursor']) if request.args.get('cursor') else None
+        results, next_cursor = user_search.search(session['user_id'], query, kinds or None, limit, before)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'results': results, 'next_cursor': next_cursor})
+
+@app.route('/stats')
+def stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 366)
+    except ValueError:
+        return jsonify({'error': 'days must be a number'}), 400
+    return jsonify(retention.usage(session['user_id'], days))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/summary')
+def metrics_summary():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    return jsonify(metrics.summary())
+
 if __name__ == '__main__':
-    # Ensure instance directory exists
+    # Ensure instance directory exists and the schema is current
     os.makedirs('instance', exist_ok=True)
+    create_database()
+
+    # Fire reminders and timers from startup, not from the first request. Under
+    # the debug reloader only the child process serves, so only it starts them
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler.start()
+        retention.worker.start()
     
     print("🚀 Starting Darek AI Assistant...")
     print("🌐 Server will be available at: http://localhost:5000")
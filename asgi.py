@@ -0,0 +1,177 @@
+"""
+ASGI entry point for Darek AI
+
+POST /chat is served natively on the event loop through
+Darek.process_command_async, so a chat waiting on weather, news or search only
+holds a slot in the I/O executor instead of a whole worker. Every other route
+is passed through to the Flask app unchanged.
+
+GET /events is also served natively: each connected client is an asyncio
+queue fed by the scheduler thread, not a worker thread parked on a blocking
+queue as in the Flask version of the route.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+
+import metrics
+import retention
+from app import app, darek, history_writer
+from darek_core import unrecognized_writer
+from knowledge_index import article_writer
+from scheduler import scheduler, format_event, HEARTBEAT_INTERVAL
+
+flask_application = WsgiToAsgi(app)
+
+DEFAULT_REPLY = "I'm not sure how to help with that. Try asking me about weather, reminders, or other tasks!"
+
+
+def load_session(scope):
+    """Decode Flask's signed session cookie from an ASGI scope"""
+    cookie_header = b''
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            cookie_header = value
+            break
+    cookie = parse_cookie(cookie_header.decode('latin-1')).get(app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return {}
+    serializer = app.session_interface.get_signing_serializer(app)
+    try:
+        return serializer.loads(cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def chat(scope, receive, send):
+    """Async twin of app.chat"""
+    session = load_session(scope)
+    if 'user_id' not in session:
+        return await send_json(send, 401, {'error': 'Not authenticated'})
+
+    try:
+        try:
+            data = json.loads(await read_body(receive) or b'null')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or 'message' not in data:
+            return await send_json(send, 400, {'message': 'Please provide a message'})
+
+        user_message = data['message'].strip()
+        if not user_message:
+            return await send_json(send, 400, {'message': 'Please provide a valid message'})
+
+        user_id = session['user_id']
+        response_text = await darek.process_command_async(user_message, user_id)
+        if not response_text or response_text.strip() == '':
+            response_text = DEFAULT_REPLY
+
+        history_writer.put((user_message, user_id, True, darek.intent_name(user_message)))
+        return await send_json(send, 200, {'message': response_text})
+
+    except Exception as e:
+        return await send_json(send, 500, {'message': f"Sorry, I encountered an error: {str(e)}"})
+
+
+async def events(scope, receive, send):
+    """Async twin of app.events"""
+    session = load_session(scope)
+    if 'user_id' not in session:
+        return await send_json(send, 401, {'error': 'Not authenticated'})
+
+    user_id = session['user_id']
+    scheduler.start()
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue()
+
+    def deliver(event):
+        # Called from the scheduler thread
+        loop.call_soon_threadsafe(pending.put_nowait, event)
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')],
+    })
+    await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    scheduler.broker.subscribe(user_id, deliver)
+    try:
+        while True:
+            next_event = asyncio.ensure_future(pending.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, timeout=HEARTBEAT_INTERVAL,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+            if disconnected in done:
+                return
+            if next_event in done:
+                frame = format_event(next_event.result())
+            else:
+                frame = ': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': frame.encode(), 'more_body': True})
+    finally:
+        scheduler.broker.unsubscribe(user_id, deliver)
+        disconnected.cancel()
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            scheduler.start()
+            retention.worker.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            history_writer.close()
+            unrecognized_writer.close()
+            article_writer.close()
+            scheduler.stop()
+            retention.worker.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+    if scope['type'] == 'http' and scope['path'] == '/chat' and scope['method'] == 'POST':
+        with metrics.timed('request', 'chat'):
+            return await chat(scope, receive, send)
+    if scope['type'] == 'http' and scope['path'] == '/events' and scope['method'] == 'GET':
+        return await events(scope, receive, send)
+    return await flask_application(scope, receive, send)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Fingerprinted, precompressed static assets and compressed dynamic responses
+
+The build step copies every stylesheet, script and image under static/ to
+static/dist/ with a content hash in its name (css/enhanced_style.3f9a0c1b2d4e.css),
+next to gzip and, when the optional Brotli package is installed, brotli
+variants, and records logical name -> hashed name in static/dist/manifest.json:
+
+    python assets.py             # run after every change to static/, before deploying
+
+Templates link assets through asset_url('css/enhanced_style.css'), which gives
+the hashed URL when the asset has been built. A hashed file never changes, so
+it is served with a one-year immutable Cache-Control and repeat page loads do
+not request it at all; the precompressed variant the client accepts is sent
+as is. Files from earlier builds are left in place, so pages rendered before a
+deploy still load. Without a build, or with FLASK_DEBUG on, asset_url falls
+back to the plain /static URL so edits show up without rebuilding; a missing
+build outside debug is logged. The build reads the app's own static_folder
+and fails if it is missing or holds no assets.
+
+Dynamic HTML and JSON responses above DAREK_COMPRESS_MIN_BYTES are gzipped on
+the fly (see compress); streamed responses are left alone.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import sys
+import time
+
+from flask import abort, current_app, request, send_file, url_for
+from werkzeug.utils import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger('darek.assets')
+
+# Build output, inside the static folder
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+
+# Files the build fingerprints, and the ones also worth compressing
+EXTENSIONS = frozenset(['.css', '.js', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico',
+                        '.woff', '.woff2', '.json', '.txt'])
+TEXT_EXTENSIONS = frozenset(['.css', '.js', '.svg', '.json', '.txt'])
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Dynamic responses smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = int(os.getenv('DAREK_COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.getenv('DAREK_COMPRESS_LEVEL', '6'))
+COMPRESSIBLE = frozenset(['text/html', 'text/plain', 'text/css', 'application/json',
+                          'application/javascript', 'text/javascript', 'image/svg+xml'])
+
+# Precompressed variants, preferred first: (Content-Encoding, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Manifest per static folder, loaded on first use
+_manifests = {}
+
+
+def compressors():
+    """(file suffix, compress(bytes)) for every variant this build can write"""
+    variants = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda data: brotli.compress(data, quality=11)))
+    return variants
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.tmp'
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def build(source):
+    """Fingerprint and precompress every asset under source into its dist/; returns the manifest"""
+    output = os.path.join(source, BUILD_DIR)
+    manifest = {}
+    for directory, subdirectories, filenames in os.walk(source):
+        # Never fingerprint an earlier build
+        subdirectories[:] = sorted(name for name in subdirectories
+                                   if os.path.abspath(os.path.join(directory, name)) != os.path.abspath(output))
+        for filename in sorted(filenames):
+            extension = os.path.splitext(filename)[1].lower()
+            if extension not in EXTENSIONS:
+                continue
+            path = os.path.join(directory, filename)
+            logical = os.path.relpath(path, source).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            stem, _ = os.path.splitext(logical)
+            hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}'
+            target = os.path.join(output, hashed)
+            _write(target, data)
+            if extension in TEXT_EXTENSIONS:
+                for suffix, compress in compressors():
+                    packed = compress(data)
+                    # A variant that is not smaller is never worth sending
+                    if len(packed) < len(data):
+                        _write(target + suffix, packed)
+            manifest[logical] = hashed
+    _write(os.path.join(output, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Logical name -> hashed name for the build in static_folder ({} if none)"""
+    found = _manifests.get(static_folder)
+    if found is None:
+        try:
+            with open(os.path.join(static_folder, BUILD_DIR, MANIFEST)) as f:
+                found = json.load(f)
+        except (OSError, ValueError):
+            if not os.path.isdir(static_folder):
+                log.error('No static folder at %s; every asset URL will 404', static_folder)
+            else:
+                log.warning('No asset build in %s; linking unhashed /static URLs (run python assets.py)',
+                            static_folder)
+            found = {}
+        _manifests[static_folder] = found
+    return found
+
+
+def asset_url(filename):
+    """URL of a static asset: its fingerprinted build when there is one"""
+    if not current_app.debug:
+        hashed = load_manifest(current_app.static_folder).get(filename)
+        if hashed is not None:
+            return url_for('asset', filename=hashed)
+    return url_for('static', filename=filename)
+
+
+def send_asset(filename):
+    """A built asset, precompressed if the client accepts it, cacheable forever"""
+    path = safe_join(os.path.join(current_app.static_folder, BUILD_DIR), filename)
+    if path is None or filename == MANIFEST or not os.path.isfile(path):
+        abort(404)
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(path + suffix):
+            response = send_file(path + suffix, mimetype=mimetypes.guess_type(path)[0], conditional=True)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_file(path, conditional=True)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def compress(response):
+    """Gzip a dynamic text response above the size threshold if the client accepts it"""
+    if (response.direct_passthrough or response.is_streamed or response.mimetype not in COMPRESSIBLE
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(body, COMPRESS_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    # The compressed body is a different representation of the same content
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def main():
+    # Build the folder the app serves from; importing it connects to nothing
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Fingerprint and precompress the static assets')
+    parser.add_argument('--source', default=app.static_folder, help='static folder (default %(default)s)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.source):
+        print(f'No static folder at {args.source}', file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    built = build(args.source)
+    if not built:
+        print(f'No assets under {args.source}', file=sys.stderr)
+        return 1
+    output = os.path.join(args.source, BUILD_DIR)
+    raw = packed = 0
+    for logical, hashed in sorted(built.items()):
+        size = os.path.getsize(os.path.join(output, hashed))
+        variants = {suffix: os.path.getsize(os.path.join(output, hashed + suffix))
+                    for suffix in ('.gz', '.br') if os.path.isfile(os.path.join(output, hashed + suffix))}
+        raw += size
+        packed += min([size, *variants.values()])
+        sizes = ', '.join(f'{suffix[1:]} {variant / 1024:.1f} KB' for suffix, variant in variants.items())
+        print(f'{logical} -> {hashed} ({size / 1024:.1f} KB{", " + sizes if sizes else ""})')
+    print(f'{len(built)} assets, {raw / 1024:.1f} KB -> {packed / 1024:.1f} KB compressed '
+          f'in {time.perf_counter() - started:.2f} s' + ('' if brotli else ' (install Brotli for .br variants)'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
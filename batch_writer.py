@@ -0,0 +1,120 @@
+"""
+Background batched writes for Darek AI
+
+Request handlers hand rows to a BatchWriter and return immediately. A single
+background thread drains the queue and writes rows with executemany in one
+transaction, so many requests share one commit. An optional after(conn) runs
+in that same transaction once the batch is written, for work that is cheaper
+per batch than per row (indexing the new rows, say).
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import db
+
+log = logging.getLogger('darek.batch_writer')
+
+_STOP = object()
+
+
+class BatchWriter:
+    """Queue rows for one INSERT statement and write them in batches"""
+
+    def __init__(self, sql, batch_size=100, flush_interval=0.25, max_queue=10000,
+                 put_timeout=0.05, name='batch-writer', after=None):
+        self.sql = sql
+        self.after = after
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        # How long put() waits for room before giving up on a row
+        self.put_timeout = put_timeout
+        self.name = name
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked child inherits the queue but not the thread
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._thread = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def put(self, row):
+        """Queue one parameter tuple; returns False if the row was dropped"""
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def pending(self):
+        """Number of rows waiting to be written"""
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            row = self._queue.get()
+            if row is _STOP:
+                return
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        conn = db.get_connection()
+        try:
+            conn.executemany(self.sql, batch)
+            if self.after is not None:
+                self.after(conn)
+            conn.commit()
+            self.written += len(batch)
+        except sqlite3.Error as e:
+            self.failed += len(batch)
+            log.error('%s: failed to write %d rows: %s', self.name, len(batch), e)
+        finally:
+            conn.close()
+
+    def close(self, timeout=5.0):
+        """Write everything still queued and stop the background thread"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
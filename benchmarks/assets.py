@@ -0,0 +1,101 @@
+"""
+Static asset benchmark: bytes and requests per page load, before and after a build
+
+Copies the static folder to a throwaway directory, builds it there with
+assets.build and replays the asset requests of a page the way a browser with
+a cache does, once through the plain /static URLs and once through the
+fingerprinted ones asset_url gives. For each it reports the requests and
+bytes of a first visit and of a repeat visit. Fails unless a repeat visit
+requests no asset at all and a first visit moves under half the raw bytes.
+Usage:
+
+    python -m benchmarks.assets [--static static]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# The database path is read at import time
+_directory = tempfile.mkdtemp(prefix='darek-assets-')
+os.environ['DAREK_DB_PATH'] = os.path.join(_directory, 'assets.db')
+
+import assets
+from app import app
+
+ACCEPT_ENCODING = 'gzip, deflate, br'
+
+
+def page_load(client, urls, cache):
+    """(requests, body bytes, ms) for fetching urls through a browser-like cache"""
+    requests = transferred = 0
+    started = time.perf_counter()
+    for url in urls:
+        entry = cache.get(url)
+        if entry is not None and entry['fresh']:
+            continue
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if entry is not None:
+            headers['If-None-Match'] = entry['etag']
+        response = client.get(url, headers=headers)
+        requests += 1
+        transferred += len(response.data)
+        if response.status_code == 200:
+            control = response.cache_control
+            cache[url] = {'etag': response.headers.get('ETag'),
+                          'fresh': bool(control.max_age) and not control.no_cache}
+        response.close()
+    return requests, transferred, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--static', default=app.static_folder, help='static folder to build a copy of')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.static):
+        print(f'No static folder at {args.static}')
+        return 1
+    static = os.path.join(_directory, 'static')
+    shutil.copytree(args.static, static, ignore=shutil.ignore_patterns(assets.BUILD_DIR))
+    app.static_folder = static
+    app.debug = False
+    built = assets.build(static)
+    raw = sum(os.path.getsize(os.path.join(static, name)) for name in built)
+    print(f"{len(built)} assets, {raw / 1024:.1f} KB raw{'' if assets.brotli else ' (no Brotli: gzip only)'}")
+    print()
+
+    with app.test_request_context('/'):
+        plain = [app.url_for('static', filename=name) for name in built]
+        hashed = [assets.asset_url(name) for name in built]
+
+    client = app.test_client()
+    print(f"{'urls':<14} {'visit':<7} {'requests':>8} {'KB':>8} {'ms':>7}")
+    results = {}
+    for label, urls in (('/static', plain), ('fingerprinted', hashed)):
+        cache = {}
+        for visit in ('first', 'repeat'):
+            requests, transferred, ms = page_load(client, urls, cache)
+            results[label, visit] = requests, transferred
+            print(f"{label:<14} {visit:<7} {requests:>8} {transferred / 1024:>8.1f} {ms:>7.2f}")
+    print()
+
+    failures = []
+    requests, _ = results['fingerprinted', 'repeat']
+    if requests:
+        failures.append(f'a repeat visit still made {requests} asset requests')
+    _, transferred = results['fingerprinted', 'first']
+    if transferred > raw / 2:
+        failures.append(f'a first visit moved {transferred / 1024:.1f} KB of {raw / 1024:.1f} KB raw')
+    for failure in failures:
+        print(f'FAIL  {failure}')
+    if not failures:
+        print(f'PASS  repeat visits request nothing; first visits move {transferred / raw:.0%} of the raw bytes')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
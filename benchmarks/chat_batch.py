@@ -0,0 +1,101 @@
+"""
+Bulk-client throughput: one POST /chat per message against /chat/batch
+
+Starts the stub upstream and the app server the way benchmarks.load_test does,
+logs in one synthetic user and sends the same messages twice: back to back
+through /chat, as a client replaying a queue does today, then in /chat/batch
+requests. Reports messages per second for both and fails if batching is not
+at least --min-speedup times faster. Usage:
+
+    python -m benchmarks.chat_batch [--messages 500] [--batch-size 100]
+        [--latency-ms 50] [--min-speedup 10] [--server-cmd "..."]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import COMMANDS
+from benchmarks.load_test import SKIPPED_INTENTS, free_port, log_in, start_server
+from benchmarks.stub_upstream import StubServer
+
+
+def send_one_by_one(session, base_url, messages):
+    failed = 0
+    for message in messages:
+        if session.post(f'{base_url}/chat', json={'message': message}, timeout=30).status_code != 200:
+            failed += 1
+    return failed
+
+
+def send_batched(session, base_url, messages, batch_size):
+    failed = 0
+    for start in range(0, len(messages), batch_size):
+        response = session.post(f'{base_url}/chat/batch', timeout=60,
+                                json={'messages': messages[start:start + batch_size]})
+        response.raise_for_status()
+        failed += sum(1 for result in response.json()['results'] if result['status'] != 200)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=50, help='stub upstream latency')
+    parser.add_argument('--min-speedup', type=float, default=10)
+    parser.add_argument('--server-cmd', help='command that serves the app on {port}')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    commands = [text for label, text in COMMANDS if label not in SKIPPED_INTENTS]
+    messages = [rng.choice(commands) for _ in range(args.messages)]
+
+    stub = StubServer(latency_ms=args.latency_ms, error_rate=0).start()
+    directory = tempfile.mkdtemp(prefix='darek-batch-')
+    port = free_port()
+    env = dict(os.environ, **stub.urls())
+    env.update(DAREK_DB_PATH=os.path.join(directory, 'batch.db'),
+               DAREK_LOG_FILE=os.path.join(directory, 'darek.jsonl'),
+               DAREK_METRICS_DIR=os.path.join(directory, 'metrics'),
+               DAREK_PHRASEBOOK_INDEX=os.path.join(directory, 'translations.idx'),
+               DAREK_SHARED_CACHE_PATH=os.path.join(directory, 'shared_cache.db'),
+               WEATHER_API_KEY='load-test', NEWS_API_KEY='load-test',
+               SECRET_KEY='load-test-secret')
+    output = open(os.path.join(directory, 'server.out'), 'w')
+    process = start_server(args.server_cmd, port, env, output)
+    base_url = f'http://127.0.0.1:{port}'
+    session = None
+    try:
+        session = log_in(base_url, 0)
+        # Warm lazy imports, connection pools and the upstream cache for both runs
+        send_batched(session, base_url, commands, args.batch_size)
+
+        timings = {}
+        for name, send in (('/chat', lambda: send_one_by_one(session, base_url, messages)),
+                           ('/chat/batch', lambda: send_batched(session, base_url, messages, args.batch_size))):
+            started = time.perf_counter()
+            failed = send()
+            timings[name] = time.perf_counter() - started
+            print(f"{name:<12} {len(messages)} messages in {timings[name]:6.2f} s "
+                  f"({len(messages) / timings[name]:8.1f} msg/s), {failed} failed")
+    finally:
+        if session is not None:
+            session.close()
+        process.terminate()
+        process.wait(10)
+        stub.shutdown()
+
+    speedup = timings['/chat'] / timings['/chat/batch']
+    ok = speedup >= args.min_speedup
+    print()
+    print(f"{'PASS' if ok else 'FAIL'}  /chat/batch is {speedup:.1f}x faster (needs {args.min_speedup:g}x)")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Labelled command corpus shared by the Darek AI benchmarks
+
+Commands come from the README examples, the suggestion and feature buttons in
+main.js, and phrasing seen among unrecognized commands.
+"""
+
+COMMANDS = [
+    ('time', "What time is it?"),
+    ('time', "Tell me the current time"),
+    ('reminder', "Set a reminder in 10 minutes to check emails"),
+    ('reminder', "Remind me to call mom in 30 minutes"),
+    ('reminder', "Set a reminder to water the plants in 2 hours"),
+    ('todo', "Add finish presentation to my to-do list"),
+    ('todo', "Add buy stamps to my todo list"),
+    ('shopping', "Add bread and eggs to my shopping list"),
+    ('shopping', "Add milk to shopping list"),
+    ('wikipedia', "Search for artificial intelligence"),
+    ('wikipedia', "Wikipedia quantum computing"),
+    ('play', "Play some relaxing music"),
+    ('timer', "Start a 5 minute timer"),
+    ('timer', "Start a 30 second timer"),
+    ('calculate', "Calculate 15 + 25 * 2"),
+    ('calculate', "Calculate 15% of 200"),
+    ('calculate', "Math: (100 + 50) / 3"),
+    ('translate', "Translate hello to Spanish"),
+    ('translate', "Translate thank you to Japanese"),
+    ('translate', "Translate good morning to German"),
+    ('news', "Give me the latest news headlines"),
+    ('note', "Create a note about meeting with team tomorrow"),
+    ('note', "Make a note to renew the car insurance"),
+    ('joke', "Tell me a funny joke"),
+    ('weather', "What's the weather like in London?"),
+    ('weather', "Weather forecast for Tokyo"),
+    ('weather', "Is it raining in Paris? weather please"),
+    ('trivia', "Ask me a trivia question"),
+    ('habit', "Track my daily water intake"),
+    ('calendar', "What's on my calendar today?"),
+    ('how_are_you', "Hi Darek, how are you?"),
+    ('web_search', "What is machine learning?"),
+    ('web_search', "Tell me about renewable energy"),
+    ('web_search', "Who is Ada Lovelace"),
+    ('greeting', "Hello there"),
+    ('greeting', "Good morning Darek"),
+    ('help', "What can you do?"),
+    ('help', "Can you give me a hand, I need help"),
+    ('thanks', "Thanks a lot"),
+    ('bye', "Goodbye, see you tomorrow"),
+    ('bye', "Bye for now"),
+    (None, "I'm not sure what any of this even means for us"),
+    (None, "Purple elephants dancing on the moon"),
+]
+
+
+def commands(intent=None):
+    """Return the lower-cased commands, optionally only those for one intent"""
+    return [text.lower() for label, text in COMMANDS
+            if intent is None or label == intent]
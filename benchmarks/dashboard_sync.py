@@ -0,0 +1,116 @@
+"""
+Dashboard sync benchmark: full /api/dashboard, a 304 poll and a one-row delta
+
+Fills every widget of one user to its limit in a throwaway database and times
+three ways a client refreshes through the test client: a full fetch, a
+conditional poll when nothing changed, and a ?since= poll after one chat
+command added a row. For each it reports latency, body bytes and the SQL
+statements the request ran. Fails unless an unchanged poll runs exactly one
+statement and a delta moves under a quarter of the full body. Usage:
+
+    python -m benchmarks.dashboard_sync [--number 500]
+"""
+
+import os
+import sys
+import tempfile
+
+# The database path is read at import time
+_directory = tempfile.mkdtemp(prefix='darek-dashboard-')
+os.environ['DAREK_DB_PATH'] = os.path.join(_directory, 'dashboard.db')
+
+import argparse
+import statistics
+import time
+
+import db
+import metrics
+from app import app
+from darek_core import Darek
+from init_db import create_database
+
+USER_ID = 1
+
+
+def fill(rows):
+    conn = db.get_connection()
+    conn.execute("INSERT INTO user (id, username, email, password_hash) VALUES (?, 'bench', 'bench@example.com', '')",
+                 (USER_ID,))
+    for i in range(rows):
+        conn.execute("INSERT INTO reminder (task, remind_at, user_id) VALUES (?, datetime('now', ?), ?)",
+                     (f'reminder {i}', f'+{i + 1} hours', USER_ID))
+        conn.execute('INSERT INTO todo_item (task, user_id) VALUES (?, ?)', (f'todo {i}', USER_ID))
+        conn.execute('INSERT INTO shopping_item (item_name, user_id) VALUES (?, ?)', (f'item {i}', USER_ID))
+        conn.execute('INSERT INTO note (title, content, user_id) VALUES (?, ?, ?)',
+                     (f'note {i}', f'the text of note number {i}', USER_ID))
+        conn.execute('INSERT INTO timer (name, duration, active, user_id) VALUES (?, 60, 0, ?)', (f'timer {i}', USER_ID))
+    conn.commit()
+    conn.close()
+
+
+def statements():
+    """SQL statements this process has run so far"""
+    return sum(sum(counts) for family, _, counts, _, _ in metrics.registry.snapshot()['histograms']
+               if family == 'db')
+
+
+def measure(client, number, request):
+    """(p50 ms, body bytes, statements per request) of number calls of request(client)"""
+    timings = []
+    before = statements()
+    for _ in range(number):
+        started = time.perf_counter()
+        response = request(client)
+        timings.append((time.perf_counter() - started) * 1000)
+    size = len(response.data)
+    return statistics.median(timings), size, (statements() - before) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=500, help='requests per measurement')
+    parser.add_argument('--rows', type=int, default=40, help='rows per widget table')
+    args = parser.parse_args()
+
+    create_database()
+    fill(args.rows)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = USER_ID
+        session['username'] = 'bench'
+
+    first = client.get('/api/dashboard')
+    version, etag = first.json['version'], first.headers['ETag']
+    unchanged = {'If-None-Match': etag}
+    results = {
+        'full': measure(client, args.number, lambda c: c.get('/api/dashboard')),
+        'unchanged': measure(client, args.number,
+                             lambda c: c.get(f'/api/dashboard?since={version}', headers=unchanged)),
+    }
+    Darek().process_command('add oat milk to my shopping list', USER_ID)
+    results['one change'] = measure(client, args.number,
+                                    lambda c: c.get(f'/api/dashboard?since={version}', headers=unchanged))
+
+    print(f"{'request':<11} {'p50 ms':>7} {'bytes':>7} {'statements':>10}")
+    for name, (p50, size, count) in results.items():
+        print(f"{name:<11} {p50:>7.3f} {size:>7} {count:>10.1f}")
+    print()
+
+    failures = []
+    _, size, count = results['unchanged']
+    if count != 1 or size:
+        failures.append(f'an unchanged poll ran {count:g} statements and sent {size} bytes')
+    full_size = results['full'][1]
+    delta_size = results['one change'][1]
+    if delta_size * 4 > full_size:
+        failures.append(f'a one-row delta sent {delta_size} of {full_size} bytes')
+    for failure in failures:
+        print(f'FAIL  {failure}')
+    if not failures:
+        print(f"PASS  unchanged polls cost one counter lookup; a one-row delta is "
+              f"{delta_size / full_size:.0%} of a full fetch")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Dispatch microbenchmark: compiled intent router vs the old if/elif chain
+
+Only intent selection is timed; no handler runs. Usage:
+
+    python -m benchmarks.dispatch [--repeat 5] [--number 20000]
+"""
+
+import argparse
+import timeit
+
+from benchmarks.corpus import commands
+from darek_core import router
+
+
+def legacy_route(command):
+    """The condition chain process_command used before the intent router"""
+    if 'time' in command:
+        return 'time'
+    elif 'set a reminder' in command or 'remind me' in command:
+        return 'reminder'
+    elif 'add to my to-do list' in command or ('add' in command and 'todo' in command) or 'todo' in command:
+        return 'todo'
+    elif 'add to my shopping list' in command or ('add' in command and 'shopping' in command) or 'shopping' in command:
+        return 'shopping'
+    elif 'search' in command or 'wikipedia' in command:
+        return 'wikipedia'
+    elif 'play' in command:
+        return 'play'
+    elif 'start' in command and 'timer' in command:
+        return 'timer'
+    elif 'calculate' in command or 'math' in command:
+        return 'calculate'
+    elif 'translate' in command:
+        return 'translate'
+    elif 'news' in command:
+        return 'news'
+    elif 'note' in command and ('create' in command or 'make' in command or 'add' in command):
+        return 'note'
+    elif 'joke' in command:
+        return 'joke'
+    elif 'weather' in command:
+        return 'weather'
+    elif 'trivia' in command or 'quiz' in command:
+        return 'trivia'
+    elif 'habit' in command or 'track' in command:
+        return 'habit'
+    elif 'calendar' in command or 'schedule' in command:
+        return 'calendar'
+    elif 'how are you' in command:
+        return 'how_are_you'
+    elif any(word in command for word in ['search', 'google', 'find', 'look up', 'what is', 'who is', 'tell me about']):
+        return 'web_search'
+    elif any(greeting in command for greeting in ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening']):
+        return 'greeting'
+    elif 'what can you do' in command or 'help' in command or 'capabilities' in command:
+        return 'help'
+    elif 'thank you' in command or 'thanks' in command:
+        return 'thanks'
+    elif 'bye' in command or 'goodbye' in command or 'see you' in command:
+        return 'bye'
+    return None
+
+
+def router_route(command):
+    intent = router.match(command)
+    return intent.name if intent else None
+
+
+def time_per_call(func, corpus, number, repeat):
+    """Best-of-repeat mean nanoseconds per dispatch over the corpus"""
+    def run():
+        for command in corpus:
+            func(command)
+    best = min(timeit.repeat(run, number=number, repeat=repeat))
+    return best / (number * len(corpus)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = commands()
+    router.compile()
+
+    print(f"{'command':<60} {'legacy':>12} {'router':>12} {'legacy ns':>10} {'router ns':>10}")
+    for command in corpus:
+        legacy_ns = time_per_call(legacy_route, [command], args.number, args.repeat)
+        router_ns = time_per_call(router_route, [command], args.number, args.repeat)
+        print(f"{command[:60]:<60} {str(legacy_route(command)):>12} {str(router_route(command)):>12} "
+              f"{legacy_ns:>10.0f} {router_ns:>10.0f}")
+
+    legacy_ns = time_per_call(legacy_route, corpus, args.number, args.repeat)
+    router_ns = time_per_call(router_route, corpus, args.number, args.repeat)
+    print()
+    print(f"mean over {len(corpus)} commands: legacy {legacy_ns:.0f} ns, router {router_ns:.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
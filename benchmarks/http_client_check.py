@@ -0,0 +1,84 @@
+"""
+Exercise http_client against the local stub upstream
+
+Checks connection reuse, read timeouts, retries on 5xx and the circuit
+breaker, then prints per-request latency with and without keep-alive.
+
+    python -m benchmarks.http_client_check
+"""
+
+import sys
+import time
+
+import requests
+
+from benchmarks.stub_upstream import StubServer
+from http_client import CircuitOpenError, HttpClient
+
+
+def check(name, condition, detail=''):
+    print(f"{'PASS' if condition else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+    return condition
+
+
+def main():
+    results = []
+
+    server = StubServer().start()
+    url = server.urls()['WEATHER_API_URL']
+    client = HttpClient()
+    for _ in range(20):
+        client.get(url, params={'q': 'London'})
+    results.append(check('keep-alive reuses one connection for 20 requests',
+                         server.connections == 1, f'connections={server.connections}'))
+
+    started = time.perf_counter()
+    for _ in range(50):
+        client.get(url, params={'q': 'London'})
+    pooled_ms = (time.perf_counter() - started) / 50 * 1000
+    started = time.perf_counter()
+    for _ in range(50):
+        requests.get(url, params={'q': 'London'}, timeout=5)
+    bare_ms = (time.perf_counter() - started) / 50 * 1000
+    print(f'      pooled {pooled_ms:.2f} ms/request, bare requests.get {bare_ms:.2f} ms/request')
+    server.shutdown()
+
+    slow = StubServer(latency_ms=500).start()
+    client = HttpClient(read_timeout=0.1, max_retries=0)
+    started = time.perf_counter()
+    try:
+        client.get(slow.urls()['NEWS_API_URL'])
+        timed_out = False
+    except requests.exceptions.Timeout:
+        timed_out = True
+    elapsed = time.perf_counter() - started
+    results.append(check('read timeout bounds a slow upstream', timed_out and elapsed < 0.4,
+                         f'elapsed={elapsed:.2f}s'))
+    slow.shutdown()
+
+    flaky = StubServer(error_rate=1.0).start()
+    client = HttpClient(max_retries=2, failure_threshold=3, reset_timeout=0.5)
+    response = client.get(flaky.urls()['SEARCH_API_URL'])
+    results.append(check('5xx is retried up to max_retries', flaky.requests == 3 and response.status_code == 503,
+                         f'requests={flaky.requests}'))
+    try:
+        client.get(flaky.urls()['SEARCH_API_URL'])
+        failed_fast = False
+    except CircuitOpenError:
+        failed_fast = True
+    results.append(check('circuit opens after repeated failures', failed_fast and flaky.requests == 3,
+                         f'requests={flaky.requests}'))
+
+    flaky.error_rate = 0.0
+    time.sleep(0.6)
+    response = client.get(flaky.urls()['SEARCH_API_URL'])
+    host = flaky.base_url.split('//')[1]
+    results.append(check('half-open probe closes the circuit on success',
+                         response.status_code == 200 and client.stats()[host]['state'] == 'closed'))
+    flaky.shutdown()
+
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Cold-start guard: time `import app` with python -X importtime
+
+Imports app in a fresh interpreter several times, keeps the fastest run and
+fails if it is over budget or if any lazily loaded intent dependency was
+imported at startup. Usage:
+
+    python -m benchmarks.import_time [--budget-ms 400] [--runs 5] [--top 10]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must only be imported when an intent that needs them is first used
+LAZY_MODULES = ('wikipedia', 'pywhatkit', 'pyjokes', 'bs4', 'phrasebook', 'intents')
+
+BUDGET_MS = float(os.getenv('DAREK_IMPORT_BUDGET_MS', '400'))
+
+
+def import_profile(module='app'):
+    """Return [(name, self_us, cumulative_us)] for one cold import of module"""
+    env = dict(os.environ)
+    # Warm-up lists would defeat the point of measuring a cold start
+    env.pop('DAREK_WARM_INTENTS', None)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr[-2000:]}')
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def check(name, condition, detail=''):
+    print(f"{'PASS' if condition else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+    return condition
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    best = None
+    for _ in range(args.runs):
+        rows = import_profile()
+        total = next(cumulative for name, _, cumulative in rows if name == 'app')
+        if best is None or total < best[0]:
+            best = (total, rows)
+    total, rows = best
+
+    print(f"{'module':<40} {'self ms':>9} {'cumulative ms':>14}")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"{name:<40} {self_us / 1000:>9.1f} {cumulative_us / 1000:>14.1f}")
+    print()
+
+    imported = {name.split('.')[0] for name, _, _ in rows}
+    eager = sorted(imported.intersection(LAZY_MODULES))
+    results = [
+        check(f'import app within {args.budget_ms:.0f} ms', total / 1000 <= args.budget_ms,
+              f'best of {args.runs}: {total / 1000:.1f} ms'),
+        check('lazy intent dependencies stay out of startup', not eager,
+              f"imported: {', '.join(eager)}" if eager else ''),
+    ]
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
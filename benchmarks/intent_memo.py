@@ -0,0 +1,93 @@
+"""
+Memo of pure intents: cold and memoized process_command, hit rate, memory
+
+For every intent registered as pure, times process_command on its corpus
+commands with the memo cleared before each command (the handler runs) and
+with the memo warm (the handler is skipped), then replays the whole corpus
+with repeats to report the hit rate and the memory the memo holds. Fails if a
+memoized command is not faster than a cold one, or if an intent with several
+possible replies stops varying them. Usage:
+
+    python -m benchmarks.intent_memo [--number 2000]
+"""
+
+import os
+import sys
+import tempfile
+
+# Settings are read at import time
+_directory = tempfile.mkdtemp(prefix='darek-memo-')
+os.environ['DAREK_DB_PATH'] = os.path.join(_directory, 'memo.db')
+os.environ['DAREK_PHRASEBOOK_INDEX'] = os.path.join(_directory, 'translations.idx')
+
+import argparse
+import random
+import time
+
+import intent_router
+from benchmarks.corpus import commands
+from darek_core import Darek, router
+from init_db import create_database
+
+USER_ID = 1
+
+
+def ns_per_op(darek, texts, number, cold):
+    started = time.perf_counter_ns()
+    for i in range(number):
+        if cold:
+            intent_router.memo.clear()
+        darek.process_command(texts[i % len(texts)], USER_ID)
+    return (time.perf_counter_ns() - started) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help='commands per measurement')
+    args = parser.parse_args()
+
+    create_database()
+    darek = Darek()
+    failures = []
+    print(f"{'intent':<12} {'cold ns/op':>11} {'memo ns/op':>11} {'speedup':>8} {'replies':>8}")
+    for intent in router.intents:
+        texts = commands(intent.name)
+        if not intent.pure or not texts:
+            continue
+        for text in texts:
+            darek.process_command(text, USER_ID)  # Lazy imports happen here, not in a timed run
+        cold = ns_per_op(darek, texts, args.number, cold=True)
+        warm = ns_per_op(darek, texts, args.number, cold=False)
+        replies = len({darek.process_command(texts[0], USER_ID) for _ in range(200)})
+        intent_router.memo.clear()
+        candidates = intent.handler(darek, ' '.join(texts[0].split()), USER_ID)
+        expected = len(set(candidates)) if isinstance(candidates, intent_router.Choices) else 1
+        print(f"{intent.name:<12} {cold:>11.0f} {warm:>11.0f} {cold / warm:>7.1f}x {replies:>4}/{expected:<3}")
+        if warm >= cold:
+            failures.append(f'{intent.name}: memoized {warm:.0f} ns/op, cold {cold:.0f} ns/op')
+        if expected > 1 and replies == 1:
+            failures.append(f'{intent.name}: always gave the same one of {expected} replies')
+
+    # A corpus-shaped stream of chat: every command repeated in random order
+    intent_router.memo = intent_router.ResultMemo()
+    memo = intent_router.memo
+    rng = random.Random(0)
+    stream = commands() * 20
+    rng.shuffle(stream)
+    for text in stream:
+        darek.process_command(text, USER_ID)
+    stats = memo.stats()
+    print()
+    print(f"corpus replay: {len(stream)} commands, {stats['hits']} memo hits, {stats['misses']} misses "
+          f"(hit rate {stats['hit_rate']:.1%}); {stats['entries']} entries, {stats['bytes'] / 1024:.1f} KB")
+
+    print()
+    for failure in failures:
+        print(f'FAIL  {failure}')
+    if not failures:
+        print('PASS  memoized pure intents skip their handlers and keep their variety')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
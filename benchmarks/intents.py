@@ -0,0 +1,266 @@
+"""
+Per-intent benchmark for Darek.process_command, checked against baselines
+
+Drives process_command with the labelled corpus for each intent, against a
+throwaway SQLite database and with the weather, news, search and Wikipedia
+upstreams replaced by in-process fakes, so nothing leaves the machine and every
+run does the same work. Upstream caches, and the memo of pure intents, are
+cleared before each command so the fetch, parse and handler path is measured,
+not a cache hit (benchmarks.intent_memo measures the memo).
+
+For each intent it reports ns/op, the peak memory one command typically
+allocates and the memory left behind per command, then compares ns/op and peak
+memory with benchmarks/baselines/intents.json. Every timed run is paired with
+a run of a fixed pure-Python calibration loop and compared as a ratio, so
+baselines recorded on another (or a busier) machine stay comparable.
+
+Each intent is also compared with the baseline as the file was first
+committed (read from git history), so raising the baseline a step at a time
+cannot hide a regression: the drift column shows the total move. Exits
+non-zero if any intent regressed by more than the threshold against either.
+Usage:
+
+    python -m benchmarks.intents [--intent weather] [--threshold 0.3] [--update]
+"""
+
+import os
+import sys
+import tempfile
+
+# Settings are read at import time, so the temp database and API keys must be
+# in place before darek_core is imported
+_directory = tempfile.mkdtemp(prefix='darek-bench-')
+os.environ['DAREK_DB_PATH'] = os.path.join(_directory, 'bench.db')
+os.environ['DAREK_PHRASEBOOK_INDEX'] = os.path.join(_directory, 'translations.idx')
+os.environ.setdefault('WEATHER_API_KEY', 'bench')
+os.environ.setdefault('NEWS_API_KEY', 'bench')
+
+import argparse
+import json
+import subprocess
+import time
+import tracemalloc
+import types
+from urllib.parse import urlsplit
+
+import http_client
+import intent_router
+import upstream_cache
+from benchmarks.corpus import commands
+from benchmarks.stub_upstream import ROUTES
+from darek_core import Darek
+from init_db import create_database
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'intents.json')
+THRESHOLD = float(os.getenv('DAREK_BENCH_THRESHOLD', '0.3'))
+
+# Intent label in the corpus -> name reported here (None is the fallback)
+INTENTS = {
+    'time': 'time',
+    'reminder': 'reminder',
+    'todo': 'todo',
+    'shopping': 'shopping',
+    'timer': 'timer',
+    'calculate': 'calculate',
+    'translate': 'translate',
+    'note': 'note',
+    'weather': 'weather',
+    'news': 'news',
+    'web_search': 'web_search',
+    'wikipedia': 'wikipedia',
+    None: 'fallback',
+}
+
+USER_ID = 1
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        # A fresh copy, as decoding a real response body would give
+        return json.loads(json.dumps(self._payload))
+
+    def iter_content(self, chunk_size=1):
+        body = json.dumps(self._payload).encode()
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    """Stands in for http_client.client, answering from the stub upstream payloads"""
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        route = ROUTES.get(urlsplit(url).path, ROUTES['/'])
+        status, payload = route({key: [str(value)] for key, value in (params or {}).items()})
+        return FakeResponse(status, payload)
+
+
+def fake_wikipedia():
+    """Module with the parts of the wikipedia package the intent uses"""
+    module = types.ModuleType('wikipedia')
+    module.exceptions = types.SimpleNamespace(DisambiguationError=type('DisambiguationError', (Exception,), {}),
+                                              PageError=type('PageError', (Exception,), {}))
+    module.summary = lambda query, sentences=2: (
+        f'{query.title()} is the subject of this stub summary. It has exactly {sentences} sentences.')
+    return module
+
+
+def calibrate(loops=20000):
+    """ns for a fixed pure-Python workload, used to compare across machines"""
+    started = time.perf_counter_ns()
+    total = 0
+    for i in range(loops):
+        total += i * i % 7
+    return time.perf_counter_ns() - started
+
+
+def measure(darek, texts, min_time=0.1, repeat=9):
+    """Median (ns/op, ns/op per ns of calibration loop) over repeat paired runs"""
+    def run(number):
+        started = time.perf_counter_ns()
+        for i in range(number):
+            for cache in upstream_cache.caches.values():
+                cache.clear()
+            intent_router.memo.clear()
+            darek.process_command(texts[i % len(texts)], USER_ID)
+        return time.perf_counter_ns() - started
+
+    number = 1
+    while run(number) < min_time * 1e9 / 4:
+        number *= 2
+    number *= 4
+
+    samples = []
+    for _ in range(repeat):
+        calibration = min(calibrate() for _ in range(3))
+        ns = run(number) / number
+        samples.append((ns / calibration, ns))
+    samples.sort()
+    ratio, _ = samples[len(samples) // 2]
+    return sorted(ns for _, ns in samples)[len(samples) // 2], ratio
+
+
+def allocations(darek, texts, number=201):
+    """(median peak bytes allocated during one command, bytes retained per command)"""
+    for text in texts:
+        darek.process_command(text, USER_ID)  # Warm caches and lazy imports first
+    tracemalloc.start()
+    peaks = []
+    baseline = tracemalloc.get_traced_memory()[0]
+    for i in range(number):
+        for cache in upstream_cache.caches.values():
+            cache.clear()
+        intent_router.memo.clear()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        darek.process_command(texts[i % len(texts)], USER_ID)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    retained = (tracemalloc.get_traced_memory()[0] - baseline) / number
+    tracemalloc.stop()
+    # Background threads allocate too; the median ignores their occasional spikes
+    return sorted(peaks)[len(peaks) // 2], retained
+
+
+def load_baselines():
+    try:
+        with open(BASELINE_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def first_baselines():
+    """The baselines as the file was first committed, or None outside a git checkout"""
+    directory, name = os.path.split(BASELINE_PATH)
+    try:
+        added = subprocess.run(['git', 'log', '--diff-filter=A', '--format=%H', '--', name], cwd=directory,
+                               capture_output=True, text=True).stdout.split()
+        if not added:
+            return None
+        shown = subprocess.run(['git', 'show', f'{added[-1]}:./{name}'], cwd=directory,
+                               capture_output=True, text=True)
+        return json.loads(shown.stdout) if shown.returncode == 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--intent', action='append', help='only these intents (repeatable)')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='allowed slowdown or growth as a fraction (default %(default)s)')
+    parser.add_argument('--min-time', type=float, default=0.1)
+    parser.add_argument('--update', action='store_true', help='write the results as the new baselines')
+    args = parser.parse_args()
+
+    create_database()
+    http_client.client = FakeClient()
+    sys.modules['wikipedia'] = fake_wikipedia()
+    darek = Darek()
+
+    baselines = load_baselines()
+    first = first_baselines()
+    results = {}
+    failures = []
+    print(f"{'intent':<12} {'ns/op':>10} {'cal ns/op':>10} {'peak KB':>8} {'kept B':>7} {'baseline':>10} {'change':>8} "
+          f"{'first':>10} {'drift':>8}")
+    for label, name in INTENTS.items():
+        if args.intent and name not in args.intent:
+            continue
+        texts = commands(label)
+        peak, retained = allocations(darek, texts)
+        ns, ratio = measure(darek, texts, args.min_time)
+        # ns/op on a machine where the calibration loop takes exactly 1 ms
+        calibrated = ratio * 1e6
+        results[name] = {'ns_per_op': round(ns), 'calibrated_ns_per_op': round(calibrated), 'peak_bytes': peak}
+
+        base = (baselines or {}).get('intents', {}).get(name)
+        detail = ''
+        if base:
+            change = calibrated / base['calibrated_ns_per_op'] - 1
+            detail = f"{base['calibrated_ns_per_op']:>10} {change:>+8.0%}"
+            if change > args.threshold:
+                failures.append(f'{name}: {change:+.0%} ns/op')
+            if peak > base['peak_bytes'] * (1 + args.threshold) and peak - base['peak_bytes'] > 1024:
+                failures.append(f"{name}: peak memory {base['peak_bytes']} -> {peak} bytes")
+        original = (first or {}).get('intents', {}).get(name)
+        if original:
+            drift = calibrated / original['calibrated_ns_per_op'] - 1
+            detail = f"{detail or ' ' * 19} {original['calibrated_ns_per_op']:>10} {drift:>+8.0%}"
+            if drift > args.threshold and original != base:
+                failures.append(f'{name}: {drift:+.0%} ns/op since the first baseline')
+        print(f"{name:<12} {ns:>10.0f} {calibrated:>10.0f} {peak / 1024:>8.1f} {retained:>7.0f} {detail}")
+
+    print()
+    if args.update:
+        if baselines and args.intent:
+            # Keep the intents that were not re-measured
+            merged = dict(baselines['intents'])
+            merged.update(results)
+            results = merged
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'intents': results},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baselines written to {BASELINE_PATH}')
+        return 0
+
+    if baselines is None:
+        print('No baselines yet; run with --update to record them')
+        return 0
+    for failure in failures:
+        print(f'FAIL  {failure}')
+    if not failures:
+        print(f'PASS  no intent regressed by more than {args.threshold:.0%}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
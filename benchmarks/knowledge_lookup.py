@@ -0,0 +1,93 @@
+"""
+Knowledge index benchmark: local lookup latency vs index size
+
+Loads synthetic abstracts into a throwaway database with the same loader as
+knowledge_index.py, then times exact-title hits, full-text title hits and
+misses at each size. Usage:
+
+    python -m benchmarks.knowledge_lookup [--sizes 10000,100000] [--queries 2000]
+"""
+
+import os
+import sys
+import tempfile
+
+# The database path is read at import time
+_directory = tempfile.mkdtemp(prefix='darek-knowledge-')
+os.environ['DAREK_DB_PATH'] = os.path.join(_directory, 'knowledge.db')
+
+import argparse
+import json
+import random
+import string
+import time
+
+import db
+import knowledge_index
+from init_db import create_database
+
+
+def synthetic_articles(count, vocabulary=20000, seed=0):
+    """count articles with one-to-four word titles drawn from a vocabulary"""
+    rng = random.Random(seed)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+             for _ in range(vocabulary)]
+    for i in range(count):
+        title = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 4))).title() + f' {i}'
+        abstract = ' '.join(rng.choice(words) for _ in range(rng.randint(30, 80))).capitalize() + '.'
+        yield {'title': title, 'abstract': abstract, 'url': f'https://example.com/wiki/{i}'}
+
+
+def timings_ms(queries):
+    samples = []
+    hits = 0
+    for query in queries:
+        started = time.perf_counter()
+        hits += knowledge_index.lookup(query) is not None
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)], hits / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    create_database()
+    loaded = 0
+    rng = random.Random(1)
+    print(f"{'articles':>9} {'load s':>7} {'kind':<8} {'p50 ms':>7} {'p99 ms':>7} {'hit rate':>9}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        articles = list(synthetic_articles(size))
+        dump = os.path.join(_directory, 'abstracts.jsonl')
+        with open(dump, 'w') as f:
+            for article in articles[loaded:]:
+                f.write(json.dumps(article) + '\n')
+        started = time.perf_counter()
+        knowledge_index.load(dump)
+        load_s = time.perf_counter() - started
+        loaded = size
+
+        sample = rng.sample(articles, min(args.queries, len(articles)))
+        kinds = {
+            'exact': [article['title'] for article in sample],
+            # Title words without the unique suffix, so several articles compete on BM25
+            'fulltext': [article['title'].rsplit(' ', 1)[0] for article in sample],
+            'miss': [f'zz{i} unknown topic' for i in range(len(sample))],
+        }
+        for kind, queries in kinds.items():
+            p50, p99, hit_rate = timings_ms(queries)
+            print(f"{size:>9} {load_s:>7.1f} {kind:<8} {p50:>7.2f} {p99:>7.2f} {hit_rate:>9.0%}")
+
+    conn = db.get_connection()
+    count = conn.execute('SELECT COUNT(*) FROM article').fetchone()[0]
+    conn.close()
+    print()
+    print(f"{count} articles, database {os.path.getsize(os.environ['DAREK_DB_PATH']) / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
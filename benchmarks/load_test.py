@@ -0,0 +1,323 @@
+"""
+End-to-end load test: synthetic users against the running Flask app
+
+Starts the stub upstream and an app server in its own process, pointed at the
+stub and at a throwaway database, registers and logs in synthetic users, then
+replays a mix of /chat, /dashboard, /weather and /news requests at each
+concurrency level in turn. Each level reports throughput, latency percentiles,
+server errors and "database is locked" errors, both from response bodies and
+from the server's log and output.
+
+Results are written as JSON to benchmarks/results/ and can be compared with an
+earlier run, to see whether a deployment change moved the saturation point:
+
+    python -m benchmarks.load_test [--concurrency 1,4,16,64] [--duration 10]
+        [--latency-ms 50] [--error-rate 0.01] [--compare benchmarks/results/old.json]
+
+The app is served by werkzeug's threaded server unless --server-cmd gives
+another command ({port} is filled in), e.g.
+
+    --server-cmd "gunicorn -c gunicorn.conf.py -b 127.0.0.1:{port} app:app"
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.corpus import COMMANDS
+from benchmarks.stub_upstream import StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# Share of requests per route in the replayed traffic
+MIX = (('chat', 70), ('dashboard', 10), ('weather', 10), ('news', 10))
+
+# Intents that would reach real services or a desktop the stub cannot stand in for
+SKIPPED_INTENTS = frozenset(['wikipedia', 'play'])
+
+CITIES = ('London', 'Paris', 'Tokyo', 'New York', 'Berlin', 'Madrid', 'Rome', 'Lisbon',
+          'Sydney', 'Toronto', 'Mumbai', 'Cairo', 'Lagos', 'Lima', 'Seoul', 'Oslo')
+
+LOCKED = 'database is locked'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(port):
+    """Run the app on werkzeug's threaded server (the default --server-cmd)"""
+    from werkzeug.serving import make_server
+
+    from app import app
+    from init_db import create_database
+
+    create_database()
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def start_server(command, port, env, output):
+    if command:
+        args = shlex.split(command.format(port=port))
+    else:
+        args = [sys.executable, '-m', 'benchmarks.load_test', '--serve', str(port)]
+    process = subprocess.Popen(args, cwd=ROOT, env=env, stdout=output, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with status {process.returncode}')
+        try:
+            requests.get(f'http://127.0.0.1:{port}/login', timeout=1)
+            return process
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('Server did not start within 30 s')
+
+
+def log_in(base_url, index):
+    """A session logged in as synthetic user number index, registering it first"""
+    session = requests.Session()
+    email = f'load-{index}@example.com'
+    session.post(f'{base_url}/register', allow_redirects=False,
+                 data={'username': f'load-{index}', 'email': email, 'password': 'load-test-password'})
+    response = session.post(f'{base_url}/login', allow_redirects=False,
+                            data={'email': email, 'password': 'load-test-password'})
+    if response.status_code != 302:
+        raise RuntimeError(f'Login failed for {email}: HTTP {response.status_code}')
+    return session
+
+
+def pick_request(rng, commands):
+    """(route name, method, path, keyword arguments) for one request of the mix"""
+    route = rng.choices([name for name, _ in MIX], weights=[weight for _, weight in MIX])[0]
+    if route == 'chat':
+        return route, 'POST', '/chat', {'json': {'message': rng.choice(commands)}}
+    if route == 'weather':
+        return route, 'GET', '/weather', {'params': {'city': rng.choice(CITIES)}}
+    return route, 'GET', '/' + route, {}
+
+
+def run_level(base_url, sessions, concurrency, duration, commands, seed):
+    """Closed-loop run: concurrency workers each send back-to-back requests"""
+    samples = []
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        session = sessions[index % len(sessions)]
+        rng = random.Random(seed + index)
+        while time.monotonic() < deadline:
+            route, method, path, kwargs = pick_request(rng, commands)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=30, allow_redirects=False, **kwargs)
+                status, body = response.status_code, response.text
+            except requests.exceptions.RequestException:
+                status, body = 0, ''
+            samples.append((route, status, time.perf_counter() - started, LOCKED in body))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for _, _, latency, _ in samples)
+    summary = {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'server_errors': sum(1 for _, status, _, _ in samples if status >= 500),
+        'failed_requests': sum(1 for _, status, _, _ in samples if status == 0),
+        'locked_responses': sum(1 for _, _, _, locked in samples if locked),
+        'routes': {},
+    }
+    for route, _ in MIX:
+        route_latencies = sorted(latency for name, _, latency, _ in samples if name == route)
+        summary['routes'][route] = {
+            'requests': len(route_latencies),
+            'p50_ms': round(percentile(route_latencies, 0.50) * 1000, 2),
+            'p99_ms': round(percentile(route_latencies, 0.99) * 1000, 2),
+            'statuses': {},
+        }
+    for route, status, _, _ in samples:
+        statuses = summary['routes'][route]['statuses']
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return summary
+
+
+def count_locked(paths):
+    total = 0
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                total += f.read().count(LOCKED)
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def saturation(levels):
+    """Concurrency level with the highest throughput"""
+    best = max(levels, key=lambda level: level['throughput_rps'])
+    return best['concurrency']
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_level(level):
+    print(f"{level['concurrency']:>5} {level['throughput_rps']:>8.1f} {level['p50_ms']:>8.1f} "
+          f"{level['p95_ms']:>8.1f} {level['p99_ms']:>8.1f} {level['server_errors']:>5} "
+          f"{level['failed_requests']:>6} {level['locked_responses'] + level['locked_in_logs']:>6}")
+
+
+def compare(old, new):
+    print(f"Compared with {old['label']} ({old['started_at']}):")
+    print(f"{'conc':>5} {'req/s':>16} {'p99 ms':>18}")
+    previous = {level['concurrency']: level for level in old['levels']}
+    for level in new['levels']:
+        before = previous.get(level['concurrency'])
+        if before is None:
+            continue
+        print(f"{level['concurrency']:>5} {before['throughput_rps']:>7.1f} -> {level['throughput_rps']:<7.1f}"
+              f"{before['p99_ms']:>8.1f} -> {level['p99_ms']:<8.1f}")
+    print(f"saturation: {old['saturation']} -> {new['saturation']} concurrent users")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    parser.add_argument('--concurrency', default='1,4,16,64')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per concurrency level')
+    parser.add_argument('--users', type=int, help='synthetic users (default: highest concurrency)')
+    parser.add_argument('--latency-ms', type=float, default=50, help='stub upstream latency')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='stub upstream error rate')
+    parser.add_argument('--server-cmd', help='command that serves the app on {port}')
+    parser.add_argument('--url', help='load an already running server instead of starting one')
+    parser.add_argument('--label', default='', help='name stored with the results')
+    parser.add_argument('--compare', help='earlier results file to compare with')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    levels_wanted = [int(level) for level in args.concurrency.split(',')]
+    commands = [text for label, text in COMMANDS if label not in SKIPPED_INTENTS]
+
+    stub = StubServer(latency_ms=args.latency_ms, error_rate=args.error_rate).start()
+    directory = tempfile.mkdtemp(prefix='darek-load-')
+    log_paths = []
+    process = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        print('Point the server at the stub upstream with:')
+        for name, url in stub.urls().items():
+            print(f'    {name}={url}')
+    else:
+        port = free_port()
+        env = dict(os.environ, **stub.urls())
+        env.update(DAREK_DB_PATH=os.path.join(directory, 'load.db'),
+                   DAREK_LOG_FILE=os.path.join(directory, 'darek.jsonl'),
+                   DAREK_METRICS_DIR=os.path.join(directory, 'metrics'),
+                   DAREK_PHRASEBOOK_INDEX=os.path.join(directory, 'translations.idx'),
+                   DAREK_SHARED_CACHE_PATH=os.path.join(directory, 'shared_cache.db'),
+                   WEATHER_API_KEY='load-test', NEWS_API_KEY='load-test',
+                   SECRET_KEY='load-test-secret')
+        output_path = os.path.join(directory, 'server.out')
+        log_paths = [env['DAREK_LOG_FILE'], output_path]
+        output = open(output_path, 'w')
+        process = start_server(args.server_cmd, port, env, output)
+        base_url = f'http://127.0.0.1:{port}'
+
+    sessions = []
+    try:
+        users = args.users or max(levels_wanted)
+        sessions = [log_in(base_url, i) for i in range(users)]
+        print(f'{users} users logged in; stub upstream latency {args.latency_ms:g} ms, '
+              f'error rate {args.error_rate:.1%}')
+        # Warm caches, lazy imports and connection pools before measuring
+        run_level(base_url, sessions, min(4, users), 1.0, commands, args.seed)
+
+        levels = []
+        print(f"{'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'5xx':>5} {'failed':>6} {'locked':>6}")
+        for concurrency in levels_wanted:
+            locked_before = count_locked(log_paths)
+            samples, elapsed = run_level(base_url, sessions, concurrency, args.duration, commands, args.seed)
+            level = {'concurrency': concurrency, **summarize(samples, elapsed),
+                     'locked_in_logs': count_locked(log_paths) - locked_before}
+            levels.append(level)
+            print_level(level)
+    finally:
+        # Gunicorn waits out open keep-alive connections on a graceful stop
+        for session in sessions:
+            session.close()
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        stub.shutdown()
+
+    result = {
+        'label': args.label or args.server_cmd or 'werkzeug threaded',
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'settings': {'duration': args.duration, 'users': users, 'latency_ms': args.latency_ms,
+                     'error_rate': args.error_rate, 'server_cmd': args.server_cmd, 'url': args.url,
+                     'mix': dict(MIX), 'seed': args.seed},
+        'levels': levels,
+        'saturation': saturation(levels),
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"load_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+        f.write('\n')
+    print()
+    print(f"saturation: {result['saturation']} concurrent users")
+    print(f'Results written to {path}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
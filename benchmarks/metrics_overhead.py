@@ -0,0 +1,84 @@
+"""
+Metrics overhead: what instrumentation adds to each command
+
+Times one metrics.timed() block on its own, then runs commands that need no
+network or database through Darek.process_command with metrics on and off.
+Fails if the difference per command is over budget. Usage:
+
+    python -m benchmarks.metrics_overhead [--budget-us 5] [--number 20000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import metrics
+from darek_core import Darek
+
+BUDGET_US = float(os.getenv('DAREK_METRICS_BUDGET_US', '5'))
+
+# Answered in process: one match and one intent sample each
+COMMANDS = [
+    'what time is it',
+    'calculate 12 * (3 + 4)',
+    'hello there',
+    'thank you',
+    'what can you do',
+]
+
+
+def check(name, condition, detail=''):
+    print(f"{'PASS' if condition else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+    return condition
+
+
+def best_per_call(function, number, repeat=5):
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-us', type=float, default=BUDGET_US)
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    darek = Darek()
+
+    def empty_block():
+        with metrics.timed('intent', 'benchmark'):
+            pass
+
+    def run_commands():
+        for command in COMMANDS:
+            darek.process_command(command, 1)
+
+    block = best_per_call(empty_block, args.number)
+    observe = best_per_call(lambda: metrics.observe('intent', 'benchmark-observe', 0.001), args.number)
+    number = max(1, args.number // len(COMMANDS))
+    metrics.registry.enabled = True
+    enabled = best_per_call(run_commands, number) / len(COMMANDS)
+    metrics.registry.enabled = False
+    disabled = best_per_call(run_commands, number) / len(COMMANDS)
+    metrics.registry.enabled = True
+    overhead = enabled - disabled
+
+    print(f"{'timed() block':<28} {block * 1e9:>9.0f} ns")
+    print(f"{'observe()':<28} {observe * 1e9:>9.0f} ns")
+    print(f"{'command, metrics off':<28} {disabled * 1e6:>9.2f} us")
+    print(f"{'command, metrics on':<28} {enabled * 1e6:>9.2f} us")
+    print()
+    print(f"{'metric':<10} {'label':<18} {'count':>8} {'p50 us':>8} {'p99 us':>8}")
+    for family, labels in metrics.summary().items():
+        for label, figures in labels.items():
+            print(f"{family:<10} {label:<18} {figures['count']:>8} "
+                  f"{figures['p50_ms'] * 1000:>8.1f} {figures['p99_ms'] * 1000:>8.1f}")
+    print()
+
+    result = check(f'instrumentation under {args.budget_us:g} us per command', overhead * 1e6 <= args.budget_us,
+                   f'{overhead * 1e6:.2f} us')
+    return 0 if result else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
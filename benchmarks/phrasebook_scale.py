@@ -0,0 +1,79 @@
+"""
+Phrasebook scaling benchmark: translate cost and memory vs dictionary size
+
+Pads the shipped translations.json with synthetic phrases and reports compile
+time, index size, memory a worker allocates to map the index and the cost of
+translating the same sentence at each size. Usage:
+
+    python -m benchmarks.phrasebook_scale [--sizes 0,1000,10000,50000]
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from phrasebook import Phrasebook, TRANSLATIONS_PATH
+
+SENTENCE = 'good morning, how are you? thank you and good night'
+
+
+def synthetic_phrases(languages, count, vocabulary=5000, seed=0):
+    """count rows of one-to-three word phrases drawn from a per-language vocabulary"""
+    rng = random.Random(seed)
+    words = {name: [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 10)))
+                    for _ in range(vocabulary)]
+             for name in languages}
+    return [{name: ' '.join(rng.choice(words[name]) for _ in range(rng.randint(1, 3))) for name in languages}
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='0,1000,10000,50000')
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(TRANSLATIONS_PATH, encoding='utf-8') as f:
+        data = json.load(f)
+
+    print(f"{'phrases':>8} {'nodes':>9} {'compile ms':>11} {'index MB':>9} {'load ms':>8} "
+          f"{'worker KB':>10} {'translate us':>13}")
+    directory = tempfile.mkdtemp()
+    for extra in (int(size) for size in args.sizes.split(',')):
+        data['phrases'] = data['phrases'][:12] + synthetic_phrases(data['languages'], extra)
+        source = os.path.join(directory, 'translations.json')
+        index = os.path.join(directory, 'translations.idx')
+        with open(source, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        if os.path.exists(index):
+            os.remove(index)
+
+        started = time.perf_counter()
+        Phrasebook.load(source, index)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        # What every other worker pays: map the existing index
+        tracemalloc.start()
+        started = time.perf_counter()
+        book = Phrasebook.load(source, index)
+        load_ms = (time.perf_counter() - started) * 1000
+        worker_kb = tracemalloc.get_traced_memory()[0] / 1e3
+        tracemalloc.stop()
+
+        per_call = min(timeit.repeat(lambda: book.translate(SENTENCE, 'spanish'),
+                                     number=args.number, repeat=5)) / args.number
+        print(f"{book.phrase_count:>8} {book.node_count:>9} {compile_ms:>11.1f} "
+              f"{os.path.getsize(index) / 1e6:>9.2f} {load_ms:>8.1f} {worker_kb:>10.1f} {per_call * 1e6:>13.1f}")
+
+    print()
+    print(f"{SENTENCE!r} -> {book.translate(SENTENCE, 'spanish')[0]!r}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Retention benchmark: rollup and prune cost, lock impact, /stats latency
+
+Fills a throwaway database with a year of command history, then runs the
+rollup and prune jobs while a second thread keeps inserting history rows the
+way the history writer does, and reports how long those inserts waited on the
+jobs' write locks. Afterwards it times retention.usage() (what /stats serves) and shows
+the database size before and after. Fails if the p99 concurrent insert took
+longer than the budget; the maximum is reported too, but SQLite's busy handler
+sleeps in coarse steps, so single waits are noisy. Usage:
+
+    python -m benchmarks.retention [--rows 500000] [--users 100] [--budget-ms 50]
+"""
+
+import os
+import sys
+import tempfile
+
+# The database path is read at import time
+_directory = tempfile.mkdtemp(prefix='darek-retention-')
+os.environ['DAREK_DB_PATH'] = os.path.join(_directory, 'retention.db')
+
+import argparse
+import random
+import threading
+import time
+
+import db
+import retention
+from init_db import create_database
+
+BUDGET_MS = float(os.getenv('DAREK_RETENTION_BUDGET_MS', '50'))
+INTENTS = ['weather', 'news', 'todo', 'shopping', 'time', 'reminder', 'calculate', 'fallback']
+
+
+def fill(rows, users, days=365, seed=0):
+    rng = random.Random(seed)
+    conn = db.get_connection()
+    batch = []
+    for i in range(rows):
+        # Rows arrive in time order, as the history writer inserts them
+        age = days * (1 - i / rows)
+        batch.append((f'command number {i}', rng.randint(1, users), rng.random() > 0.02,
+                      rng.choice(INTENTS), f'-{age * 86400:.0f} seconds'))
+        if len(batch) == 10000:
+            conn.executemany("INSERT INTO command_history (command, user_id, success, intent, timestamp) "
+                             "VALUES (?, ?, ?, ?, datetime('now', ?))", batch)
+            conn.commit()
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO command_history (command, user_id, success, intent, timestamp) "
+                         "VALUES (?, ?, ?, ?, datetime('now', ?))", batch)
+        conn.commit()
+    conn.close()
+
+
+def database_mb():
+    path = os.environ['DAREK_DB_PATH']
+    conn = db.get_connection()
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        pages, free = (conn.execute(f'PRAGMA {name}').fetchone()[0] for name in ('page_count', 'freelist_count'))
+    finally:
+        conn.close()
+    return os.path.getsize(path) / 1e6, (pages - free) / pages * os.path.getsize(path) / 1e6
+
+
+class ConcurrentWriter(threading.Thread):
+    """Inserts a history row every few ms and records how long each insert took"""
+
+    def __init__(self, users):
+        super().__init__(daemon=True)
+        self.users = users
+        self.waits = []
+        self.stopping = threading.Event()
+
+    def run(self):
+        conn = db.get_connection()
+        try:
+            while not self.stopping.wait(0.005):
+                started = time.perf_counter()
+                conn.execute('INSERT INTO command_history (command, user_id, success, intent) VALUES (?, ?, ?, ?)',
+                             ('concurrent command', random.randint(1, self.users), True, 'time'))
+                conn.commit()
+                self.waits.append((time.perf_counter() - started) * 1000)
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--days', type=int, default=90, help='retention period to prune to')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS)
+    args = parser.parse_args()
+
+    create_database()
+    started = time.perf_counter()
+    fill(args.rows, args.users)
+    print(f"{args.rows} history rows written in {time.perf_counter() - started:.1f} s")
+    size, used = database_mb()
+    print(f"database {size:.1f} MB")
+    print()
+
+    writer = ConcurrentWriter(args.users)
+    writer.start()
+    conn = db.get_connection()
+    try:
+        for job, run in (('rollup', lambda: retention.rollup(conn)),
+                         ('prune', lambda: retention.prune(conn, days=args.days, archive_dir=''))):
+            started = time.perf_counter()
+            rows = run()
+            elapsed = time.perf_counter() - started
+            print(f"{job:<7} {rows:>8} rows in {elapsed:>5.1f} s ({rows / elapsed:,.0f} rows/s)")
+    finally:
+        conn.close()
+        writer.stopping.set()
+        writer.join()
+    waits = sorted(writer.waits)
+    p99 = waits[int(len(waits) * 0.99)]
+    print(f"concurrent inserts: {len(waits)}, p50 {waits[len(waits) // 2]:.2f} ms, "
+          f"p99 {p99:.2f} ms, max {waits[-1]:.2f} ms")
+
+    samples = []
+    for user_id in range(1, args.users + 1):
+        started = time.perf_counter()
+        retention.usage(user_id, 30)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    print(f"usage(): p50 {samples[len(samples) // 2]:.2f} ms, max {samples[-1]:.2f} ms")
+
+    conn = db.get_connection()
+    rollup_rows = conn.execute('SELECT COUNT(*) FROM command_usage_daily').fetchone()[0]
+    conn.close()
+    size, used = database_mb()
+    # Freed pages are reused by new rows rather than returned to the filesystem
+    print(f"{rollup_rows} rollup rows; database {size:.1f} MB, {used:.1f} MB in use after pruning")
+    print()
+
+    ok = p99 <= args.budget_ms
+    print(f"{'PASS' if ok else 'FAIL'}  p99 concurrent insert {p99:.1f} ms (budget {args.budget_ms:g} ms)")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
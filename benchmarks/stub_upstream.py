@@ -0,0 +1,152 @@
+"""
+Local stand-in for the OpenWeatherMap, News API and DuckDuckGo endpoints
+
+Serves canned JSON with configurable latency and error rate so the HTTP client
+and the load harness can run without touching the real services. Point the app
+at it with:
+
+    WEATHER_API_URL=http://127.0.0.1:8765/data/2.5/weather
+    NEWS_API_URL=http://127.0.0.1:8765/v2/top-headlines
+    SEARCH_API_URL=http://127.0.0.1:8765/search
+
+    python -m benchmarks.stub_upstream [--port 8765] [--latency-ms 50] [--error-rate 0.01]
+"""
+
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def weather_payload(query):
+    city = query.get('q', ['London'])[0]
+    if city.lower() == 'atlantis':
+        return 404, {'cod': '404', 'message': 'city not found'}
+    return 200, {
+        'name': city.title(),
+        'weather': [{'description': 'scattered clouds'}],
+        'main': {'temp': 18.4, 'feels_like': 17.9, 'humidity': 62},
+        'wind': {'speed': 4.1},
+    }
+
+
+def news_payload(query):
+    return 200, {
+        'status': 'ok',
+        'articles': [
+            {'title': f'Stub headline {i}', 'description': f'Stub story number {i}',
+             'url': f'https://example.com/news/{i}'}
+            for i in range(1, 6)
+        ],
+    }
+
+
+def search_payload(query):
+    term = query.get('q', [''])[0]
+    return 200, {
+        'Abstract': f'{term.title()} is a stub abstract served by the local upstream '
+                    f'so benchmarks never leave the machine.',
+        'AbstractURL': 'https://en.wikipedia.org/wiki/Stub',
+        'RelatedTopics': [],
+    }
+
+
+ROUTES = {
+    '/data/2.5/weather': weather_payload,
+    '/v2/top-headlines': news_payload,
+    '/search': search_payload,
+    '/': search_payload,
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this, Nagle plus
+        # delayed ACKs add ~40 ms to every keep-alive response
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        route = ROUTES.get(url.path)
+        if route is None:
+            status, payload = 404, {'error': 'unknown path'}
+        elif random.random() < self.server.error_rate:
+            status, payload = 503, {'error': 'injected failure'}
+        else:
+            status, payload = route(parse_qs(url.query))
+
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency_ms=0, error_rate=0.0):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass  # Clients that time out hang up mid-response; that is expected here
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def urls(self):
+        """Environment overrides that point the app at this server"""
+        return {
+            'WEATHER_API_URL': self.base_url + '/data/2.5/weather',
+            'NEWS_API_URL': self.base_url + '/v2/top-headlines',
+            'SEARCH_API_URL': self.base_url + '/search',
+        }
+
+    def start(self):
+        """Serve from a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, name='stub-upstream', daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stub for the weather, news and search APIs')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubServer(args.port, args.latency_ms, args.error_rate)
+    for name, url in server.urls().items():
+        print(f'{name}={url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Personal search benchmark: /search latency as a user's history grows
+
+Fills a throwaway database through the real tables (so the search triggers and
+the history writer's index step do the indexing) with one heavy user alongside
+many lighter ones, then times first pages, next pages, narrow and common-word
+queries and misses for the heavy user. Fails if any p99 is over budget. Usage:
+
+    python -m benchmarks.user_search [--rows 50000] [--users 50] [--budget-ms 10]
+"""
+
+import os
+import sys
+import tempfile
+
+# The database path is read at import time
+_directory = tempfile.mkdtemp(prefix='darek-search-')
+os.environ['DAREK_DB_PATH'] = os.path.join(_directory, 'search.db')
+
+import argparse
+import random
+import string
+import time
+
+import db
+import user_search
+from init_db import create_database
+
+BUDGET_MS = float(os.getenv('DAREK_SEARCH_BUDGET_MS', '10'))
+HEAVY_USER = 1
+
+# Common words recur in a large share of rows, like "weather" or "remind" in a real history
+COMMON = ['weather', 'remind', 'todo', 'shopping', 'note', 'timer', 'news', 'call', 'buy', 'meeting']
+
+
+def fill(conn, user_id, rows, words, rng):
+    """rows notes, to-dos, shopping items and commands for user_id, in that proportion"""
+    def text(count):
+        return ' '.join(rng.choice(COMMON) if rng.random() < 0.3 else rng.choice(words) for _ in range(count))
+
+    notes = rows // 10
+    todos = rows // 10
+    shopping = rows // 10
+    conn.executemany('INSERT INTO note (content, user_id) VALUES (?, ?)',
+                     [(text(rng.randint(8, 40)), user_id) for _ in range(notes)])
+    conn.executemany('INSERT INTO todo_item (task, user_id) VALUES (?, ?)',
+                     [(text(rng.randint(3, 8)), user_id) for _ in range(todos)])
+    conn.executemany('INSERT INTO shopping_item (item_name, user_id) VALUES (?, ?)',
+                     [(text(rng.randint(1, 3)), user_id) for _ in range(shopping)])
+    conn.executemany('INSERT INTO command_history (command, user_id) VALUES (?, ?)',
+                     [(text(rng.randint(3, 10)), user_id) for _ in range(rows - notes - todos - shopping)])
+    user_search.index(conn)
+    conn.commit()
+
+
+def timings_ms(calls):
+    samples = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000, help='rows for the heavy user')
+    parser.add_argument('--users', type=int, default=50, help='other users, with a tenth as many rows each')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))) for _ in range(5000)]
+    create_database()
+    conn = db.get_connection()
+    started = time.perf_counter()
+    fill(conn, HEAVY_USER, args.rows, words, rng)
+    for user_id in range(2, args.users + 2):
+        fill(conn, user_id, args.rows // 10, words, rng)
+    conn.execute("INSERT INTO search_fts (search_fts) VALUES ('optimize')")
+    conn.commit()
+    documents = conn.execute('SELECT COUNT(*) FROM search_document').fetchone()[0]
+    conn.close()
+    print(f"{documents} documents indexed in {time.perf_counter() - started:.1f} s")
+    print()
+
+    def first_page(query, kinds=None):
+        return lambda: user_search.search(HEAVY_USER, query, kinds)
+
+    def next_page(query):
+        _, cursor = user_search.search(HEAVY_USER, query)
+        return lambda: user_search.search(HEAVY_USER, query, before=cursor)
+
+    sample = rng.sample(words, args.queries)
+    cases = {
+        'rare word': [first_page(word) for word in sample],
+        'two words': [first_page(f'{word} {rng.choice(COMMON)}') for word in sample],
+        'prefix': [first_page(word[:4] + '*') for word in sample],
+        'common word': [first_page(rng.choice(COMMON)) for _ in sample],
+        'one kind': [first_page(rng.choice(COMMON), ['note']) for _ in sample],
+        'next page': [next_page(rng.choice(COMMON)) for _ in sample[:50]] * (args.queries // 50),
+        'miss': [first_page(f'zz{i}qq') for i in range(args.queries)],
+    }
+    failures = []
+    print(f"{'query':<12} {'p50 ms':>7} {'p99 ms':>7}")
+    for name, calls in cases.items():
+        p50, p99 = timings_ms(calls)
+        print(f"{name:<12} {p50:>7.2f} {p99:>7.2f}")
+        if p99 > args.budget_ms:
+            failures.append(f'{name}: p99 {p99:.2f} ms')
+    print()
+    for failure in failures:
+        print(f'FAIL  {failure}')
+    if not failures:
+        print(f'PASS  every p99 under {args.budget_ms:g} ms with {args.rows} rows for one user')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
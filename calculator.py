@@ -0,0 +1,213 @@
+"""
+Arithmetic evaluator for the calculate intent
+
+Expressions are rewritten from everyday phrasing ("15% of 200", "7 times 6",
+"2 to the power of 10"), parsed once with ast and evaluated by walking the
+tree, so only numbers and arithmetic operators are ever run. The input length,
+node count, operand size, exponent and size of every intermediate result are
+capped, which keeps any calculation in the microsecond range whatever the user
+types. Results are memoized by normalized expression.
+
+Amounts may carry one unit ("5 km + 3 km", "20 dollars times 3"): split_unit
+strips it and the result is labelled with it. Mixing units is an error, since
+nothing here converts between them.
+"""
+
+import ast
+import math
+import operator
+import re
+from functools import lru_cache
+
+# Longest expression, in characters, accepted before and after normalization
+MAX_LENGTH = 200
+
+# Nodes allowed in the parsed expression tree
+MAX_NODES = 64
+
+# Largest literal operand and largest absolute exponent
+MAX_OPERAND = 10 ** 15
+MAX_EXPONENT = 64
+
+# Decimal digits allowed in any intermediate result
+MAX_DIGITS = 100
+MAX_RESULT = 10 ** MAX_DIGITS
+
+# Words stripped before the expression itself
+COMMAND_WORDS = re.compile(r"\b(?:calculate|compute|math|what\s+is|what's|how\s+much\s+is|please)\b|[:?=]")
+
+WORD_OPERATORS = [
+    (re.compile(r'(?<=\d),(?=\d{3}\b)'), ''),
+    (re.compile(r'[$€£]'), ''),
+    (re.compile(r'\b(?:to\s+the\s+power\s+of|raised\s+to)\b|\^'), '**'),
+    (re.compile(r'\bsquared\b'), '**2'),
+    (re.compile(r'\bcubed\b'), '**3'),
+    (re.compile(r'(\d+(?:\.\d+)?)\s*(?:%|percent)\s+of\b'), r'(\1/100)*'),
+    # "200 + 10%" adds ten percent of 200, as on a pocket calculator
+    (re.compile(r'(\d+(?:\.\d+)?)\s*([+-])\s*(\d+(?:\.\d+)?)\s*(?:%|percent)(?!\s*[\d(.])'), r'\1*(1\2\3/100)'),
+    # A trailing % that is not followed by an operand is a percentage, not modulo
+    (re.compile(r'(\d+(?:\.\d+)?)\s*(?:%|percent)(?!\s*[\d(.])'), r'(\1/100)'),
+    (re.compile(r'\bplus\b'), '+'),
+    (re.compile(r'\bminus\b'), '-'),
+    (re.compile(r'\b(?:times|multiplied\s+by)\b|(?<=\d)\s*x\s*(?=[\d(])'), '*'),
+    (re.compile(r'\b(?:divided\s+by|over)\b'), '/'),
+    (re.compile(r'\b(?:mod|modulo)\b'), '%'),
+]
+
+# Unit -> the words and symbols that name it
+UNITS = {
+    'km': ('km', 'kilometer', 'kilometers', 'kilometre', 'kilometres'),
+    'm': ('m', 'meter', 'meters', 'metre', 'metres'),
+    'cm': ('cm', 'centimeter', 'centimeters', 'centimetre', 'centimetres'),
+    'miles': ('mi', 'mile', 'miles'),
+    'kg': ('kg', 'kilo', 'kilos', 'kilogram', 'kilograms'),
+    'g': ('g', 'gram', 'grams'),
+    'l': ('l', 'liter', 'liters', 'litre', 'litres'),
+    'hours': ('hour', 'hours', 'hr', 'hrs'),
+    'minutes': ('minute', 'minutes', 'min', 'mins'),
+    'dollars': ('$', 'dollar', 'dollars', 'usd'),
+    'euros': ('€', 'euro', 'euros', 'eur'),
+    'pounds': ('£', 'pound', 'pounds', 'gbp'),
+}
+
+_UNIT_NAMES = {name: unit for unit, names in UNITS.items() for name in names}
+_UNIT_WORDS = '|'.join(sorted((re.escape(name) for name in _UNIT_NAMES if name.isalpha()), key=len, reverse=True))
+# A unit word right after a number, or a currency symbol right before one
+_UNIT = re.compile(rf'(?<=[\d.])\s*({_UNIT_WORDS})\b|([$€£])\s*(?=[\d.])')
+_PRODUCT = re.compile(r'[*/%^]|\b(?:x|times|multiplied|divided|over|mod|modulo|power|raised|squared|cubed|percent)\b')
+
+ALLOWED_CHARACTERS = re.compile(r'[\d.+\-*/%()\s]+')
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+class CalculationError(ValueError):
+    """Raised for input that is not a supported arithmetic expression"""
+
+
+class CalculationTooLarge(CalculationError):
+    """Raised when an expression exceeds one of the size limits"""
+
+
+class CalculationUnitError(CalculationError):
+    """Raised for amounts in different units, or units multiplied together"""
+
+
+def extract_expression(command):
+    """Strip the command words from a calculate request"""
+    return ' '.join(COMMAND_WORDS.sub(' ', command.lower()).split())
+
+
+@lru_cache(maxsize=1024)
+def split_unit(expression):
+    """(expression without its units, the unit or None); raises CalculationUnitError"""
+    units = [_UNIT_NAMES[word or symbol] for word, symbol in _UNIT.findall(expression)]
+    if not units:
+        return expression, None
+    if len(set(units)) > 1:
+        raise CalculationUnitError('Amounts are in different units')
+    stripped = ' '.join(_UNIT.sub(' ', expression).split())
+    # km * km is not km; only a sum of amounts keeps their unit
+    if len(units) > 1 and _PRODUCT.search(stripped):
+        raise CalculationUnitError('Amounts with units can only be added and subtracted')
+    return stripped, units[0]
+
+
+def normalize(expression):
+    """Rewrite word operators and percentages as plain arithmetic"""
+    expression = expression.lower()
+    for pattern, replacement in WORD_OPERATORS:
+        expression = pattern.sub(replacement, expression)
+    return ' '.join(expression.split())
+
+
+def evaluate(expression):
+    """Evaluate an arithmetic expression; raises CalculationError"""
+    if len(expression) > MAX_LENGTH:
+        raise CalculationTooLarge('Expression is too long')
+    return _evaluate_normalized(normalize(expression))
+
+
+@lru_cache(maxsize=1024)
+def _evaluate_normalized(expression):
+    if not expression:
+        raise CalculationError('Empty expression')
+    if len(expression) > MAX_LENGTH:
+        raise CalculationTooLarge('Expression is too long')
+    if not ALLOWED_CHARACTERS.fullmatch(expression):
+        raise CalculationError('Unsupported characters in expression')
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        raise CalculationError('Malformed expression')
+    if sum(1 for _ in ast.walk(tree)) > MAX_NODES:
+        raise CalculationTooLarge('Expression has too many terms')
+    return _eval(tree.body)
+
+
+def _eval(node):
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise CalculationError('Unsupported constant')
+        if abs(value) > MAX_OPERAND:
+            raise CalculationTooLarge('Operand is too large')
+        return value
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        return UNARY_OPERATORS[type(node.op)](_eval(node.operand))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        left = _eval(node.left)
+        right = _eval(node.right)
+        if isinstance(node.op, ast.Pow):
+            _check_power(left, right)
+        try:
+            result = BINARY_OPERATORS[type(node.op)](left, right)
+        except ZeroDivisionError:
+            raise CalculationError('Division by zero')
+        except OverflowError:
+            raise CalculationTooLarge('Result is too large')
+        if isinstance(result, complex):
+            raise CalculationError('Result is not a real number')
+        if isinstance(result, float) and not math.isfinite(result) or abs(result) > MAX_RESULT:
+            raise CalculationTooLarge('Result is too large')
+        return result
+
+    raise CalculationError('Unsupported expression')
+
+
+def _check_power(base, exponent):
+    # Reject before computing: the size of base ** exponent is known up front
+    if abs(exponent) > MAX_EXPONENT:
+        raise CalculationTooLarge('Exponent is too large')
+    if abs(base) > 1 and exponent > 0 and exponent * math.log10(abs(base)) > MAX_DIGITS:
+        raise CalculationTooLarge('Result is too large')
+    if base == 0 and exponent < 0:
+        raise CalculationError('Division by zero')
+
+
+def format_number(value):
+    """Render a result without float noise"""
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < MAX_OPERAND:
+            return str(int(value))
+        return f'{value:.10g}'
+    return str(value)
+
+
+def cache_info():
+    return _evaluate_normalized.cache_info()
@@ -1,511 +1,625 @@
+import contextlib
 import datetime
-import pyjokes
-import pywhatkit
-import wikipedia
+import functools
+import random
+import re
 import requests
+import logging
 import os
-import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import calculator
+import db
+import metrics
+import dashboard
+import knowledge_index
+import upstreams
+import user_search
+from batch_writer import BatchWriter
+from scheduler import scheduler
+from intent_router import Choices, IntentRouter
+
+log = logging.getLogger('darek.core')
+
+# Intents register their trigger phrases here; see Darek._handle_* below
+router = IntentRouter()
+
+# Threads available to I/O-bound intents started from process_command_async
+IO_WORKERS = int(os.getenv('DAREK_IO_WORKERS', '128'))
+
+_io_executor = None
+_io_executor_pid = None
+_io_executor_lock = threading.Lock()
+
+def io_executor():
+    """Bounded thread pool for I/O-bound intents, created once per process"""
+    global _io_executor, _io_executor_pid
+    if _io_executor is None or _io_executor_pid != os.getpid():
+        with _io_executor_lock:
+            if _io_executor is None or _io_executor_pid != os.getpid():
+                _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='darek-io')
+                _io_executor_pid = os.getpid()
+    return _io_executor
+
+# I/O-bound intents of one /chat/batch request that may wait on upstreams at once
+BATCH_CONCURRENCY = int(os.getenv('DAREK_CHAT_BATCH_CONCURRENCY', '8'))
+
+# Unmatched commands are counted per distinct text instead of appended to a file
+unrecognized_writer = BatchWriter(
+    'INSERT INTO unrecognized_command (command) VALUES (?) '
+    'ON CONFLICT (command) DO UPDATE SET count = count + 1, last_seen = CURRENT_TIMESTAMP',
+    name='unrecognized-commands')
+
+# "find my notes about X", "search my shopping list for X": (kind word, query)
+_FIND_MINE = re.compile(r'\b(?:find|search) my (' + '|'.join(map(re.escape, user_search.KIND_WORDS)) + r')\b'
+                        r'(?: list)?\s*(?:(?:about|for|mentioning|containing|with|on)\b)?(.*)')
+
+# Intents whose handlers (and their dependencies) are imported on first use
+router.register('wikipedia', 'intents.knowledge:handle_wikipedia', ('search', 'wikipedia'),
+                priority=40, io_bound=True, stream='intents.knowledge:stream_wikipedia')
+router.register('play', 'intents.media:handle_play', ('play',), priority=50, io_bound=True)
+router.register('translate', 'intents.translate:handle_translate', ('translate',), priority=90, pure=True)
+router.register('joke', 'intents.jokes:handle_joke', ('joke', 'jokes'), priority=120, pure=True)
+
+# Intents loaded at startup by warm_up(); "all" loads every intent
+WARM_INTENTS = [name.strip() for name in os.getenv('DAREK_WARM_INTENTS', '').split(',') if name.strip()]
+
+def warm_up(names=None):
+    """Import the handlers of hot intents now rather than on their first message"""
+    names = WARM_INTENTS if names is None else names
+    return router.load(None if 'all' in names else names)
 
 class Darek:
     def __init__(self):
         pass
 
     def get_db_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect('instance/darek_ai.db')
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get a pooled database connection"""
+        return db.get_connection()
+
+    def _route(self, command):
+        """Normalize a command and pick its intent (None means fallback)"""
+        started = time.perf_counter()
+        command = command.lower().strip()
+        intent = router.match(command)
+        metrics.observe('match', intent.name if intent else 'fallback', time.perf_counter() - started)
+        log.debug('Processing command', extra={'command': command,
+                                                'intent': intent.name if intent else None})
+        return command, intent
+
+    def intent_name(self, command):
+        """Name of the intent that handles command, as recorded in command history"""
+        intent = router.match(command.lower().strip())
+        return intent.name if intent else 'fallback'
 
     def process_command(self, command, user_id=None):
         if not command or not command.strip():
             return "Hello! How can I help you today?"
             
-        command = command.lower().strip()
-        response = ""
+        command, intent = self._route(command)
+        if intent is None:
+            return self._handle_fallback(command, user_id)
+        return intent(self, command, user_id)
 
-        # Debug logging
-        print(f"DEBUG: Processing command: '{command}'")
+    async def process_command_async(self, command, user_id=None):
+        """Async process_command: I/O-bound intents run on the I/O executor
 
-        if 'time' in command:
-            now = datetime.datetime.now().strftime("%I:%M %p")
-            response = f"The current time is {now}."
+        CPU-trivial intents (time, jokes, greetings...) answer inline on the
+        event loop; intents that wait on the network or the database are handed
+        to a bounded thread pool so the loop keeps serving other chats. So is
+        the first call of an intent loaded on first use, which imports its module.
+        """
+        # Only async servers need asyncio; importing it here keeps it out of app startup
+        import asyncio
 
-        elif 'set a reminder' in command or 'remind me' in command:
-            parts = command.split(' ')
-            try:
-                if 'in' in command:
-                    time_index = parts.index('in') + 1
-                    time_value = int(parts[time_index])
-                    time_unit = parts[time_index + 1]
-                    
-                    if 'minute' in time_unit:
-                        reminder_time = datetime.datetime.now() + datetime.timedelta(minutes=time_value)
-                    elif 'hour' in time_unit:
-                        reminder_time = datetime.datetime.now() + datetime.timedelta(hours=time_value)
-                    else:
-                        reminder_time = datetime.datetime.now() + datetime.timedelta(minutes=time_value)
-                    
-                    task = command.replace('set a reminder', '').replace('remind me', '').replace(f'in {time_value} {time_unit}', '').replace('to', '').strip()
-                    
-                    if user_id:
-                        conn = self.get_db_connection()
-                        conn.execute('INSERT INTO reminder (task, remind_at, user_id) VALUES (?, ?, ?)',
-                                   (task, reminder_time, user_id))
-                        conn.commit()
-                        conn.close()
-                    
-                    response = f"🔔 Reminder set: '{task}' in {time_value} {time_unit}."
-                else:
-                    response = "Please specify when to remind you, like 'remind me to call mom in 30 minutes'."
-            except (ValueError, IndexError):
-                response = "Please specify the reminder in the format: 'Set a reminder to [task] in [time] [unit]'."
-
-        elif 'add to my to-do list' in command or ('add' in command and 'todo' in command) or 'todo' in command:
-            # Extract the todo item from various command formats
-            item = ''
-            if 'add to my to-do list' in command:
-                item = command.replace('add to my to-do list', '').strip()
-            elif 'add' in command and 'todo' in command:
-                item = command.replace('add', '').replace('to', '').replace('todo', '').replace('list', '').strip()
-            elif 'todo' in command:
-                item = command.replace('todo', '').replace('add', '').replace('create', '').strip()
-            
-            # Clean up common words
-            item = item.replace('my', '').replace('the', '').strip()
-            
-            if user_id and item:
-                try:
-                    conn = self.get_db_connection()
-                    conn.execute('INSERT INTO todo_item (task, user_id, completed) VALUES (?, ?, ?)', (item, user_id, False))
-                    conn.commit()
-                    conn.close()
-                    response = f"✅ Added '{item}' to your to-do list."
-                except Exception as e:
-                    response = f"✅ Todo item noted: '{item}' (database temporarily unavailable)"
+        if not command or not command.strip():
+            return "Hello! How can I help you today?"
+
+        command, intent = self._route(command)
+        if intent is None:
+            return self._handle_fallback(command, user_id)
+        if not intent.io_bound and intent.loaded:
+            return intent(self, command, user_id)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(io_executor(), intent, self, command, user_id)
+
+    def process_batch(self, commands, user_id=None, concurrency=BATCH_CONCURRENCY):
+        """Process many commands for one user; returns [(reply, exception)] in order
+
+        Intents that write the user's data, and the CPU-trivial ones, run in
+        order on this thread inside one database transaction, each command
+        under its own savepoint so a failure only undoes its own writes; a
+        database error its handler caught still counts as a failure. Once
+        that has committed, the remaining I/O-bound intents (weather, news,
+        search...) run on the I/O executor, at most `concurrency` at a time,
+        and see every write made earlier in the batch.
+        """
+        results = [None] * len(commands)
+        in_order = []
+        concurrent = []
+        for index, command in enumerate(commands):
+            if not command or not command.strip():
+                results[index] = ("Hello! How can I help you today?", None)
+                continue
+            command, intent = self._route(command)
+            if intent is not None and intent.io_bound and not intent.writes:
+                concurrent.append((index, intent, command))
             else:
-                response = "What would you like to add to your to-do list?"
-
-        elif 'add to my shopping list' in command or ('add' in command and 'shopping' in command) or 'shopping' in command:
-            # Extract shopping item from various command formats
-            item = ''
-            if 'add to my shopping list' in command:
-                item = command.replace('add to my shopping list', '').strip()
-            elif 'add' in command and 'shopping' in command:
-                # Handle "add bread to shopping list" format
-                item = command.replace('add', '').replace('to', '').replace('shopping', '').replace('list', '').replace('my', '').strip()
-            elif 'shopping' in command:
-                # Handle "shopping list bread" or "add bread shopping" formats
-                item = command.replace('shopping', '').replace('list', '').replace('add', '').replace('my', '').replace('to', '').strip()
-            
-            # Clean up extra words
-            item = item.replace('and', ',').strip()
-            
-            if item:
-                if user_id:
-                    try:
-                        conn = self.get_db_connection()
-                        # Handle multiple items separated by commas or "and"
-                        items = [i.strip() for i in item.replace(' and ', ',').split(',') if i.strip()]
-                        added_items = []
-                        for single_item in items:
-                            if single_item:
-                                conn.execute('INSERT INTO shopping_item (item_name, user_id) VALUES (?, ?)', (single_item, user_id))
-                                added_items.append(single_item)
-                        conn.commit()
-                        conn.close()
-                        
-                        if len(added_items) == 1:
-                            response = f"🛒 Added '{added_items[0]}' to your shopping list."
+                in_order.append((index, intent, command))
+
+        # Only take the write lock when some command will write
+        writes = any(intent is not None and intent.writes for _, intent, _ in in_order)
+        with db.transaction() if writes else contextlib.nullcontext() as transaction:
+            for index, intent, command in in_order:
+                try:
+                    with transaction.savepoint() if writes else contextlib.nullcontext():
+                        if intent is None:
+                            reply = self._handle_fallback(command, user_id)
                         else:
-                            response = f"🛒 Added {len(added_items)} items to your shopping list: {', '.join(added_items)}"
-                    except Exception as e:
-                        response = f"🛒 Shopping item noted: '{item}' (database temporarily unavailable)"
-                else:
-                    response = f"🛒 Shopping item noted: '{item}'"
-            else:
-                response = "What would you like to add to your shopping list? Try: 'add bread and milk to shopping list'"
+                            reply = intent(self, command, user_id)
+                    results[index] = (reply, None)
+                except Exception as e:
+                    results[index] = (None, e)
 
-        elif 'search' in command or 'wikipedia' in command:
-            query = command.replace('search', '').replace('wikipedia', '').strip()
+        slots = threading.BoundedSemaphore(concurrency)
+        futures = []
+        for index, intent, command in concurrent:
+            slots.acquire()
+            future = io_executor().submit(intent, self, command, user_id)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append((index, future))
+        for index, future in futures:
             try:
-                summary = wikipedia.summary(query, sentences=2)
-                response = f"Here's what I found about {query}: {summary}"
-            except wikipedia.exceptions.DisambiguationError as e:
-                response = f"Multiple results found for {query}. Try being more specific."
-            except wikipedia.exceptions.PageError:
-                response = f"Sorry, I could not find a Wikipedia page for {query}."
+                results[index] = (future.result(), None)
             except Exception as e:
-                response = f"An error occurred: {e}"
+                results[index] = (None, e)
+        return results
 
-        elif 'play' in command:
-            song = command.replace('play', '').strip()
-            response = f"🎵 Playing {song} on YouTube."
-            try:
-                pywhatkit.playonyt(song)
-            except:
-                response = f"🎵 I would play {song} for you, but there was an issue opening YouTube."
+    def stream_command(self, command, user_id=None):
+        """Yield ack, partial and final events while a command is processed
 
-        elif 'start' in command and 'timer' in command:
-            parts = command.split()
-            try:
-                if 'minute' in command:
-                    time_index = next(i for i, word in enumerate(parts) if word.isdigit())
-                    minutes = int(parts[time_index])
-                    duration_seconds = minutes * 60
-                    
-                    if user_id:
-                        conn = self.get_db_connection()
-                        conn.execute('INSERT INTO timer (name, duration, user_id) VALUES (?, ?, ?)',
-                                   (f"{minutes}-minute timer", duration_seconds, user_id))
-                        conn.commit()
-                        conn.close()
-                    
-                    response = f"⏰ Started a {minutes}-minute timer. I'll notify you when it's done!"
-                elif 'second' in command:
-                    time_index = next(i for i, word in enumerate(parts) if word.isdigit())
-                    seconds = int(parts[time_index])
-                    
-                    if user_id:
-                        conn = self.get_db_connection()
-                        conn.execute('INSERT INTO timer (name, duration, user_id) VALUES (?, ?, ?)',
-                                   (f"{seconds}-second timer", seconds, user_id))
-                        conn.commit()
-                        conn.close()
-                    
-                    response = f"⏰ Started a {seconds}-second timer. I'll notify you when it's done!"
-                else:
-                    response = "Please specify the timer duration, like 'start a 5 minute timer'."
-            except (ValueError, StopIteration):
-                response = "Please specify the timer duration, like 'start a 5 minute timer'."
+        The ack goes out before any handler runs. Intents with a streaming
+        generator also send each piece of their reply as a partial event.
+        """
+        if not command or not command.strip():
+            yield {'type': 'final', 'message': "Hello! How can I help you today?"}
+            return
 
-        elif 'calculate' in command or 'math' in command:
-            import re
-            # Extract numbers and operators from the command
-            math_parts = re.findall(r'[\d+\-*/().\s]+', command)
-            if math_parts:
-                try:
-                    expr = ''.join(math_parts).strip()
-                    # Clean expression to only allow safe characters
-                    safe_expr = re.sub(r'[^\d+\-*/().\s]', '', expr)
-                    if safe_expr and any(c.isdigit() for c in safe_expr):
-                        # Use eval safely for basic math
-                        result = eval(safe_expr)
-                        response = f"🧮 {safe_expr} = {result}"
-                    else:
-                        response = "Please provide a math expression like '15 + 25' or '10 * 5'."
-                except Exception as e:
-                    response = "Sorry, I couldn't calculate that. Please try a simpler math expression like '15 + 25'."
-            else:
-                # Try to extract from percentage calculations
-                if '%' in command and 'of' in command:
-                    try:
-                        parts = command.split()
-                        percentage = None
-                        amount = None
-                        for i, part in enumerate(parts):
-                            if '%' in part:
-                                percentage = float(part.replace('%', ''))
-                            elif part.replace('.', '').isdigit() and i > 0:
-                                amount = float(part)
-                        if percentage and amount:
-                            result = (percentage / 100) * amount
-                            response = f"🧮 {percentage}% of {amount} = {result:.2f}"
-                        else:
-                            response = "Please provide a calculation like '15% of 100' or '25 + 30'."
-                    except:
-                        response = "Please provide a calculation like '15% of 100' or '25 + 30'."
-                else:
-                    response = "Please provide a math expression like '15 + 25', '10 * 5', or '15% of 100'."
+        command, intent = self._route(command)
+        yield {'type': 'ack', 'intent': intent.name if intent else None}
 
-        elif 'translate' in command:
-            # Multi-language translation using basic dictionary for common phrases
-            try:
-                # Extract text to translate and target language
-                command_lower = command.lower()
+        if intent is None:
+            message = self._handle_fallback(command, user_id)
+        elif intent.stream is not None:
+            parts = []
+            with metrics.timed('intent', intent.name):
+                for part in intent.stream(self, command, user_id):
+                    parts.append(part)
+                    yield {'type': 'partial', 'text': part}
+            message = ''.join(parts)
+        else:
+            message = intent(self, command, user_id)
+        yield {'type': 'final', 'message': message}
+
+    @router.intent('time', ('time',), priority=70)
+    def _handle_time(self, command, user_id=None):
+        now = datetime.datetime.now().strftime("%I:%M %p")
+        response = f"The current time is {now}."
+        return response
+
+    @router.intent('reminder', ('set a reminder', 'remind me'), priority=10, io_bound=True, writes=True)
+    def _handle_reminder(self, command, user_id=None):
+        parts = command.split(' ')
+        try:
+            if 'in' in command:
+                time_index = parts.index('in') + 1
+                time_value = int(parts[time_index])
+                time_unit = parts[time_index + 1]
                 
-                # Define translations for 12 languages
-                translations_db = {
-                    'spanish': {
-                        'hello': 'hola', 'goodbye': 'adiós', 'thank you': 'gracias', 'please': 'por favor',
-                        'yes': 'sí', 'no': 'no', 'good morning': 'buenos días', 'good night': 'buenas noches',
-                        'how are you': 'cómo estás', 'i love you': 'te amo', 'water': 'agua', 'food': 'comida'
-                    },
-                    'french': {
-                        'hello': 'bonjour', 'goodbye': 'au revoir', 'thank you': 'merci', 'please': 's\'il vous plaît',
-                        'yes': 'oui', 'no': 'non', 'good morning': 'bonjour', 'good night': 'bonne nuit',
-                        'how are you': 'comment allez-vous', 'i love you': 'je t\'aime', 'water': 'eau', 'food': 'nourriture'
-                    },
-                    'german': {
-                        'hello': 'hallo', 'goodbye': 'auf wiedersehen', 'thank you': 'danke', 'please': 'bitte',
-                        'yes': 'ja', 'no': 'nein', 'good morning': 'guten morgen', 'good night': 'gute nacht',
-                        'how are you': 'wie geht es dir', 'i love you': 'ich liebe dich', 'water': 'wasser', 'food': 'essen'
-                    },
-                    'italian': {
-                        'hello': 'ciao', 'goodbye': 'arrivederci', 'thank you': 'grazie', 'please': 'per favore',
-                        'yes': 'sì', 'no': 'no', 'good morning': 'buongiorno', 'good night': 'buonanotte',
-                        'how are you': 'come stai', 'i love you': 'ti amo', 'water': 'acqua', 'food': 'cibo'
-                    },
-                    'portuguese': {
-                        'hello': 'olá', 'goodbye': 'tchau', 'thank you': 'obrigado', 'please': 'por favor',
-                        'yes': 'sim', 'no': 'não', 'good morning': 'bom dia', 'good night': 'boa noite',
-                        'how are you': 'como está', 'i love you': 'eu te amo', 'water': 'água', 'food': 'comida'
-                    },
-                    'dutch': {
-                        'hello': 'hallo', 'goodbye': 'tot ziens', 'thank you': 'dank je', 'please': 'alsjeblieft',
-                        'yes': 'ja', 'no': 'nee', 'good morning': 'goedemorgen', 'good night': 'goedenacht',
-                        'how are you': 'hoe gaat het', 'i love you': 'ik hou van je', 'water': 'water', 'food': 'eten'
-                    },
-                    'russian': {
-                        'hello': 'привет', 'goodbye': 'до свидания', 'thank you': 'спасибо', 'please': 'пожалуйста',
-                        'yes': 'да', 'no': 'нет', 'good morning': 'доброе утро', 'good night': 'спокойной ночи',
-                        'how are you': 'как дела', 'i love you': 'я тебя люблю', 'water': 'вода', 'food': 'еда'
-                    },
-                    'japanese': {
-                        'hello': 'こんにちは', 'goodbye': 'さようなら', 'thank you': 'ありがとう', 'please': 'お願いします',
-                        'yes': 'はい', 'no': 'いいえ', 'good morning': 'おはよう', 'good night': 'おやすみ',
-                        'how are you': '元気ですか', 'i love you': '愛してる', 'water': '水', 'food': '食べ物'
-                    },
-                    'chinese': {
-                        'hello': '你好', 'goodbye': '再见', 'thank you': '谢谢', 'please': '请',
-                        'yes': '是', 'no': '不', 'good morning': '早上好', 'good night': '晚安',
-                        'how are you': '你好吗', 'i love you': '我爱你', 'water': '水', 'food': '食物'
-                    },
-                    'korean': {
-                        'hello': '안녕하세요', 'goodbye': '안녕히 가세요', 'thank you': '감사합니다', 'please': '제발',
-                        'yes': '네', 'no': '아니요', 'good morning': '좋은 아침', 'good night': '잘 자요',
-                        'how are you': '어떻게 지내세요', 'i love you': '사랑해요', 'water': '물', 'food': '음식'
-                    },
-                    'hindi': {
-                        'hello': 'नमस्ते', 'goodbye': 'अलविदा', 'thank you': 'धन्यवाद', 'please': 'कृपया',
-                        'yes': 'हाँ', 'no': 'नहीं', 'good morning': 'सुप्रभात', 'good night': 'शुभ रात्रि',
-                        'how are you': 'आप कैसे हैं', 'i love you': 'मैं तुमसे प्यार करता हूँ', 'water': 'पानी', 'food': 'खाना'
-                    },
-                    'arabic': {
-                        'hello': 'مرحبا', 'goodbye': 'وداعا', 'thank you': 'شكرا', 'please': 'من فضلك',
-                        'yes': 'نعم', 'no': 'لا', 'good morning': 'صباح الخير', 'good night': 'تصبح على خير',
-                        'how are you': 'كيف حالك', 'i love you': 'أحبك', 'water': 'ماء', 'food': 'طعام'
-                    }
-                }
+                if 'minute' in time_unit:
+                    reminder_time = datetime.datetime.now() + datetime.timedelta(minutes=time_value)
+                elif 'hour' in time_unit:
+                    reminder_time = datetime.datetime.now() + datetime.timedelta(hours=time_value)
+                else:
+                    reminder_time = datetime.datetime.now() + datetime.timedelta(minutes=time_value)
                 
-                # Find target language
-                target_lang = None
-                for lang in translations_db.keys():
-                    if f'to {lang}' in command_lower:
-                        target_lang = lang
-                        text_to_translate = command_lower.replace('translate', '').replace(f'to {lang}', '').strip()
-                        break
+                task = command.replace('set a reminder', '').replace('remind me', '').replace(f'in {time_value} {time_unit}', '').replace('to', '').strip()
                 
-                if target_lang and text_to_translate:
-                    translation = translations_db[target_lang].get(text_to_translate, None)
-                    if translation:
-                        response = f"🌐 Translation: '{text_to_translate}' in {target_lang.title()} is '{translation}'"
-                    else:
-                        available_phrases = ', '.join(list(translations_db[target_lang].keys())[:8])
-                        response = f"🌐 I can translate these phrases to {target_lang.title()}: {available_phrases}"
-                else:
-                    supported_langs = ', '.join(list(translations_db.keys()))
-                    response = f"🌐 I support translation to: {supported_langs}. Try: 'translate hello to German' or 'translate thank you to Japanese'"
-                    
-            except Exception as e:
-                response = "🌐 Translation service temporarily unavailable. Try: 'translate hello to German'"
+                if user_id:
+                    conn = self.get_db_connection()
+                    cursor = conn.execute('INSERT INTO reminder (task, remind_at, user_id, version) '
+                                          f'VALUES (?, ?, ?, {dashboard.next_version()})',
+                                          (task, reminder_time, user_id, user_id))
+                    conn.commit()
+                    conn.close()
+                    db.after_commit(functools.partial(dashboard.invalidate, user_id))
+                    db.after_commit(functools.partial(scheduler.schedule_reminder, cursor.lastrowid,
+                                                      user_id, task, reminder_time))
+                
+                response = f"🔔 Reminder set: '{task}' in {time_value} {time_unit}."
+            else:
+                response = "Please specify when to remind you, like 'remind me to call mom in 30 minutes'."
+        except (ValueError, IndexError):
+            response = "Please specify the reminder in the format: 'Set a reminder to [task] in [time] [unit]'."
+        return response
 
-        elif 'news' in command:
+    @router.intent('todo', ('todo', 'todos', 'to-do'), priority=20, io_bound=True, writes=True)
+    def _handle_todo(self, command, user_id=None):
+        # Extract the todo item from various command formats
+        item = re.sub(r'^(?:add|create)\s+', '', command)
+        item = re.sub(r'\b(?:to|on|in)\s+(?:my\s+|the\s+)?(?:todo|todos|to-do)(?:\s+list)?\b', '', item)
+        item = re.sub(r'\b(?:todo|todos|to-do)(?:\s+list)?\b', '', item)
+        item = ' '.join(item.split())
+        
+        if user_id and item:
             try:
-                news_api_key = os.getenv('NEWS_API_KEY', '')
-                if news_api_key and news_api_key != 'YOUR_NEWS_API_KEY_HERE':
-                    url = f'https://newsapi.org/v2/top-headlines?country=us&apiKey={news_api_key}'
-                    news_response = requests.get(url)
-                    
-                    if news_response.status_code == 200:
-                        news_data = news_response.json()
-                        articles = news_data.get('articles', [])[:3]
-                        
-                        if articles:
-                            headlines = "📰 Latest News Headlines:\n\n"
-                            for i, article in enumerate(articles, 1):
-                                headlines += f"{i}. {article['title']}\n"
-                            response = headlines
-                        else:
-                            response = "📰 No news articles found at the moment."
-                    else:
-                        response = "📰 Unable to fetch news at the moment. Please try again later."
-                else:
-                    response = "📰 News feature requires API key setup. Please add NEWS_API_KEY to your environment variables."
+                conn = self.get_db_connection()
+                conn.execute('INSERT INTO todo_item (task, user_id, completed, version) '
+                             f'VALUES (?, ?, ?, {dashboard.next_version()})', (item, user_id, False, user_id))
+                conn.commit()
+                conn.close()
+                db.after_commit(functools.partial(dashboard.invalidate, user_id))
+                response = f"✅ Added '{item}' to your to-do list."
             except Exception as e:
-                response = "📰 Error fetching news. Please try again later."
+                response = f"✅ Todo item noted: '{item}' (database temporarily unavailable)"
+        else:
+            response = "What would you like to add to your to-do list?"
+        return response
 
-        elif 'note' in command and ('create' in command or 'make' in command or 'add' in command):
-            note_content = command.replace('create a note', '').replace('make a note', '').replace('add a note', '').replace('note', '').strip()
-            if note_content and user_id:
+    @router.intent('shopping', ('shopping',), priority=30, io_bound=True, writes=True)
+    def _handle_shopping(self, command, user_id=None):
+        # Extract shopping item from various command formats
+        item = ''
+        if 'add to my shopping list' in command:
+            item = command.replace('add to my shopping list', '').strip()
+        elif 'add' in command and 'shopping' in command:
+            # Handle "add bread to shopping list" format
+            item = command.replace('add', '').replace('to', '').replace('shopping', '').replace('list', '').replace('my', '').strip()
+        elif 'shopping' in command:
+            # Handle "shopping list bread" or "add bread shopping" formats
+            item = command.replace('shopping', '').replace('list', '').replace('add', '').replace('my', '').replace('to', '').strip()
+        
+        # Clean up extra words
+        item = item.replace('and', ',').strip()
+        
+        if item:
+            if user_id:
                 try:
                     conn = self.get_db_connection()
-                    conn.execute('INSERT INTO note (content, user_id) VALUES (?, ?)', (note_content, user_id))
+                    # Handle multiple items separated by commas or "and"
+                    items = [i.strip() for i in item.replace(' and ', ',').split(',') if i.strip()]
+                    added_items = []
+                    for single_item in items:
+                        if single_item:
+                            conn.execute('INSERT INTO shopping_item (item_name, user_id, version) '
+                                         f'VALUES (?, ?, {dashboard.next_version()})', (single_item, user_id, user_id))
+                            added_items.append(single_item)
                     conn.commit()
                     conn.close()
-                    response = f"📝 Created a note: '{note_content}'"
-                except:
-                    response = f"📝 Note saved locally: '{note_content}'"
-            elif note_content:
-                response = f"📝 Note saved: '{note_content}'"
+                    db.after_commit(functools.partial(dashboard.invalidate, user_id))
+                    
+                    if len(added_items) == 1:
+                        response = f"🛒 Added '{added_items[0]}' to your shopping list."
+                    else:
+                        response = f"🛒 Added {len(added_items)} items to your shopping list: {', '.join(added_items)}"
+                except Exception as e:
+                    response = f"🛒 Shopping item noted: '{item}' (database temporarily unavailable)"
             else:
-                response = "What would you like to note down?"
-
-        elif 'joke' in command:
-            try:
-                response = pyjokes.get_joke()
-            except:
-                response = "😄 Why don't scientists trust atoms? Because they make up everything!"
+                response = f"🛒 Shopping item noted: '{item}'"
+        else:
+            response = "What would you like to add to your shopping list? Try: 'add bread and milk to shopping list'"
+        return response
 
-        elif 'weather' in command:
-            try:
-                # Extract city from command - improved parsing
-                city = "London"  # Default city
+    @router.intent('timer', ('timer',), requires=(('start', 'set'),), priority=60, io_bound=True, writes=True)
+    def _handle_timer(self, command, user_id=None):
+        parts = command.split()
+        try:
+            if 'minute' in command:
+                time_index = next(i for i, word in enumerate(parts) if word.isdigit())
+                minutes = int(parts[time_index])
+                duration_seconds = minutes * 60
+                
+                if user_id:
+                    name = f"{minutes}-minute timer"
+                    conn = self.get_db_connection()
+                    cursor = conn.execute('INSERT INTO timer (name, duration, user_id, version) '
+                                          f'VALUES (?, ?, ?, {dashboard.next_version()})',
+                                          (name, duration_seconds, user_id, user_id))
+                    conn.commit()
+                    conn.close()
+                    db.after_commit(functools.partial(dashboard.invalidate, user_id))
+                    db.after_commit(functools.partial(scheduler.schedule_timer, cursor.lastrowid,
+                                                      user_id, name, duration_seconds))
                 
-                # Better city extraction logic
-                if ' in ' in command:
-                    city = command.split(' in ')[1].replace('?', '').strip()
-                elif 'weather ' in command:
-                    # Extract everything after "weather "
-                    weather_index = command.find('weather ')
-                    after_weather = command[weather_index + 8:].strip()
-                    if after_weather and not after_weather.startswith('like'):
-                        city = after_weather.replace('?', '').strip()
+                response = f"⏰ Started a {minutes}-minute timer. I'll notify you when it's done!"
+            elif 'second' in command:
+                time_index = next(i for i, word in enumerate(parts) if word.isdigit())
+                seconds = int(parts[time_index])
                 
-                # Clean up city name
-                city = city.replace('the weather', '').replace('like', '').strip()
-                if not city or city == '':
-                    city = "London"
+                if user_id:
+                    name = f"{seconds}-second timer"
+                    conn = self.get_db_connection()
+                    cursor = conn.execute('INSERT INTO timer (name, duration, user_id, version) '
+                                          f'VALUES (?, ?, ?, {dashboard.next_version()})',
+                                          (name, seconds, user_id, user_id))
+                    conn.commit()
+                    conn.close()
+                    db.after_commit(functools.partial(dashboard.invalidate, user_id))
+                    db.after_commit(functools.partial(scheduler.schedule_timer, cursor.lastrowid,
+                                                      user_id, name, seconds))
                 
-                api_key = os.getenv('WEATHER_API_KEY')
+                response = f"⏰ Started a {seconds}-second timer. I'll notify you when it's done!"
+            else:
+                response = "Please specify the timer duration, like 'start a 5 minute timer'."
+        except (ValueError, StopIteration):
+            response = "Please specify the timer duration, like 'start a 5 minute timer'."
+        return response
+
+    @router.intent('calculate', ('calculate', 'math'), priority=80, pure=True)
+    def _handle_calculate(self, command, user_id=None):
+        expression = calculator.extract_expression(command)
+        if not expression:
+            return "Please provide a math expression like '15 + 25', '10 * 5', or '15% of 100'."
+        try:
+            arithmetic, unit = calculator.split_unit(expression)
+            result = calculator.evaluate(arithmetic)
+        except calculator.CalculationTooLarge:
+            return "That calculation is too large for me. Please try smaller numbers or exponents."
+        except calculator.CalculationUnitError:
+            return ("I can't convert between units: add amounts in one unit, like '5 km + 3 km', "
+                    "or scale one by a number, like '20 dollars times 3'.")
+        except calculator.CalculationError:
+            return "Sorry, I couldn't calculate that. Please try a simpler math expression like '15 + 25' or '15% of 100'."
+        answer = calculator.format_number(result)
+        return f"🧮 {expression} = {answer} {unit}" if unit else f"🧮 {expression} = {answer}"
+
+    @router.intent('news', ('news',), priority=100, io_bound=True)
+    def _handle_news(self, command, user_id=None):
+        return ''.join(self._stream_news(command, user_id, stream=False))
+
+    @router.stream('news')
+    def _stream_news(self, command, user_id=None, stream=True):
+        """Yield the news reply one headline at a time, each as soon as it has downloaded"""
+        count = 0
+        try:
+            news_api_key = os.getenv('NEWS_API_KEY', '')
+            if news_api_key and news_api_key != 'YOUR_NEWS_API_KEY_HERE':
+                articles = upstreams.iter_news(news_api_key, limit=3, stream=stream)
                 
-                if api_key and api_key != 'YOUR_API_KEY_HERE':
-                    url = f'http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric'
-                    
-                    try:
-                        weather_response = requests.get(url, timeout=10)
-                        
-                        if weather_response.status_code == 200:
-                            weather_data = weather_response.json()
-                            weather_desc = weather_data['weather'][0]['description']
-                            temp = round(weather_data['main']['temp'])
-                            feels_like = round(weather_data['main']['feels_like'])
-                            humidity = weather_data['main']['humidity']
-                            wind_speed = weather_data['wind']['speed']
-
-                            response = f"🌤️ **Weather in {city.title()}**\n\n" \
-                                       f"Currently: {weather_desc.title()}\n" \
-                                       f"Temperature: {temp}°C (feels like {feels_like}°C)\n" \
-                                       f"Humidity: {humidity}%\n" \
-                                       f"Wind Speed: {wind_speed} m/s"
-                        else:
-                            weather_data = weather_response.json()
-                            response = f"❌ Couldn't find weather data for '{city}'. Please check the city name and try again."
-                    except requests.exceptions.RequestException:
-                        response = f"🌐 Unable to connect to weather service. Please check your internet connection."
-                    except Exception as e:
-                        response = f"⚠️ Error getting weather data: {str(e)}"
+                if articles is not None:
+                    for count, article in enumerate(articles, 1):
+                        if count == 1:
+                            yield "📰 Latest News Headlines:\n\n"
+                        yield f"{count}. {article.get('title', '')}\n"
+                    if not count:
+                        yield "📰 No news articles found at the moment."
                 else:
-                    response = "🔑 Weather API key not configured. Please set WEATHER_API_KEY in environment variables."
-            except Exception as e:
-                response = "💬 Try: 'weather in Paris' or 'what's the weather in Tokyo'"
-
-        elif 'trivia' in command or 'quiz' in command:
-            trivia_questions = [
-                "🧠 Here's a trivia question: What is the largest planet in our solar system? (Answer: Jupiter)",
-                "🧠 Trivia time: Which element has the chemical symbol 'Au'? (Answer: Gold)",
-                "🧠 Quick question: What year did the Titanic sink? (Answer: 1912)",
-                "🧠 Brain teaser: How many continents are there? (Answer: 7)",
-                "🧠 Fun fact question: What's the fastest land animal? (Answer: Cheetah)"
-            ]
-            import random
-            response = random.choice(trivia_questions)
-
-        elif 'habit' in command or 'track' in command:
-            response = "📊 Habit tracking feature coming soon! I'll help you build and maintain healthy habits."
-
-        elif 'calendar' in command or 'schedule' in command:
-            response = "📅 Calendar integration coming soon! I'll be able to manage your schedule and appointments."
-
-        elif 'how are you' in command:
-            responses = [
-                "I'm doing fantastic! Ready to help you with anything you need. 😊",
-                "I'm great, thank you for asking! How can I assist you today?",
-                "Doing wonderful! I'm here and ready to help with your tasks."
-            ]
-            import random
-            response = random.choice(responses)
-
-        # Web search functionality - ENHANCED
-        elif any(word in command for word in ['search', 'google', 'find', 'look up', 'what is', 'who is', 'tell me about']):
-            # Extract search query with better parsing
-            search_query = command
+                    yield "📰 Unable to fetch news at the moment. Please try again later."
+            else:
+                yield "📰 News feature requires API key setup. Please add NEWS_API_KEY to your environment variables."
+        except Exception as e:
+            # Headlines already sent stay; the reply just ends early
+            if count:
+                yield "(more headlines unavailable)"
+            else:
+                yield "📰 Error fetching news. Please try again later."
+
+    @router.intent('note', ('note',), requires=(('create', 'make', 'add'),), priority=110, io_bound=True, writes=True)
+    def _handle_note(self, command, user_id=None):
+        note_content = command.replace('create a note', '').replace('make a note', '').replace('add a note', '').replace('note', '').strip()
+        if note_content and user_id:
+            try:
+                conn = self.get_db_connection()
+                conn.execute(f'INSERT INTO note (content, user_id, version) VALUES (?, ?, {dashboard.next_version()})',
+                             (note_content, user_id, user_id))
+                conn.commit()
+                conn.close()
+                db.after_commit(functools.partial(dashboard.invalidate, user_id))
+                response = f"📝 Created a note: '{note_content}'"
+            except:
+                response = f"📝 Note saved locally: '{note_content}'"
+        elif note_content:
+            response = f"📝 Note saved: '{note_content}'"
+        else:
+            response = "What would you like to note down?"
+        return response
+
+    # "find my note about ..." beats todo/shopping, whose trigger words these phrases contain
+    @router.intent('find_mine', tuple(f'{verb} my {word}' for verb in ('find', 'search')
+                                      for word in user_search.KIND_WORDS), priority=15, io_bound=True)
+    def _handle_find_mine(self, command, user_id=None):
+        match = _FIND_MINE.search(command)
+        kind = user_search.KIND_WORDS[match.group(1)] if match else None
+        query = match.group(2).strip() if match else ''
+        labels = {'note': 'notes', 'todo': 'to-dos', 'shopping': 'shopping list', 'command': 'history'}
+        label = labels.get(kind, 'things')
+        if not user_id:
+            return f"🔎 Log in to search your {label}."
+        if not query:
+            return f"🔎 What should I look for in your {label}? Try: 'find my notes about the dentist'"
+        try:
+            results, more = user_search.search(user_id, query, [kind] if kind else None, limit=5)
+        except Exception:
+            log.exception('Search failed')
+            return "🔎 Search is temporarily unavailable. Please try again in a moment."
+        if not results:
+            return f"🔎 Nothing in your {label} matches '{query}'."
+        icons = {'note': '📝', 'todo': '✅', 'shopping': '🛒', 'command': '💬'}
+        lines = [f"🔎 Found in your {label} for '{query}':"]
+        lines += [f"{icons[result['kind']]} {result['snippet']}" for result in results]
+        if more is not None:
+            lines.append("Showing the 5 most recent matches.")
+        return '\n'.join(lines)
+
+    @router.intent('weather', ('weather',), priority=130, io_bound=True)
+    def _handle_weather(self, command, user_id=None):
+        try:
+            # Extract city from command - improved parsing
+            city = "London"  # Default city
             
-            # Remove search trigger words
-            for word in ['search for', 'search', 'google', 'find', 'look up', 'what is', 'who is', 'tell me about', 'about', 'web', 'internet']:
-                search_query = search_query.replace(word, '')
+            # Better city extraction logic
+            if ' in ' in command:
+                city = command.split(' in ')[1].replace('?', '').strip()
+            elif 'weather ' in command:
+                # Extract everything after "weather "
+                weather_index = command.find('weather ')
+                after_weather = command[weather_index + 8:].strip()
+                if after_weather and not after_weather.startswith('like'):
+                    city = after_weather.replace('?', '').strip()
             
-            search_query = search_query.strip()
+            # Clean up city name
+            city = city.replace('the weather', '').replace('like', '').strip()
+            if not city or city == '':
+                city = "London"
             
-            if search_query and len(search_query) > 1:
+            api_key = os.getenv('WEATHER_API_KEY')
+            
+            if api_key and api_key != 'YOUR_API_KEY_HERE':
                 try:
-                    from urllib.parse import quote
-                    
-                    # Use DuckDuckGo Instant Answer API
-                    search_url = f"https://api.duckduckgo.com/?q={quote(search_query)}&format=json&no_html=1&skip_disambig=1"
-                    search_response = requests.get(search_url, timeout=10)
+                    weather_data = upstreams.get_weather(city, api_key)
                     
-                    if search_response.status_code == 200:
-                        data = search_response.json()
-                        
-                        # Try different response types
-                        if data.get('Abstract') and len(data['Abstract']) > 50:
-                            abstract_url = data.get('AbstractURL', '')
-                            source_name = abstract_url.split('//')[-1].split('/')[0] if abstract_url else 'Wikipedia'
-                            response = f"🔍 **{search_query.title()}**\n\n{data['Abstract']}\n\n📖 Source: {source_name}"
-                            
-                        elif data.get('Definition') and len(data['Definition']) > 20:
-                            def_url = data.get('DefinitionURL', '')
-                            source_name = def_url.split('//')[-1].split('/')[0] if def_url else 'Dictionary'
-                            response = f"🔍 **Definition: {search_query.title()}**\n\n{data['Definition']}\n\n📖 Source: {source_name}"
-                            
-                        elif data.get('Answer'):
-                            response = f"🔍 **{search_query.title()}**\n\n{data['Answer']}"
-                            
-                        elif data.get('RelatedTopics') and len(data['RelatedTopics']) > 0:
-                            # Use first related topic if available
-                            first_topic = data['RelatedTopics'][0]
-                            if isinstance(first_topic, dict) and first_topic.get('Text'):
-                                response = f"🔍 **{search_query.title()}**\n\n{first_topic['Text']}\n\n📖 Source: DuckDuckGo"
-                            else:
-                                response = f"🔍 **Search: {search_query}**\n\nFound some results but no detailed information available. Try a more specific search term."
-                        else:
-                            # Enhanced fallback with suggestions
-                            response = f"🔍 **Search: {search_query}**\n\nNo detailed information found. Try:\n• Being more specific\n• Using different keywords\n• Checking spelling\n\nExample: 'search Python programming' or 'what is machine learning'"
+                    if weather_data is not None:
+                        weather_desc = weather_data['weather'][0]['description']
+                        temp = round(weather_data['main']['temp'])
+                        feels_like = round(weather_data['main']['feels_like'])
+                        humidity = weather_data['main']['humidity']
+                        wind_speed = weather_data['wind']['speed']
+
+                        response = f"🌤️ **Weather in {city.title()}**\n\n" \
+                                   f"Currently: {weather_desc.title()}\n" \
+                                   f"Temperature: {temp}°C (feels like {feels_like}°C)\n" \
+                                   f"Humidity: {humidity}%\n" \
+                                   f"Wind Speed: {wind_speed} m/s"
                     else:
-                        response = f"🔍 Search service temporarily unavailable. Please try again in a moment."
-                        
-                except requests.exceptions.Timeout:
-                    response = f"🔍 Search request timed out. Please try again with a shorter query."
+                        response = f"❌ Couldn't find weather data for '{city}'. Please check the city name and try again."
                 except requests.exceptions.RequestException:
-                    response = f"🔍 Unable to connect to search service. Check your internet connection."
+                    response = f"🌐 Unable to connect to weather service. Please check your internet connection."
                 except Exception as e:
-                    response = f"🔍 Search error occurred. Please try again later."
+                    response = f"⚠️ Error getting weather data: {str(e)}"
             else:
-                response = "🔍 **Web Search Ready!**\n\nWhat would you like me to search for?\n\nExamples:\n• 'search artificial intelligence'\n• 'what is blockchain'\n• 'find information about space exploration'\n• 'tell me about renewable energy'"
-
-        # Normal conversation AI responses
-        elif any(greeting in command for greeting in ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening']):
-            responses = [
-                "Hello! 👋 I'm Darek, your AI assistant. How can I help you today?",
-                "Hi there! 😊 Ready to assist you with anything you need!",
-                "Hey! 🌟 What can I do for you today?",
-                "Hello! Great to see you! How can I make your day better?"
-            ]
-            import random
-            response = random.choice(responses)
-            
-        elif 'what can you do' in command or 'help' in command or 'capabilities' in command:
-            response = """🤖 **I'm Darek, your AI assistant! Here's what I can do:**
+                response = "🔑 Weather API key not configured. Please set WEATHER_API_KEY in environment variables."
+        except Exception as e:
+            response = "💬 Try: 'weather in Paris' or 'what's the weather in Tokyo'"
+        return response
+
+    @router.intent('trivia', ('trivia', 'quiz'), priority=140, pure=True)
+    def _handle_trivia(self, command, user_id=None):
+        trivia_questions = [
+            "🧠 Here's a trivia question: What is the largest planet in our solar system? (Answer: Jupiter)",
+            "🧠 Trivia time: Which element has the chemical symbol 'Au'? (Answer: Gold)",
+            "🧠 Quick question: What year did the Titanic sink? (Answer: 1912)",
+            "🧠 Brain teaser: How many continents are there? (Answer: 7)",
+            "🧠 Fun fact question: What's the fastest land animal? (Answer: Cheetah)"
+        ]
+        response = Choices(trivia_questions)
+        return response
+
+    @router.intent('habit', ('habit', 'habits', 'track'), priority=150, pure=True)
+    def _handle_habit(self, command, user_id=None):
+        response = "📊 Habit tracking feature coming soon! I'll help you build and maintain healthy habits."
+        return response
+
+    @router.intent('calendar', ('calendar', 'schedule'), priority=160, pure=True)
+    def _handle_calendar(self, command, user_id=None):
+        response = "📅 Calendar integration coming soon! I'll be able to manage your schedule and appointments."
+        return response
+
+    @router.intent('how_are_you', ('how are you',), priority=170, pure=True)
+    def _handle_how_are_you(self, command, user_id=None):
+        responses = [
+            "I'm doing fantastic! Ready to help you with anything you need. 😊",
+            "I'm great, thank you for asking! How can I assist you today?",
+            "Doing wonderful! I'm here and ready to help with your tasks."
+        ]
+        response = Choices(responses)
+        return response
+
+    # Web search functionality
+    @router.intent('web_search', ('google', 'find', 'look up', 'what is', 'who is', 'tell me about'), priority=180, io_bound=True)
+    def _handle_web_search(self, command, user_id=None):
+        return ''.join(self._stream_web_search(command, user_id))
+
+    @router.stream('web_search')
+    def _stream_web_search(self, command, user_id=None):
+        """Yield a local knowledge-index answer at once, and only go to DuckDuckGo on a miss"""
+        # Extract search query with better parsing
+        search_query = command
+        
+        # Remove search trigger words
+        for word in ['search for', 'search', 'google', 'find', 'look up', 'what is', 'who is', 'tell me about', 'about', 'web', 'internet']:
+            search_query = search_query.replace(word, '')
+        
+        search_query = search_query.strip()
+        
+        article = knowledge_index.lookup(search_query) if len(search_query) > 1 else None
+        if article is not None:
+            # Answered from the local knowledge index, no network round trip
+            source_name = article['url'].split('//')[-1].split('/')[0] if article['url'] else 'Wikipedia'
+            yield f"🔍 **{article['title']}**\n\n{article['abstract']}\n\n📖 Source: {source_name}"
+            return
+        if search_query and len(search_query) > 1:
+            try:
+                # Use DuckDuckGo Instant Answer API
+                data = upstreams.search(search_query)
+                
+                if data is not None:
+                    
+                    # Try different response types
+                    if data.get('Abstract') and len(data['Abstract']) > 50:
+                        abstract_url = data.get('AbstractURL', '')
+                        source_name = abstract_url.split('//')[-1].split('/')[0] if abstract_url else 'Wikipedia'
+                        response = f"🔍 **{search_query.title()}**\n\n{data['Abstract']}\n\n📖 Source: {source_name}"
+                        knowledge_index.remember(search_query, data['Abstract'], abstract_url, 'duckduckgo',
+                                                 title=data.get('Heading'))
+                        
+                    elif data.get('Definition') and len(data['Definition']) > 20:
+                        def_url = data.get('DefinitionURL', '')
+                        source_name = def_url.split('//')[-1].split('/')[0] if def_url else 'Dictionary'
+                        response = f"🔍 **Definition: {search_query.title()}**\n\n{data['Definition']}\n\n📖 Source: {source_name}"
+                        
+                    elif data.get('Answer'):
+                        response = f"🔍 **{search_query.title()}**\n\n{data['Answer']}"
+                        
+                    elif data.get('RelatedTopics') and len(data['RelatedTopics']) > 0:
+                        # Use first related topic if available
+                        first_topic = data['RelatedTopics'][0]
+                        if isinstance(first_topic, dict) and first_topic.get('Text'):
+                            response = f"🔍 **{search_query.title()}**\n\n{first_topic['Text']}\n\n📖 Source: DuckDuckGo"
+                        else:
+                            response = f"🔍 **Search: {search_query}**\n\nFound some results but no detailed information available. Try a more specific search term."
+                    else:
+                        # Enhanced fallback with suggestions
+                        response = f"🔍 **Search: {search_query}**\n\nNo detailed information found. Try:\n• Being more specific\n• Using different keywords\n• Checking spelling\n\nExample: 'search Python programming' or 'what is machine learning'"
+                else:
+                    response = f"🔍 Search service temporarily unavailable. Please try again in a moment."
+                    
+            except requests.exceptions.Timeout:
+                response = f"🔍 Search request timed out. Please try again with a shorter query."
+            except requests.exceptions.RequestException:
+                response = f"🔍 Unable to connect to search service. Check your internet connection."
+            except Exception as e:
+                response = f"🔍 Search error occurred. Please try again later."
+        else:
+            response = "🔍 **Web Search Ready!**\n\nWhat would you like me to search for?\n\nExamples:\n• 'search artificial intelligence'\n• 'what is blockchain'\n• 'find information about space exploration'\n• 'tell me about renewable energy'"
+        yield response
+
+    # Normal conversation AI responses
+    @router.intent('greeting', ('hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening'), priority=190,
+                   pure=True)
+    def _handle_greeting(self, command, user_id=None):
+        responses = [
+            "Hello! 👋 I'm Darek, your AI assistant. How can I help you today?",
+            "Hi there! 😊 Ready to assist you with anything you need!",
+            "Hey! 🌟 What can I do for you today?",
+            "Hello! Great to see you! How can I make your day better?"
+        ]
+        response = Choices(responses)
+        return response
+
+    @router.intent('help', ('what can you do', 'help', 'capabilities'), priority=200, pure=True)
+    def _handle_help(self, command, user_id=None):
+        response = """🤖 **I'm Darek, your AI assistant! Here's what I can do:**
 
 📅 **Productivity:** Set reminders, create notes, manage to-do lists, start timers
 🧮 **Calculator:** Solve math problems, percentages, complex calculations  
@@ -517,38 +631,38 @@ class Darek:
 💬 **Chat:** Have normal conversations - I'm here to help and chat!
 
 Just ask me naturally like "What's the weather in Paris?" or "Calculate 15% of 200" or even just say hi! 😊"""
+        return response
 
-        elif 'thank you' in command or 'thanks' in command:
-            responses = [
-                "You're very welcome! 😊 Happy to help anytime!",
-                "My pleasure! 🌟 Let me know if you need anything else!",
-                "Glad I could help! 💫 Feel free to ask me anything!"
-            ]
-            import random
-            response = random.choice(responses)
-            
-        elif 'bye' in command or 'goodbye' in command or 'see you' in command:
-            responses = [
-                "Goodbye! 👋 Have a wonderful day!",
-                "See you later! 😊 Take care!",
-                "Bye! 🌟 Come back anytime you need help!"
-            ]
-            import random
-            response = random.choice(responses)
+    @router.intent('thanks', ('thank you', 'thanks'), priority=210, pure=True)
+    def _handle_thanks(self, command, user_id=None):
+        responses = [
+            "You're very welcome! 😊 Happy to help anytime!",
+            "My pleasure! 🌟 Let me know if you need anything else!",
+            "Glad I could help! 💫 Feel free to ask me anything!"
+        ]
+        response = Choices(responses)
+        return response
 
-        else:
-            # More conversational fallback responses
-            fallback_responses = [
-                "I'm not sure I understand that completely. Could you try rephrasing? I can help with weather, calculations, reminders, notes, web searches, or just chat! 😊",
-                "Hmm, I didn't quite catch that. I'm here to help with various tasks or just have a conversation. What would you like to do?",
-                "I'm still learning! 🤖 Could you be more specific? I can assist with productivity tasks, answer questions, or just chat with you!",
-                "That's interesting! I might need a bit more context. Feel free to ask me about weather, math, reminders, or anything else on your mind! 💭"
-            ]
-            import random
-            response = random.choice(fallback_responses)
-            
-            # Log unrecognized command
-            with open('unrecognized_commands.txt', 'a') as f:
-                f.write(f'{datetime.datetime.now()}: {command}\n')
-    
+    @router.intent('bye', ('bye', 'goodbye', 'see you'), priority=220, pure=True)
+    def _handle_bye(self, command, user_id=None):
+        responses = [
+            "Goodbye! 👋 Have a wonderful day!",
+            "See you later! 😊 Take care!",
+            "Bye! 🌟 Come back anytime you need help!"
+        ]
+        response = Choices(responses)
+        return response
+
+    def _handle_fallback(self, command, user_id=None):
+        # More conversational fallback responses
+        fallback_responses = [
+            "I'm not sure I understand that completely. Could you try rephrasing? I can help with weather, calculations, reminders, notes, web searches, or just chat! 😊",
+            "Hmm, I didn't quite catch that. I'm here to help with various tasks or just have a conversation. What would you like to do?",
+            "I'm still learning! 🤖 Could you be more specific? I can assist with productivity tasks, answer questions, or just chat with you!",
+            "That's interesting! I might need a bit more context. Feel free to ask me about weather, math, reminders, or anything else on your mind! 💭"
+        ]
+        response = random.choice(fallback_responses)
+        
+        # Counted in the background; see the unrecognized_command table
+        unrecognized_writer.put((' '.join(command.split())[:500],))
         return response
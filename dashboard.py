@@ -0,0 +1,205 @@
+"""
+Dashboard data service for Darek AI
+
+Each widget is loaded with a bounded query and the assembled view is cached per
+user. Darek.process_command invalidates a user's entry whenever it writes a
+reminder, todo, shopping item, note or timer for them, so repeat page loads
+cost no database work at all.
+
+With the host-wide tier in shared_cache on, views are kept there instead, so
+every worker serves (and invalidates) the same copy. Each user has a
+generation counter there that invalidate() bumps; a view is stored with the
+generation it was loaded under and only served while that is still current,
+so a load that raced a write in another worker is never served.
+
+/api/dashboard syncs clients by version instead (see sync). Every insert,
+update or delete of a widget row moves a per-user change counter in
+dashboard_version on, and the row carries the version it was written at, so
+"has anything changed" is one primary-key lookup and "what changed since
+version N" is a handful of bounded queries for the widgets that did. Writers
+set the row's version in the statement that writes it (see next_version);
+triggers record it in dashboard_version.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import db
+import shared_cache
+
+# Rows shown per list widget
+WIDGET_LIMIT = int(os.getenv('DAREK_DASHBOARD_LIMIT', '20'))
+
+# Users whose assembled dashboard is kept in memory
+CACHE_SIZE = int(os.getenv('DAREK_DASHBOARD_CACHE_SIZE', '1024'))
+
+WIDGET_QUERIES = {
+    'reminders': 'SELECT * FROM reminder WHERE user_id = ? AND completed = 0 ORDER BY remind_at ASC LIMIT ?',
+    'todos': 'SELECT * FROM todo_item WHERE user_id = ? AND completed = 0 ORDER BY id ASC LIMIT ?',
+    'shopping_items': 'SELECT * FROM shopping_item WHERE user_id = ? AND completed = 0 ORDER BY id ASC LIMIT ?',
+    'notes': 'SELECT * FROM note WHERE user_id = ? ORDER BY created_at DESC LIMIT ?',
+    'timers': 'SELECT * FROM timer WHERE user_id = ? ORDER BY id DESC LIMIT ?',
+}
+
+VERSION_QUERIES = {
+    'version': 'SELECT coalesce(max(version), 0) FROM dashboard_version WHERE user_id = ?',
+    'changed': 'SELECT widget FROM dashboard_version WHERE user_id = ? AND version > ?',
+}
+
+
+
+def next_version(user_id='?'):
+    """SQL for a user's next dashboard version, to set a widget row's version column to
+
+    user_id is an SQL expression: a parameter by default, or a column such as
+    reminder.user_id in an UPDATE. The lookup is a primary-key range of at most
+    one row per widget, already in cache for the trigger that records the
+    version. Looking it up once per transaction and passing it in costs more,
+    even across 20 writes. What versioning adds to a write is that trigger's
+    upsert: one more page per commit.
+    """
+    return f'(SELECT coalesce(max(version), 0) + 1 FROM dashboard_version WHERE user_id = {user_id})'
+
+
+# Seconds a view stays in the shared tier; generations outlive the views
+SHARED_TTL = int(os.getenv('DAREK_DASHBOARD_SHARED_TTL', '3600'))
+GENERATION_TTL = SHARED_TTL * 24
+
+WIDGET_LIMITS = {
+    'timers': 5,
+}
+
+
+class DashboardCache:
+    """LRU cache of assembled dashboard views keyed by user id"""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._views = OrderedDict()
+        # Bumped on every invalidation so a load that raced a write is not cached
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            view = self._views.get(user_id)
+            if view is None:
+                self.misses += 1
+                return None, self._generations.get(user_id, 0)
+            self._views.move_to_end(user_id)
+            self.hits += 1
+            return view, None
+
+    def put(self, user_id, view, generation):
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return
+            self._views[user_id] = view
+            self._views.move_to_end(user_id)
+            while len(self._views) > self.size:
+                evicted, _ = self._views.popitem(last=False)
+                self._generations.pop(evicted, None)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._views.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+            self._generations.clear()
+
+
+cache = DashboardCache()
+
+
+def _widget_rows(conn, widget, user_id):
+    limit = WIDGET_LIMITS.get(widget, WIDGET_LIMIT)
+    return [dict(row) for row in conn.execute(WIDGET_QUERIES[widget], (user_id, limit))]
+
+
+def load_widgets(user_id):
+    """Run the bounded widget queries for one user"""
+    conn = db.get_connection()
+    try:
+        return {widget: _widget_rows(conn, widget, user_id) for widget in WIDGET_QUERIES}
+    finally:
+        conn.close()
+
+
+def version(user_id):
+    """A user's dashboard version: bumped by every change to a widget row"""
+    conn = db.get_connection()
+    try:
+        return conn.execute(VERSION_QUERIES['version'], (user_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def etag(user_id, current):
+    """ETag of a user's dashboard at a version"""
+    return f'dashboard-{user_id}-{current}'
+
+
+def sync(user_id, since=None):
+    """The dashboard at its current version, whole or as the changes after since
+
+    Both read from the database in one snapshot, never the view cache, so the
+    rows always match the version they are labelled with. A change lists, for
+    every widget that changed, the rows stamped after since and the ids the
+    widget now shows in order; clients drop whatever is no longer listed.
+    """
+    conn = db.get_connection()
+    try:
+        if not conn.in_transaction:
+            conn.execute('BEGIN')  # Released with a rollback by close()
+        current = conn.execute(VERSION_QUERIES['version'], (user_id,)).fetchone()[0]
+        if since is None or since > current:
+            widgets = {widget: _widget_rows(conn, widget, user_id) for widget in WIDGET_QUERIES}
+            return {'version': current, 'full': True, 'widgets': widgets}
+        changes = {}
+        for (widget,) in conn.execute(VERSION_QUERIES['changed'], (user_id, since)).fetchall():
+            rows = _widget_rows(conn, widget, user_id)
+            changes[widget] = {'ids': [row['id'] for row in rows],
+                               'rows': [row for row in rows if row['version'] > since]}
+        return {'version': current, 'full': False, 'since': since, 'changes': changes}
+    finally:
+        conn.close()
+
+
+def get_shared_dashboard(user_id, store):
+    """get_dashboard through the host-wide tier"""
+    view_key, generation_key = f'dashboard:{user_id}', f'dashboard-generation:{user_id}'
+    found = store.get_many([view_key, generation_key])
+    generation = found.get(generation_key, 0)
+    entry = found.get(view_key)
+    if entry is not None and entry['generation'] == generation:
+        cache.hits += 1
+        return entry['view']
+    cache.misses += 1
+    view = load_widgets(user_id)
+    store.set(view_key, {'generation': generation, 'view': view}, SHARED_TTL)
+    return view
+
+
+def get_dashboard(user_id):
+    """Return the dashboard view for a user, from cache when possible"""
+    if shared_cache.store.enabled:
+        return get_shared_dashboard(user_id, shared_cache.store)
+    view, generation = cache.get(user_id)
+    if view is None:
+        view = load_widgets(user_id)
+        cache.put(user_id, view, generation)
+    return view
+
+
+def invalidate(user_id):
+    """Drop a user's cached dashboard after their data changed"""
+    if user_id:
+        cache.invalidate(user_id)
+        if shared_cache.store.enabled:
+            shared_cache.store.incr(f'dashboard-generation:{user_id}', GENERATION_TTL)
@@ -0,0 +1,278 @@
+"""
+Shared SQLite connection layer for Darek AI
+
+app.py and darek_core.py both take connections from the pool below instead of
+opening a new sqlite3 connection per request. Connections are opened once in
+WAL mode with tuned pragmas and handed back to the pool when closed.
+
+Statements and commits on pooled connections are timed into the 'db' metrics
+family, labelled by verb and table ("insert reminder").
+
+Inside a transaction() block every get_connection() on that thread returns the
+block's connection, and commit() and close() on it are deferred to the end of
+the block, so code written for one connection per call can run many times
+under a single write transaction and commit.
+"""
+
+import contextlib
+import contextvars
+import os
+import re
+import sqlite3
+import threading
+
+import metrics
+
+DATABASE_PATH = os.getenv('DAREK_DB_PATH', os.path.join('instance', 'darek_ai.db'))
+
+# Idle connections kept per process; extra connections are closed on release
+POOL_SIZE = int(os.getenv('DAREK_DB_POOL_SIZE', '8'))
+
+# Prepared statements kept per connection by the sqlite3 module
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    # Readers no longer wait for writers, and commits append to the WAL
+    'PRAGMA journal_mode=WAL',
+    # With WAL, NORMAL cannot corrupt the database and skips most fsyncs
+    'PRAGMA synchronous=NORMAL',
+    # 16 MB page cache (negative values are KiB)
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+)
+
+
+_TABLE = re.compile(r'\b(?:from|into|update(?:\s+or\s+\w+)?)\s+(\w+)', re.IGNORECASE)
+# Schema changes name tables in ways _TABLE misreads ("AFTER UPDATE OF ... ON ...")
+_DDL = frozenset(['create', 'drop', 'alter'])
+_labels = {}
+
+
+def statement_label(sql):
+    """Short metrics label for a statement: its verb and first table, or 'ddl'"""
+    label = _labels.get(sql)
+    if label is None:
+        words = sql.split(None, 1)
+        verb = words[0].lower() if words else ''
+        if verb in _DDL:
+            label = 'ddl'
+        else:
+            table = _TABLE.search(sql)
+            label = f'{verb} {table.group(1).lower()}' if table else verb
+        if len(_labels) >= 1024:
+            _labels.clear()
+        _labels[sql] = label
+    return label
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor whose execute calls are recorded in the 'db' metrics family"""
+
+    def execute(self, sql, parameters=()):
+        with metrics.timed('db', statement_label(sql)):
+            try:
+                return super().execute(sql, parameters)
+            except sqlite3.Error as e:
+                self.connection.failed(e)
+                raise
+
+    def executemany(self, sql, seq_of_parameters):
+        with metrics.timed('db', statement_label(sql)):
+            try:
+                return super().executemany(sql, seq_of_parameters)
+            except sqlite3.Error as e:
+                self.connection.failed(e)
+                raise
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() returns it to its pool"""
+
+    pool = None
+    # Set while the connection belongs to a transaction() block
+    shared = False
+    # Last statement that failed while shared, even if the caller caught it
+    error = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute does not go through cursor(), so it is timed here.
+    # A SELECT is timed up to its first row; fetching the rest is not included.
+    def execute(self, sql, parameters=()):
+        with metrics.timed('db', statement_label(sql)):
+            try:
+                return super().execute(sql, parameters)
+            except sqlite3.Error as e:
+                self.failed(e)
+                raise
+
+    def executemany(self, sql, seq_of_parameters):
+        with metrics.timed('db', statement_label(sql)):
+            try:
+                return super().executemany(sql, seq_of_parameters)
+            except sqlite3.Error as e:
+                self.failed(e)
+                raise
+
+    def failed(self, error):
+        if self.shared:
+            self.error = error
+
+    def commit(self):
+        if self.shared:
+            return
+        with metrics.timed('db', 'commit'):
+            super().commit()
+
+    def close(self):
+        if self.shared:
+            return
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def close_connection(self):
+        """Really close the underlying database handle"""
+        super().close()
+
+
+class ConnectionPool:
+    """Per-process pool of configured connections to one database file"""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, factory=PooledConnection,
+                               cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        return conn
+
+    def _check_fork(self):
+        # Connections must never cross a fork; the child starts a fresh pool
+        if self._pid != os.getpid():
+            self._idle = []
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def acquire(self):
+        """Take an idle connection or open a new one"""
+        self._check_fork()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def release(self, conn):
+        """Return a connection, rolling back anything left uncommitted"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close_connection()
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close_connection()
+
+
+class Transaction:
+    """The connection of a transaction() block and what to run once it commits"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.callbacks = []
+
+    @contextlib.contextmanager
+    def savepoint(self, name='step'):
+        """Undo only this block's writes and after_commit callbacks if it raises
+
+        A statement that failed in the block counts as the block raising, even
+        if the code that ran it caught the error and carried on: the block is
+        undone and the statement's error raised from here, so it is all or
+        nothing.
+        """
+        pending = len(self.callbacks)
+        outer_error, self.conn.error = self.conn.error, None
+        self.conn.execute(f'SAVEPOINT {name}')
+        try:
+            yield
+            if self.conn.error is not None:
+                raise self.conn.error
+        except BaseException:
+            self.conn.execute(f'ROLLBACK TO {name}')
+            del self.callbacks[pending:]
+            raise
+        finally:
+            self.conn.error = outer_error
+            self.conn.execute(f'RELEASE {name}')
+
+
+pool = ConnectionPool(DATABASE_PATH)
+
+_transaction = contextvars.ContextVar('darek_db_transaction', default=None)
+
+
+def get_connection():
+    """Get a pooled database connection; call close() to give it back"""
+    current = _transaction.get()
+    if current is not None:
+        return current.conn
+    return pool.acquire()
+
+
+@contextlib.contextmanager
+def transaction():
+    """One write transaction and one commit for every get_connection() inside
+
+    Commits when the block exits normally and rolls back if it raises. A
+    nested block joins the outer one.
+    """
+    current = _transaction.get()
+    if current is not None:
+        yield current
+        return
+    conn = pool.acquire()
+    conn.execute('BEGIN IMMEDIATE')
+    conn.shared = True
+    current = Transaction(conn)
+    token = _transaction.set(current)
+    try:
+        yield current
+        conn.shared = False
+        conn.commit()
+    finally:
+        conn.shared = False
+        _transaction.reset(token)
+        conn.close()
+    for callback in current.callbacks:
+        callback()
+
+
+def after_commit(callback):
+    """Run callback once the current transaction() commits, or now outside one"""
+    current = _transaction.get()
+    if current is None:
+        callback()
+    else:
+        current.callbacks.append(callback)
@@ -0,0 +1,57 @@
+"""
+Gunicorn settings for serving Darek AI with one worker process per core
+
+    gunicorn -c gunicorn.conf.py app:app
+    DAREK_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:application
+
+The app is imported once in the master (preload) and the workers are forked
+from it, so intent handlers, the phrasebook index and compiled routes are
+loaded once and shared copy-on-write. The master migrates the database and
+closes its connections before forking. Connection pools, HTTP sessions, log
+and batch-writer threads are created again by each worker on first use, and
+post_worker_init starts the scheduler and retention threads in every worker.
+Upstream responses, dashboard views and scheduler events go through the
+host-wide tier in shared_cache, so the workers do not each start cold and
+one worker's writes are visible to all of them.
+"""
+
+import multiprocessing
+import os
+
+# Set before the app is imported: modules read their settings at import.
+# .env never overrides variables that are already set, so its development
+# FLASK_DEBUG cannot switch on the debugger (or exception propagation) here
+os.environ.setdefault('DAREK_SHARED_CACHE_PATH', os.path.join('instance', 'shared_cache.db'))
+os.environ['FLASK_DEBUG'] = '0'
+
+bind = os.getenv('DAREK_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('DAREK_WORKERS', multiprocessing.cpu_count()))
+# gthread keeps a worker responsive while some threads wait on upstreams or
+# hold /events streams open
+worker_class = os.getenv('DAREK_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('DAREK_THREADS', '16'))
+preload_app = True
+
+# Recycled workers start warm from the shared tier; jitter staggers restarts
+max_requests = int(os.getenv('DAREK_MAX_REQUESTS', '10000'))
+max_requests_jitter = max_requests // 10
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.getenv('DAREK_ACCESS_LOG') or None
+
+
+def on_starting(server):
+    import db
+    from init_db import create_database
+    create_database()
+    # No database handle may be shared with a forked worker
+    db.pool.close_all()
+
+
+def post_worker_init(worker):
+    import retention
+    from scheduler import scheduler
+    scheduler.start()
+    retention.worker.start()
@@ -0,0 +1,193 @@
+"""
+Shared outbound HTTP client for Darek AI
+
+All upstream calls go through one requests.Session per process, so
+connections to each host are kept alive and reused. Every request has a
+connect and read timeout, failed idempotent requests are retried with
+jittered backoff out of a per-host retry budget, and a per-host circuit
+breaker fails fast while an upstream is down.
+"""
+
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+CONNECT_TIMEOUT = float(os.getenv('DAREK_HTTP_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('DAREK_HTTP_READ_TIMEOUT', '10'))
+MAX_RETRIES = int(os.getenv('DAREK_HTTP_MAX_RETRIES', '2'))
+# Keep-alive connections kept per host
+POOL_MAXSIZE = int(os.getenv('DAREK_HTTP_POOL_SIZE', '32'))
+
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 2.0
+
+# Responses worth retrying; anything else is returned to the caller as-is
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Open after consecutive failures, then let one probe through per cooldown"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: this caller probes, everyone else keeps failing fast
+                self.state = 'half-open'
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half-open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Token bucket that caps retries to a fraction of recent requests"""
+
+    def __init__(self, ratio=0.2, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class HttpClient:
+    """Keep-alive session with timeouts, retries and per-host circuit breakers"""
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, pool_maxsize=POOL_MAXSIZE,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.pool_maxsize = pool_maxsize
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._session = None
+        self._pid = None
+        self._breakers = {}
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Pooled sockets must not be shared with a forked child
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.pool_maxsize,
+                                          max_retries=0)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def breaker(self, host):
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._budgets[host] = RetryBudget()
+            return breaker
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        """GET url, retrying transient failures; raises RequestException subclasses
+
+        With stream=True the body is read as the caller iterates over it, and
+        the caller must close the response.
+        """
+        host = urlsplit(url).netloc
+        with metrics.timed('http', host) as timer:
+            response = self._get(host, url, params, timeout, stream)
+            # Server errors that come back as a response still count as errors
+            timer.error = response.status_code >= 500
+            return response
+
+    def _get(self, host, url, params, timeout, stream):
+        breaker = self.breaker(host)
+        budget = self._budgets[host]
+        if not breaker.allow():
+            raise CircuitOpenError(f'Circuit open for {host}')
+        budget.deposit()
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, params=params, timeout=timeout or self.timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                breaker.record_failure()
+                if not self._should_retry(attempt, breaker, budget):
+                    raise
+            except Exception:
+                # Not retried, but a half-open breaker must still hear how its probe went
+                breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if not self._should_retry(attempt, breaker, budget):
+                    return response
+                response.close()
+            attempt += 1
+            # Full jitter keeps retries from many workers from arriving together
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+
+    def _should_retry(self, attempt, breaker, budget):
+        return attempt < self.max_retries and breaker.allow() and budget.withdraw()
+
+    def stats(self):
+        with self._lock:
+            return {host: {'state': breaker.state, 'failures': breaker.failures,
+                           'retry_tokens': round(self._budgets[host].tokens, 2)}
+                    for host, breaker in self._breakers.items()}
+
+
+client = HttpClient()
+
+
+def get(url, params=None, timeout=None, stream=False):
+    """GET through the shared client"""
+    return client.get(url, params=params, timeout=timeout, stream=stream)
@@ -1,40 +1,100 @@
 #!/usr/bin/env python3
 """
-Simple database initialization script for Darek AI
+Database initialization and schema migrations for Darek AI
+
+Migrations are applied in order and the last applied version is stored in
+PRAGMA user_version, so running this script upgrades an existing database in
+place. Migrations are forward-only: never edit one that has shipped, add a new
+one to the end of MIGRATIONS instead.
+
+    python init_db.py                 # create or upgrade the database
+    python init_db.py --check-plans   # fail if a hot query does a full scan
 """
 
-import sqlite3
-import os
+import sys
+import db
+from dashboard import WIDGET_QUERIES, VERSION_QUERIES
+from scheduler import PENDING_QUERIES
+from knowledge_index import QUERIES as KNOWLEDGE_QUERIES
+from user_search import QUERIES as SEARCH_QUERIES, HISTORY_QUERIES, INDEX_QUERIES, ID_BITS, next_document_id
+from retention import QUERIES as RETENTION_QUERIES
 
-def create_database():
-    """Create the database with the correct schema"""
-    db_path = os.path.join('instance', 'darek_ai.db')
-    
-    # Create instance directory if it doesn't exist
-    os.makedirs('instance', exist_ok=True)
-    
-    # Remove existing database
-    if os.path.exists(db_path):
-        os.remove(db_path)
-        print("Removed existing database")
-    
-    # Create new database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE user (
+# Table behind each dashboard widget and the columns the widget shows
+DASHBOARD_TABLES = [
+    ('reminder', 'reminders', 'task, remind_at, completed'),
+    ('todo_item', 'todos', 'task, priority, completed'),
+    ('shopping_item', 'shopping_items', 'item_name, completed'),
+    ('note', 'notes', 'title, content, created_at'),
+    ('timer', 'timers', 'name, duration, start_time, active'),
+]
+
+
+def _dashboard_bump(widget, row):
+    return f'''
+            INSERT INTO dashboard_version (user_id, widget, version)
+            VALUES ({row}.user_id, '{widget}',
+                    (SELECT coalesce(max(version), 0) + 1 FROM dashboard_version WHERE user_id = {row}.user_id))
+            ON CONFLICT (user_id, widget) DO UPDATE SET version = excluded.version;'''
+
+
+def _dashboard_stamp(table):
+    # Stamping only touches version, which the update triggers do not watch
+    return f'''
+            UPDATE {table} SET version = (SELECT max(version) FROM dashboard_version WHERE user_id = new.user_id)
+            WHERE id = new.id;'''
+
+
+def dashboard_version_triggers(table, widget, columns):
+    """Triggers that bump a user's dashboard version and stamp the changed row with it"""
+    bump, stamp = _dashboard_bump(widget, 'new'), _dashboard_stamp(table)
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {table}_dashboard_ai AFTER INSERT ON {table} BEGIN'
+        f'{bump}{stamp}\n        END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_dashboard_au AFTER UPDATE OF {columns} ON {table} BEGIN'
+        f'{bump}{stamp}\n        END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_dashboard_ad AFTER DELETE ON {table} BEGIN'
+        f'{_dashboard_bump(widget, "old")}\n        END',
+    ]
+
+
+def dashboard_record_triggers(table, widget, columns):
+    """Triggers that record the version a writer gave a row; rows written without one are stamped
+
+    Writers set version to dashboard.next_version() in the statement that
+    writes the row, so a write costs one upsert here and the row is written
+    once. A row inserted or changed without a new version (by hand, say) is
+    bumped and stamped as before.
+    """
+    record = f'''
+            INSERT INTO dashboard_version (user_id, widget, version) VALUES (new.user_id, '{widget}', new.version)
+            ON CONFLICT (user_id, widget) DO UPDATE SET version = excluded.version;'''
+    bump, stamp = _dashboard_bump(widget, 'new'), _dashboard_stamp(table)
+    return [
+        f'DROP TRIGGER IF EXISTS {table}_dashboard_ai',
+        f'DROP TRIGGER IF EXISTS {table}_dashboard_au',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_dashboard_ai AFTER INSERT ON {table} '
+        f'WHEN new.version > 0 BEGIN{record}\n        END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_dashboard_ai_stamp AFTER INSERT ON {table} '
+        f'WHEN new.version = 0 BEGIN{bump}{stamp}\n        END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_dashboard_au AFTER UPDATE OF {columns} ON {table} '
+        f'WHEN new.version > old.version BEGIN{record}\n        END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_dashboard_au_stamp AFTER UPDATE OF {columns} ON {table} '
+        f'WHEN new.version <= old.version BEGIN{bump}{stamp}\n        END',
+    ]
+
+
+MIGRATIONS = [
+    (1, 'Initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS user (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username VARCHAR(150) UNIQUE NOT NULL,
             email VARCHAR(150) UNIQUE NOT NULL,
             password_hash VARCHAR(128)
         )
-    ''')
-    
-    # Create reminders table with correct column names
-    cursor.execute('''
-        CREATE TABLE reminder (
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminder (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             task VARCHAR(300) NOT NULL,
             remind_at DATETIME NOT NULL,
@@ -42,11 +102,9 @@ def create_database():
             user_id INTEGER NOT NULL,
             FOREIGN KEY (user_id) REFERENCES user (id)
         )
-    ''')
-    
-    # Create timers table
-    cursor.execute('''
-        CREATE TABLE timer (
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS timer (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name VARCHAR(100),
             duration INTEGER NOT NULL,
@@ -55,21 +113,17 @@ def create_database():
             user_id INTEGER NOT NULL,
             FOREIGN KEY (user_id) REFERENCES user (id)
         )
-    ''')
-    
-    # Create shopping_item table with correct column names
-    cursor.execute('''
-        CREATE TABLE shopping_item (
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS shopping_item (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             item_name VARCHAR(100) NOT NULL,
             completed BOOLEAN DEFAULT 0,
             user_id INTEGER NOT NULL,
             FOREIGN KEY (user_id) REFERENCES user (id)
         )
-    ''')
-    
-    # Create notes table
-    cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS note (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT,
@@ -78,11 +132,9 @@ def create_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES user (id)
         )
-    ''')
-    
-    # Create todo_item table
-    cursor.execute('''
-        CREATE TABLE todo_item (
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS todo_item (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             task VARCHAR(200) NOT NULL,
             priority VARCHAR(20) DEFAULT 'medium',
@@ -90,11 +142,9 @@ def create_database():
             user_id INTEGER NOT NULL,
             FOREIGN KEY (user_id) REFERENCES user (id)
         )
-    ''')
-    
-    # Create command_history table
-    cursor.execute('''
-        CREATE TABLE command_history (
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS command_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             command VARCHAR(500) NOT NULL,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -102,13 +152,404 @@ def create_database():
             user_id INTEGER NOT NULL,
             FOREIGN KEY (user_id) REFERENCES user (id)
         )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    
-    print("Database created successfully!")
-    print("Tables created: user, reminder, timer, shopping_item, todo_item, command_history")
+        ''',
+    ]),
+    (2, 'Indexes for user-scoped dashboard queries', [
+        'CREATE INDEX IF NOT EXISTS ix_reminder_user_completed_remind_at ON reminder (user_id, completed, remind_at)',
+        'CREATE INDEX IF NOT EXISTS ix_note_user_created_at ON note (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_todo_item_user_completed ON todo_item (user_id, completed)',
+        'CREATE INDEX IF NOT EXISTS ix_shopping_item_user_completed ON shopping_item (user_id, completed)',
+        'CREATE INDEX IF NOT EXISTS ix_timer_user ON timer (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_command_history_user_timestamp ON command_history (user_id, timestamp)',
+    ]),
+    (3, 'Indexes for loading pending reminders and timers', [
+        'CREATE INDEX IF NOT EXISTS ix_reminder_completed_remind_at ON reminder (completed, remind_at)',
+        'CREATE INDEX IF NOT EXISTS ix_timer_active ON timer (active)',
+    ]),
+    (4, 'Counted store of unrecognized commands', [
+        '''
+        CREATE TABLE IF NOT EXISTS unrecognized_command (
+            command VARCHAR(500) PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 1,
+            first_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_seen DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS ix_unrecognized_command_count ON unrecognized_command (count)',
+    ]),
+    (5, 'Local knowledge index with full-text search', [
+        '''
+        CREATE TABLE IF NOT EXISTS article (
+            id INTEGER PRIMARY KEY,
+            title_key VARCHAR(300) UNIQUE NOT NULL,
+            title VARCHAR(300) NOT NULL,
+            abstract TEXT NOT NULL,
+            url VARCHAR(500),
+            source VARCHAR(50),
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS article_fts USING fts5(
+            title, abstract, content='article', content_rowid='id',
+            tokenize='porter unicode61 remove_diacritics 2'
+        )
+        ''',
+        # Keep the external-content FTS index in step with article
+        '''
+        CREATE TRIGGER IF NOT EXISTS article_ai AFTER INSERT ON article BEGIN
+            INSERT INTO article_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS article_ad AFTER DELETE ON article BEGIN
+            INSERT INTO article_fts (article_fts, rowid, title, abstract)
+            VALUES ('delete', old.id, old.title, old.abstract);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS article_au AFTER UPDATE ON article BEGIN
+            INSERT INTO article_fts (article_fts, rowid, title, abstract)
+            VALUES ('delete', old.id, old.title, old.abstract);
+            INSERT INTO article_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+        END
+        ''',
+    ]),
+    (6, "Full-text search over each user's notes, to-dos, shopping and history", [
+        # One row per searchable source row; kind names the source table (see user_search.KINDS)
+        '''
+        CREATE TABLE IF NOT EXISTS search_document (
+            id INTEGER PRIMARY KEY,
+            kind VARCHAR(20) NOT NULL,
+            source_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            body TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (kind, source_id)
+        )
+        ''',
+        # user_id and kind are indexed so scoping a search is part of the match
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+            body, kind, user_id, content='search_document', content_rowid='id',
+            tokenize='porter unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS search_document_ai AFTER INSERT ON search_document BEGIN
+            INSERT INTO search_fts (rowid, body, kind, user_id) VALUES (new.id, new.body, new.kind, new.user_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS search_document_ad AFTER DELETE ON search_document BEGIN
+            INSERT INTO search_fts (search_fts, rowid, body, kind, user_id)
+            VALUES ('delete', old.id, old.body, old.kind, old.user_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS search_document_au AFTER UPDATE ON search_document BEGIN
+            INSERT INTO search_fts (search_fts, rowid, body, kind, user_id)
+            VALUES ('delete', old.id, old.body, old.kind, old.user_id);
+            INSERT INTO search_fts (rowid, body, kind, user_id) VALUES (new.id, new.body, new.kind, new.user_id);
+        END
+        ''',
+        # Index what is already there, oldest first so ids follow creation order
+        '''
+        INSERT INTO search_document (kind, source_id, user_id, body, created_at)
+        SELECT kind, source_id, user_id, body, created_at FROM (
+            SELECT 'note' AS kind, id AS source_id, user_id,
+                   trim(coalesce(title, '') || ' ' || content) AS body, created_at FROM note
+            UNION ALL
+            SELECT 'todo', id, user_id, task, CURRENT_TIMESTAMP FROM todo_item
+            UNION ALL
+            SELECT 'shopping', id, user_id, item_name, CURRENT_TIMESTAMP FROM shopping_item
+            UNION ALL
+            SELECT 'command', id, user_id, command, timestamp FROM command_history
+        ) ORDER BY created_at, kind, source_id
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS note_search_ai AFTER INSERT ON note BEGIN
+            INSERT INTO search_document (kind, source_id, user_id, body, created_at)
+            VALUES ('note', new.id, new.user_id, trim(coalesce(new.title, '') || ' ' || new.content),
+                    coalesce(new.created_at, CURRENT_TIMESTAMP));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS note_search_au AFTER UPDATE OF title, content ON note BEGIN
+            UPDATE search_document SET body = trim(coalesce(new.title, '') || ' ' || new.content)
+            WHERE kind = 'note' AND source_id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS note_search_ad AFTER DELETE ON note BEGIN
+            DELETE FROM search_document WHERE kind = 'note' AND source_id = old.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS todo_item_search_ai AFTER INSERT ON todo_item BEGIN
+            INSERT INTO search_document (kind, source_id, user_id, body) VALUES ('todo', new.id, new.user_id, new.task);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS todo_item_search_au AFTER UPDATE OF task ON todo_item BEGIN
+            UPDATE search_document SET body = new.task WHERE kind = 'todo' AND source_id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS todo_item_search_ad AFTER DELETE ON todo_item BEGIN
+            DELETE FROM search_document WHERE kind = 'todo' AND source_id = old.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS shopping_item_search_ai AFTER INSERT ON shopping_item BEGIN
+            INSERT INTO search_document (kind, source_id, user_id, body)
+            VALUES ('shopping', new.id, new.user_id, new.item_name);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS shopping_item_search_au AFTER UPDATE OF item_name ON shopping_item BEGIN
+            UPDATE search_document SET body = new.item_name WHERE kind = 'shopping' AND source_id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS shopping_item_search_ad AFTER DELETE ON shopping_item BEGIN
+            DELETE FROM search_document WHERE kind = 'shopping' AND source_id = old.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS command_history_search_ai AFTER INSERT ON command_history BEGIN
+            INSERT INTO search_document (kind, source_id, user_id, body, created_at)
+            VALUES ('command', new.id, new.user_id, new.command, coalesce(new.timestamp, CURRENT_TIMESTAMP));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS command_history_search_ad AFTER DELETE ON command_history BEGIN
+            DELETE FROM search_document WHERE kind = 'command' AND source_id = old.id;
+        END
+        ''',
+    ]),
+    (7, 'Intent of each command and daily usage rollups', [
+        'ALTER TABLE command_history ADD COLUMN intent VARCHAR(50)',
+        # Filled from command_history by retention.rollup(); /stats reads only this
+        '''
+        CREATE TABLE IF NOT EXISTS command_usage_daily (
+            user_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            intent VARCHAR(50) NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, intent)
+        ) WITHOUT ROWID
+        ''',
+        # Last source row folded into each rollup table
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name VARCHAR(50) PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (8, 'Per-user dashboard change versions', [
+        # Last version each of a user's widgets changed at; the user's version is the max
+        '''
+        CREATE TABLE IF NOT EXISTS dashboard_version (
+            user_id INTEGER NOT NULL,
+            widget VARCHAR(20) NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (user_id, widget)
+        ) WITHOUT ROWID
+        ''',
+        # Rows already there predate every version a client can hold
+        *(f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0' for table, _, _ in DASHBOARD_TABLES),
+        *(statement for table, widget, columns in DASHBOARD_TABLES
+          for statement in dashboard_version_triggers(table, widget, columns)),
+    ]),
+    (9, 'Index only the text of search documents, numbered per user; index history in batches', [
+        # user_search.index_history indexes history with each batch the history writer commits
+        'DROP TRIGGER IF EXISTS command_history_search_ai',
+        'DROP TRIGGER IF EXISTS note_search_ai',
+        'DROP TRIGGER IF EXISTS todo_item_search_ai',
+        'DROP TRIGGER IF EXISTS shopping_item_search_ai',
+        'DROP TRIGGER IF EXISTS search_document_ai',
+        'DROP TRIGGER IF EXISTS search_document_ad',
+        'DROP TRIGGER IF EXISTS search_document_au',
+        'DROP TABLE IF EXISTS search_fts',
+        # Give each user's documents their own id range, keeping their order
+        'CREATE TEMP TABLE search_renumber (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)',
+        f'''
+        INSERT INTO search_renumber (old_id, new_id)
+        SELECT id, (user_id << {ID_BITS}) + row_number() OVER (PARTITION BY user_id ORDER BY id)
+        FROM search_document
+        ''',
+        'UPDATE search_document SET id = (SELECT new_id FROM search_renumber WHERE old_id = search_document.id)',
+        'DROP TABLE search_renumber',
+        # Only the text is indexed; a user's documents are a rowid range of it
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+            body, content='search_document', content_rowid='id',
+            tokenize='porter unicode61 remove_diacritics 2'
+        )
+        ''',
+        "INSERT INTO search_fts (search_fts) VALUES ('rebuild')",
+        '''
+        CREATE TRIGGER IF NOT EXISTS search_document_ai AFTER INSERT ON search_document BEGIN
+            INSERT INTO search_fts (rowid, body) VALUES (new.id, new.body);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS search_document_ad AFTER DELETE ON search_document BEGIN
+            INSERT INTO search_fts (search_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS search_document_au AFTER UPDATE OF body ON search_document BEGIN
+            INSERT INTO search_fts (search_fts, rowid, body) VALUES ('delete', old.id, old.body);
+            INSERT INTO search_fts (rowid, body) VALUES (new.id, new.body);
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS note_search_ai AFTER INSERT ON note BEGIN
+            INSERT INTO search_document (id, kind, source_id, user_id, body, created_at)
+            VALUES ({next_document_id('new.user_id')}, 'note', new.id, new.user_id,
+                    trim(coalesce(new.title, '') || ' ' || new.content), coalesce(new.created_at, CURRENT_TIMESTAMP));
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS todo_item_search_ai AFTER INSERT ON todo_item BEGIN
+            INSERT INTO search_document (id, kind, source_id, user_id, body)
+            VALUES ({next_document_id('new.user_id')}, 'todo', new.id, new.user_id, new.task);
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS shopping_item_search_ai AFTER INSERT ON shopping_item BEGIN
+            INSERT INTO search_document (id, kind, source_id, user_id, body)
+            VALUES ({next_document_id('new.user_id')}, 'shopping', new.id, new.user_id, new.item_name);
+        END
+        ''',
+    ]),
+    (10, 'Dashboard versions set by the writing statement instead of a second UPDATE', [
+        *(statement for table, widget, columns in DASHBOARD_TABLES
+          for statement in dashboard_record_triggers(table, widget, columns)),
+    ]),
+    (11, 'Queue notes, to-dos and shopping items for batched search indexing', [
+        # user_search.index adds the queue to search_fts in one write
+        '''
+        CREATE TABLE IF NOT EXISTS search_pending (
+            id INTEGER PRIMARY KEY,
+            kind VARCHAR(20) NOT NULL,
+            source_id INTEGER NOT NULL
+        )
+        ''',
+        'DROP TRIGGER IF EXISTS note_search_ai',
+        'DROP TRIGGER IF EXISTS todo_item_search_ai',
+        'DROP TRIGGER IF EXISTS shopping_item_search_ai',
+        *(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO search_pending (kind, source_id) VALUES ('{kind}', new.id);
+        END
+        ''' for kind, table in (('note', 'note'), ('todo', 'todo_item'), ('shopping', 'shopping_item'))),
+    ]),    (12, 'Index notes, to-dos and shopping items from their own tables instead of a queue', [
+        # user_search.index_pending finds the rows past the last one indexed of each kind,
+        # so whatever is still queued is indexed without the queue
+        'DROP TRIGGER IF EXISTS note_search_ai',
+        'DROP TRIGGER IF EXISTS todo_item_search_ai',
+        'DROP TRIGGER IF EXISTS shopping_item_search_ai',
+        'DROP TABLE IF EXISTS search_pending',
+    ]),
+]
+
+# Queries on the request path that must be served from an index
+HOT_QUERIES = [
+    ('SELECT * FROM user WHERE email = ?', (None,)),
+    ('SELECT id FROM user WHERE email = ? OR username = ?', (None, None)),
+] + [(sql, (None, 1)) for sql in WIDGET_QUERIES.values()] + [
+    (sql, ()) for sql in PENDING_QUERIES.values()] + [
+    (KNOWLEDGE_QUERIES['title'], ('python',)),
+    (KNOWLEDGE_QUERIES['search'], ('title : ("python")',)),
+    (SEARCH_QUERIES['search'], ('**', '**', 12, '"python"', 1 << 32, 2 << 32, 21)),
+    (SEARCH_QUERIES['search_kinds'], ('**', '**', 12, '"python"', 1 << 32, 2 << 32, '["note"]', 21)),
+    (HISTORY_QUERIES['unindexed'], ()),
+    (HISTORY_QUERIES['last_document'], (1 << 32, 1 << 32, 2 << 32)),
+    (INDEX_QUERIES['pending'], ()),
+    (RETENTION_QUERIES['stats'], (1, '2024-01-01')),
+    (VERSION_QUERIES['version'], (1,)),
+    (VERSION_QUERIES['changed'], (1, 0))]
+
+
+def schema_version(conn):
+    """Return the last migration applied to conn"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration, each in its own transaction"""
+    applied = []
+    current = schema_version(conn)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+def create_database():
+    """Create the database or upgrade it to the latest schema"""
+    conn = db.get_connection()
+    try:
+        before = schema_version(conn)
+        applied = migrate(conn)
+    finally:
+        conn.close()
+
+    for version, description in applied:
+        print(f"Applied migration {version}: {description}")
+    if applied:
+        print(f"Database upgraded from version {before} to {applied[-1][0]}")
+    else:
+        print(f"Database is up to date (version {before})")
+
+
+def full_scans(conn, queries=None):
+    """Return (query, plan detail) for every hot query that scans a table"""
+    problems = []
+    for sql, params in queries or HOT_QUERIES:
+        for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+            detail = row['detail']
+            # FTS5 tables report a SCAN even when their full-text index is used,
+            # and a SELECT without FROM scans its one constant row
+            if detail.startswith('SCAN ') and 'VIRTUAL TABLE INDEX' not in detail and detail != 'SCAN CONSTANT ROW':
+                problems.append((sql, detail))
+    return problems
+
+
+def check_query_plans():
+    """Print the plan check result and return a process exit status"""
+    conn = db.get_connection()
+    try:
+        migrate(conn)
+        problems = full_scans(conn)
+    finally:
+        conn.close()
+
+    for sql, detail in problems:
+        print(f"FULL SCAN: {sql}\n    {detail}")
+    if problems:
+        return 1
+    print(f"All {len(HOT_QUERIES)} hot queries use an index")
+    return 0
+
 
 if __name__ == "__main__":
+    if '--check-plans' in sys.argv[1:]:
+        sys.exit(check_query_plans())
     create_database()
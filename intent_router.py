@@ -0,0 +1,341 @@
+"""
+Intent routing for Darek AI
+
+Handlers register the phrases that trigger them and the router compiles every
+phrase into a single regular expression, so a command is matched in one scan
+no matter how many intents exist.
+
+A handler can be registered as a 'module:function' string instead of a
+callable. The module, and whatever it imports, is then loaded the first time
+the intent is used, so heavy dependencies stay out of worker startup.
+
+An intent registered as pure answers from its command text alone, so its
+replies are kept in an LRU memo keyed on the whitespace-normalized command and
+a repeated command skips the handler. A pure handler with several possible
+replies returns them all as Choices; the memo keeps the candidates and one is
+picked at random on every call, so replies keep their variety.
+"""
+
+import importlib
+import os
+import random
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+import metrics
+
+# Distinct phrase combinations whose winning intent is remembered
+_RESOLVED_CACHE_SIZE = 4096
+
+# Replies of pure intents kept per process; 0 turns the memo off
+MEMO_SIZE = int(os.getenv('DAREK_INTENT_MEMO_SIZE', '4096'))
+
+# Serializes first-use imports so a handler module is only loaded once
+_load_lock = threading.RLock()
+
+
+def _import(path):
+    """The attribute named by a 'module:attribute' path"""
+    module_name, _, attribute = path.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class Choices(tuple):
+    """Equally good replies of a pure handler; each call answers with one at random"""
+
+
+def reply_size(reply):
+    """Approximate bytes held by a memoized reply"""
+    if isinstance(reply, tuple):
+        return sys.getsizeof(reply) + sum(sys.getsizeof(choice) for choice in reply)
+    return sys.getsizeof(reply)
+
+
+class ResultMemo:
+    """Bounded LRU of pure intents' replies, keyed on (intent, normalized command)"""
+
+    def __init__(self, max_entries=MEMO_SIZE):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.bytes = 0
+        # intent name -> [hits, misses]
+        self.counts = {}
+        # (intent name, command) -> (reply, size)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name, command, compute):
+        """The memoized reply for command, calling compute(command) on a miss"""
+        key = (name, command)
+        with self._lock:
+            entry = self._entries.get(key)
+            counts = self.counts.setdefault(name, [0, 0])
+            if entry is not None:
+                self._entries.move_to_end(key)
+                counts[0] += 1
+                return entry[0]
+            counts[1] += 1
+        reply = compute(command)
+        if self.max_entries > 0:
+            size = sys.getsizeof(command) + reply_size(reply)
+            with self._lock:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self.bytes -= previous[1]
+                self._entries[key] = (reply, size)
+                self.bytes += size
+                while len(self._entries) > self.max_entries:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.bytes -= evicted
+                    self.evictions += 1
+        return reply
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            hits = sum(counts[0] for counts in self.counts.values())
+            misses = sum(counts[1] for counts in self.counts.values())
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self.bytes,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+                'evictions': self.evictions,
+                'intents': {name: {'hits': h, 'misses': m, 'hit_rate': round(h / (h + m), 4)}
+                            for name, (h, m) in sorted(self.counts.items())},
+            }
+
+    def counters(self):
+        """Hits and misses per intent, as metrics counter rows"""
+        with self._lock:
+            counts = [(name, list(pair)) for name, pair in self.counts.items()]
+        rows = []
+        for name, (hits, misses) in counts:
+            rows.append(('darek_intent_memo_hits_total', 'intent', name, hits))
+            rows.append(('darek_intent_memo_misses_total', 'intent', name, misses))
+        return rows
+
+
+memo = ResultMemo()
+metrics.add_collector(memo.counters)
+
+
+class Intent:
+    """A registered intent and the phrases that trigger it"""
+
+    def __init__(self, name, handler, triggers, requires=(), priority=100, io_bound=False, writes=False,
+                 pure=False, stream=None):
+        self.name = name
+        self._handler = handler
+        self.triggers = tuple(triggers)
+        # Every group in `requires` must have at least one phrase present
+        self.requires = tuple(tuple(group) for group in requires)
+        self.priority = priority
+        # Blocks on the network or the database, so async callers run it off-loop
+        self.io_bound = io_bound
+        # Writes the user's data, so a batch runs it in order inside its transaction
+        self.writes = writes
+        # The reply depends on nothing but the command text, see ResultMemo
+        self.pure = pure
+        # Optional generator yielding the reply in pieces, see IntentRouter.stream
+        self._stream = stream
+
+    def __repr__(self):
+        return f'<Intent {self.name} priority={self.priority}>'
+
+    @property
+    def loaded(self):
+        return not isinstance(self._handler, str)
+
+    @property
+    def handler(self):
+        """The handler callable, importing its module on first access"""
+        if not self.loaded:
+            with _load_lock:
+                if not self.loaded:
+                    self._handler = _import(self._handler)
+        return self._handler
+
+    @property
+    def stream(self):
+        """The streaming generator or None, importing its module on first access"""
+        if isinstance(self._stream, str):
+            with _load_lock:
+                if isinstance(self._stream, str):
+                    self._stream = _import(self._stream)
+        return self._stream
+
+    @stream.setter
+    def stream(self, generator):
+        self._stream = generator
+
+    def __call__(self, darek, command, user_id=None):
+        # Resolving here means the first-use import runs on the calling thread
+        with metrics.timed('intent', self.name):
+            if not self.pure:
+                return self.handler(darek, command, user_id)
+            # The handler sees the normalized text, so the reply matches the key
+            reply = memo.get(self.name, ' '.join(command.split()),
+                             lambda normalized: self.handler(darek, normalized, user_id))
+            if isinstance(reply, Choices):
+                return random.choice(reply)
+            return reply
+
+
+class IntentRouter:
+    """Match commands against all registered intents with one compiled pattern"""
+
+    def __init__(self):
+        self.intents = []
+        self._pattern = None
+        self._implied = {}
+        self._by_phrase = {}
+        self._single = {}
+        self._resolved = {}
+
+    def intent(self, name, triggers, requires=(), priority=100, io_bound=False, writes=False, pure=False):
+        """Decorator that registers a handler for the given trigger phrases"""
+        def decorator(handler):
+            self.register(name, handler, triggers, requires, priority, io_bound, writes, pure)
+            return handler
+        return decorator
+
+    def register(self, name, handler, triggers, requires=(), priority=100, io_bound=False, writes=False,
+                 pure=False, stream=None):
+        """Register a handler, or a 'module:function' path to load on first use
+
+        stream, likewise a callable or a path, is the intent's streaming
+        generator (see stream()).
+        """
+        if any(intent.name == name for intent in self.intents):
+            raise ValueError(f"Intent '{name}' is already registered")
+        self.intents.append(Intent(name, handler, triggers, requires, priority, io_bound, writes, pure, stream))
+        self._pattern = None
+
+    def stream(self, name):
+        """Decorator that attaches a streaming generator to a registered intent"""
+        def decorator(generator):
+            intent = self.get(name)
+            if intent is None:
+                raise ValueError(f"Intent '{name}' is not registered")
+            intent.stream = generator
+            return generator
+        return decorator
+
+    def get(self, name):
+        """Return the intent registered under name, or None"""
+        for intent in self.intents:
+            if intent.name == name:
+                return intent
+        return None
+
+    def load(self, names=None):
+        """Import the handlers of the named intents (all if None) ahead of use"""
+        loaded = []
+        for intent in self.intents:
+            if names is None or intent.name in names:
+                intent.handler
+                loaded.append(intent.name)
+        return loaded
+
+    def compile(self):
+        """Build the combined pattern and the phrase lookup tables"""
+        phrases = set()
+        for intent in self.intents:
+            phrases.update(intent.triggers)
+            for group in intent.requires:
+                phrases.update(group)
+
+        # Phrases are matched on word boundaries, leftmost-longest, so a phrase
+        # that contains other phrases ("good morning" / "good") implies them.
+        self._implied = {}
+        for phrase in phrases:
+            self._implied[phrase] = frozenset(
+                other for other in phrases
+                if re.search(r'\b' + re.escape(other) + r'\b', phrase)
+            )
+
+        self._by_phrase = {}
+        for intent in sorted(self.intents, key=lambda i: i.priority):
+            for phrase in intent.triggers:
+                self._by_phrase.setdefault(phrase, []).append(intent)
+
+        # Most commands hold one phrase; its intent is settled here, once
+        self._single = {phrase: self._resolve(implied) for phrase, implied in self._implied.items()}
+
+        self._resolved = {}
+        # ASCII word boundaries are noticeably faster and every trigger is ASCII
+        self._pattern = re.compile(r'\b(' + _trie_pattern(phrases) + r')\b', re.ASCII)
+        return self._pattern
+
+    def phrases_in(self, command):
+        """Return every registered phrase that occurs in command"""
+        if self._pattern is None:
+            self.compile()
+        matched = self._pattern.findall(command)
+        if len(matched) == 1:
+            return self._implied[matched[0]]
+        return frozenset().union(*[self._implied[phrase] for phrase in matched])
+
+    def match(self, command):
+        """Return the highest-priority intent for command, or None"""
+        if self._pattern is None:
+            self.compile()
+        matched = self._pattern.findall(command)
+        if len(matched) == 1:
+            return self._single[matched[0]]
+        if not matched:
+            return None
+        found = frozenset().union(*[self._implied[phrase] for phrase in matched])
+        try:
+            return self._resolved[found]
+        except KeyError:
+            pass
+        if len(self._resolved) >= _RESOLVED_CACHE_SIZE:
+            self._resolved.clear()
+        best = self._resolve(found)
+        self._resolved[found] = best
+        return best
+
+    def _resolve(self, found):
+        """Pick the highest-priority intent whose phrases are all in found"""
+        best = None
+        for phrase in found:
+            for intent in self._by_phrase.get(phrase, ()):
+                if best is not None and intent.priority >= best.priority:
+                    break
+                if all(found.intersection(group) for group in intent.requires):
+                    best = intent
+                    break
+        return best
+
+
+def _trie_pattern(phrases):
+    """Return a regex alternation for phrases with shared prefixes factored out"""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = None
+
+    def build(node):
+        branches = [re.escape(char) + build(child)
+                    for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        if '' in node:
+            return '(?:' + '|'.join(branches) + ')?'
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    return build(trie)
@@ -0,0 +1,9 @@
+"""
+Intent handlers loaded on first use
+
+Each module here holds handlers whose dependencies are too heavy to import at
+startup. darek_core registers them with the router by 'module:function' path,
+so a module and its imports are only loaded when one of its intents is first
+matched (or listed in DAREK_WARM_INTENTS). Handlers take the same arguments
+as the Darek._handle_* methods: (darek, command, user_id=None).
+"""
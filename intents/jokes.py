@@ -0,0 +1,14 @@
+"""Jokes from pyjokes"""
+
+import pyjokes
+
+from intent_router import Choices
+
+
+def handle_joke(darek, command, user_id=None):
+    # Every joke is a candidate; the memo keeps the list and picks one per call
+    try:
+        response = Choices(pyjokes.get_jokes())
+    except:
+        response = "😄 Why don't scientists trust atoms? Because they make up everything!"
+    return response
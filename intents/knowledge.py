@@ -0,0 +1,32 @@
+"""Wikipedia lookups: the local knowledge index first, then the Wikipedia API
+
+wikipedia (which pulls in BeautifulSoup) is only imported on the first local miss.
+"""
+
+import knowledge_index
+
+
+def handle_wikipedia(darek, command, user_id=None):
+    return ''.join(stream_wikipedia(darek, command, user_id))
+
+
+def stream_wikipedia(darek, command, user_id=None):
+    """Yield a local article at once, and only ask the Wikipedia API on a miss"""
+    query = command.replace('search', '').replace('wikipedia', '').strip()
+    article = knowledge_index.lookup(query)
+    if article is not None:
+        yield f"Here's what I found about {query}: {knowledge_index.first_sentences(article['abstract'])}"
+        return
+
+    import wikipedia
+    try:
+        summary = wikipedia.summary(query, sentences=2)
+        knowledge_index.remember(query, summary, source='wikipedia')
+        response = f"Here's what I found about {query}: {summary}"
+    except wikipedia.exceptions.DisambiguationError as e:
+        response = f"Multiple results found for {query}. Try being more specific."
+    except wikipedia.exceptions.PageError:
+        response = f"Sorry, I could not find a Wikipedia page for {query}."
+    except Exception as e:
+        response = f"An error occurred: {e}"
+    yield response
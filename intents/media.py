@@ -0,0 +1,17 @@
+"""YouTube playback through pywhatkit"""
+
+try:
+    import pywhatkit
+except Exception:
+    # pywhatkit reads $DISPLAY at import time and fails on headless servers
+    pywhatkit = None
+
+
+def handle_play(darek, command, user_id=None):
+    song = command.replace('play', '').strip()
+    response = f"🎵 Playing {song} on YouTube."
+    try:
+        pywhatkit.playonyt(song)
+    except:
+        response = f"🎵 I would play {song} for you, but there was an issue opening YouTube."
+    return response
@@ -0,0 +1,33 @@
+"""Phrase translation backed by the compiled phrasebook index"""
+
+import re
+
+from phrasebook import phrasebook
+
+# "... to <language>" at the end of a translate request
+TRANSLATE_TARGET = re.compile(r'\s+(?:to|into|in)\s+([a-z]+)\W*$')
+
+
+def handle_translate(darek, command, user_id=None):
+    # Phrases come from translations.json, compiled once into phrasebook
+    try:
+        match = TRANSLATE_TARGET.search(command)
+        target_lang = match.group(1) if match and match.group(1) in phrasebook.languages else None
+        text_to_translate = command[:match.start()].replace('translate', '', 1).strip(" '\"") if target_lang else ''
+        
+        if target_lang and text_to_translate:
+            translation, source_lang, unknown = phrasebook.translate(text_to_translate, target_lang)
+            if source_lang is None:
+                available_phrases = ', '.join(phrasebook.phrases(target_lang, limit=8))
+                response = f"🌐 I can translate these phrases to {target_lang.title()}: {available_phrases}"
+            else:
+                response = f"🌐 Translation: '{text_to_translate}' in {target_lang.title()} is '{translation}'"
+                if unknown:
+                    response += f" (I don't know: {', '.join(unknown)})"
+        else:
+            supported_langs = ', '.join(phrasebook.languages)
+            response = f"🌐 I support translation to: {supported_langs}. Try: 'translate hello to German' or 'translate thank you to Japanese'"
+            
+    except Exception as e:
+        response = "🌐 Translation service temporarily unavailable. Try: 'translate hello to German'"
+    return response
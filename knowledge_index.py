@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Local knowledge index for the search and wikipedia intents
+
+Articles (a title, a short abstract and a source URL) live in the article
+table with an FTS5 index over title and abstract, so "what is python" is
+answered from the local database instead of a Wikipedia or DuckDuckGo round
+trip. A query is looked up by exact title first, then by BM25 over titles that
+contain every word of the query; anything looser is treated as a miss so the
+network can give a better answer. Answers fetched on a miss are written back.
+
+The index is filled from a Wikipedia abstracts dump or a JSON-lines file of
+{"title", "abstract", "url"} objects (either may be gzipped):
+
+    python knowledge_index.py load enwiki-latest-abstract.xml.gz
+    python knowledge_index.py load abstracts.jsonl --source dbpedia
+    python knowledge_index.py search "python programming language"
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+
+import db
+from batch_writer import BatchWriter
+
+QUERIES = {
+    'title': 'SELECT title, abstract, url, source FROM article WHERE title_key = ?',
+    'search': '''
+        SELECT a.title, a.abstract, a.url, a.source
+        FROM article_fts JOIN article a ON a.id = article_fts.rowid
+        WHERE article_fts MATCH ?
+        ORDER BY bm25(article_fts, 10.0, 1.0)
+        LIMIT 1
+    ''',
+}
+
+UPSERT = '''
+    INSERT INTO article (title_key, title, abstract, url, source) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (title_key) DO UPDATE SET
+        title = excluded.title, abstract = excluded.abstract, url = excluded.url,
+        source = excluded.source, updated_at = CURRENT_TIMESTAMP
+'''
+
+# Queries with more words than this are left to the network
+MAX_QUERY_WORDS = 8
+# Dump abstracts shorter than this are usually infobox debris
+MIN_ABSTRACT_LENGTH = 40
+
+_WORD = re.compile(r'\w+')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+# Answers fetched from the network, written back in the background
+article_writer = BatchWriter(UPSERT, name='knowledge-index')
+
+
+def normalize(text):
+    """Case-folded words of text, the key articles are stored under"""
+    return ' '.join(_WORD.findall(text.casefold()))
+
+
+def title_match(key):
+    """FTS5 query requiring every word of key in the title"""
+    return 'title : (' + ' AND '.join(f'"{word}"' for word in key.split()) + ')'
+
+
+def first_sentences(text, count=2):
+    """The first count sentences of text"""
+    return ' '.join(_SENTENCE_END.split(text.strip())[:count])
+
+
+def lookup(query):
+    """Best local article for query as a dict, or None on a miss"""
+    key = normalize(query)
+    if not key or len(key.split()) > MAX_QUERY_WORDS:
+        return None
+    conn = db.get_connection()
+    try:
+        row = conn.execute(QUERIES['title'], (key,)).fetchone()
+        if row is None:
+            row = conn.execute(QUERIES['search'], (title_match(key),)).fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return dict(row) if row is not None else None
+
+
+def remember(query, abstract, url=None, source=None, title=None):
+    """Store a network answer for query so the next lookup is local"""
+    key = normalize(query)
+    if key and abstract:
+        article_writer.put((key, title or query.strip().title(), abstract, url, source))
+
+
+def read_abstracts_xml(f):
+    """(title, abstract, url) from a Wikipedia abstracts dump, streamed"""
+    # Only the loader needs these; workers import this module at startup
+    from xml.etree import ElementTree
+    context = ElementTree.iterparse(f, events=('start', 'end'))
+    _, root = next(context)
+    for event, element in context:
+        if event != 'end' or element.tag != 'doc':
+            continue
+        title = element.findtext('title', '')
+        if title.startswith('Wikipedia: '):
+            title = title[len('Wikipedia: '):]
+        yield title, element.findtext('abstract', ''), element.findtext('url', '')
+        # Parsed documents would otherwise pile up under the root element
+        root.clear()
+
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            item = json.loads(line)
+            yield item.get('title', ''), item.get('abstract', ''), item.get('url')
+
+
+def read_dump(path):
+    """(title, abstract, url) for every article in a dump file"""
+    import gzip
+    opener = gzip.open if path.endswith('.gz') else open
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.xml'):
+        with opener(path, 'rb') as f:
+            yield from read_abstracts_xml(f)
+    else:
+        with opener(path, 'rt', encoding='utf-8') as f:
+            yield from read_jsonl(f)
+
+
+def load(path, source='wikipedia', batch_size=5000):
+    """Upsert every usable article in path into the index; returns the count"""
+    conn = db.get_connection()
+    loaded = 0
+    try:
+        batch = []
+        for title, abstract, url in read_dump(path):
+            abstract = (abstract or '').strip()
+            key = normalize(title or '')
+            if not key or len(abstract) < MIN_ABSTRACT_LENGTH or abstract[0] in '|{':
+                continue
+            batch.append((key, title.strip(), abstract, url, source))
+            if len(batch) >= batch_size:
+                conn.executemany(UPSERT, batch)
+                conn.commit()
+                loaded += len(batch)
+                batch = []
+        if batch:
+            conn.executemany(UPSERT, batch)
+            loaded += len(batch)
+        # Merge the FTS segments written batch by batch into one
+        conn.execute("INSERT INTO article_fts (article_fts) VALUES ('optimize')")
+        conn.commit()
+    finally:
+        conn.close()
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query the local knowledge index')
+    commands = parser.add_subparsers(dest='command', required=True)
+    load_parser = commands.add_parser('load', help='load a dump of abstracts')
+    load_parser.add_argument('path')
+    load_parser.add_argument('--source', default='wikipedia')
+    search_parser = commands.add_parser('search', help='look a query up locally')
+    search_parser.add_argument('query')
+    args = parser.parse_args()
+
+    from init_db import create_database
+    create_database()
+
+    if args.command == 'load':
+        started = time.perf_counter()
+        count = load(args.path, args.source)
+        print(f"Loaded {count} articles in {time.perf_counter() - started:.1f} s")
+        return 0
+
+    started = time.perf_counter()
+    article = lookup(args.query)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if article is None:
+        print(f"No local article ({elapsed_ms:.2f} ms)")
+        return 1
+    print(f"{article['title']} ({article['source']}, {elapsed_ms:.2f} ms)")
+    print(first_sentences(article['abstract']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Logging pipeline for Darek AI
+
+Modules log through the standard logging module under the 'darek' logger.
+configure() routes those records through a bounded in-memory queue to a
+background thread that writes JSON lines to a size-capped, rotated file, so a
+request thread never touches the disk and a full queue drops records instead
+of blocking. Each level can be sampled (DAREK_LOG_SAMPLE=DEBUG=0.01) so
+per-message debug records stay affordable in production.
+
+Several worker processes can share one log file: rotation takes a file lock,
+and a process that finds the file already rotated by another just reopens it.
+"""
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG_LEVEL = os.getenv('DAREK_LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('DAREK_LOG_FILE', os.path.join('logs', 'darek.jsonl'))
+LOG_MAX_BYTES = int(os.getenv('DAREK_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv('DAREK_LOG_BACKUPS', '5'))
+# Records held in memory while the writer catches up; more are dropped
+LOG_QUEUE_SIZE = int(os.getenv('DAREK_LOG_QUEUE_SIZE', '10000'))
+# Comma-separated LEVEL=rate pairs, e.g. "DEBUG=0.01,INFO=0.5"
+LOG_SAMPLE = os.getenv('DAREK_LOG_SAMPLE', '')
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parse_sample_rates(spec):
+    """Parse "DEBUG=0.01,INFO=1" into {logging.DEBUG: 0.01, logging.INFO: 1.0}"""
+    rates = {}
+    for part in spec.split(','):
+        if '=' not in part:
+            continue
+        level, rate = part.split('=', 1)
+        rates[logging.getLevelName(level.strip().upper())] = float(rate)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with extra= fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep each record of a level with that level's probability"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that several processes can append to and rotate"""
+
+    def _rotated_elsewhere(self):
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def doRollover(self):
+        if fcntl is None:
+            return super().doRollover()
+        with open(self.baseFilename + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self.stream is not None and self._rotated_elsewhere():
+                    # Another worker rotated first; follow it to the new file
+                    self.stream.close()
+                    self.stream = self._open()
+                else:
+                    super().doRollover()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class LogPipeline:
+    """Bounded queue plus the background thread that writes it out"""
+
+    def __init__(self, handlers, max_queue=LOG_QUEUE_SIZE):
+        self.handlers = handlers
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.queue = None
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked child inherits the queue but not the writer thread
+                self.queue = queue.Queue(maxsize=self.max_queue)
+                self._listener = logging.handlers.QueueListener(
+                    self.queue, *self.handlers, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def stop(self):
+        """Write out everything queued and stop the writer thread"""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+
+class PipelineHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the pipeline is full"""
+
+    def __init__(self, pipeline):
+        super().__init__(None)
+        self.pipeline = pipeline
+
+    def prepare(self, record):
+        # Keep the traceback apart from the message so it lands in its own field
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        self.pipeline.ensure_started()
+        try:
+            self.pipeline.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.dropped += 1
+
+
+pipeline = None
+
+
+def configure(level=LOG_LEVEL, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS,
+              sample=LOG_SAMPLE):
+    """Send 'darek' records to the rotated JSON-lines file; safe to call again"""
+    global pipeline
+    if pipeline is not None:
+        return pipeline
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    file_handler = SharedRotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                             encoding='utf-8', delay=True)
+    file_handler.setFormatter(JsonFormatter())
+    # Problems still show up on the console
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.WARNING)
+    console_handler.setFormatter(logging.Formatter('%(levelname)s %(name)s: %(message)s'))
+
+    pipeline = LogPipeline([file_handler, console_handler])
+    handler = PipelineHandler(pipeline)
+    handler.addFilter(SamplingFilter(parse_sample_rates(sample)))
+
+    logger = logging.getLogger('darek')
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    logger.propagate = False
+    return pipeline
@@ -12,24 +12,22 @@ document.addEventListener('DOMContentLoaded', () => {
             messageInput.value = '';
             feedback.innerHTML = 'Darek is thinking...';
 
-            fetch('/chat', {
+            fetch('/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({ message: message })
             })
-            .then(response => response.json())
-            .then(data => {
-                const message = data.message || data.error || 'Sorry, I could not process your request.';
-                appendMessage('Darek', message, 'bot');
-                
-                // Add text-to-speech for bot responses
-                if (window.speechManager) {
-                    window.speechManager.speak(message);
+            .then(response => {
+                // Errors (401/400) come back as a single JSON body, not a stream
+                const contentType = response.headers.get('Content-Type') || '';
+                if (!response.body || !contentType.includes('application/x-ndjson')) {
+                    return response.json().then(data => {
+                        finishMessage(null, data.message || data.error || 'Sorry, I could not process your request.');
+                    });
                 }
-                
-                feedback.innerHTML = '';
+                return readStream(response.body.getReader());
             })
             .catch(error => {
                 console.error('Error:', error);
@@ -39,6 +37,62 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Render NDJSON events from /chat/stream as they arrive
+    function readStream(reader) {
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let bubble = null;
+        let partialText = '';
+
+        function handleEvent(event) {
+            if (event.type === 'ack') {
+                feedback.innerHTML = 'Darek is working on it...';
+            } else if (event.type === 'partial') {
+                partialText += event.text;
+                if (!bubble) {
+                    bubble = appendMessage('Darek', partialText, 'bot');
+                } else {
+                    bubble.innerHTML = partialText.replace(/\n/g, '<br>');
+                }
+            } else if (event.type === 'final') {
+                finishMessage(bubble, event.message);
+            }
+        }
+
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.filter(line => line.trim() !== '').forEach(line => handleEvent(JSON.parse(line)));
+                if (done) {
+                    if (buffer.trim() !== '') {
+                        handleEvent(JSON.parse(buffer));
+                    }
+                    return;
+                }
+                return pump();
+            });
+        }
+
+        return pump();
+    }
+
+    function finishMessage(bubble, message) {
+        if (bubble) {
+            bubble.innerHTML = message.replace(/\n/g, '<br>');
+        } else {
+            appendMessage('Darek', message, 'bot');
+        }
+
+        // Add text-to-speech for bot responses
+        if (window.speechManager) {
+            window.speechManager.speak(message);
+        }
+
+        feedback.innerHTML = '';
+    }
+
     function appendMessage(sender, message, type) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${type}-message`;
@@ -50,6 +104,158 @@ document.addEventListener('DOMContentLoaded', () => {
         messageDiv.appendChild(messageContent);
         chatBox.appendChild(messageDiv);
         chatBox.scrollTop = chatBox.scrollHeight;
+        return messageContent;
+    }
+
+    // Reminders and timers are fired by the server and pushed here as they go off
+    function subscribeToEvents() {
+        if (!chatBox || !window.EventSource) {
+            return;
+        }
+        const events = new EventSource('/events');
+        const notify = (e) => {
+            const event = JSON.parse(e.data);
+            appendMessage('Darek', event.message, 'bot');
+            if (window.speechManager) {
+                window.speechManager.speak(event.message);
+            }
+            if (window.Notification && Notification.permission === 'granted') {
+                new Notification('Darek AI', { body: event.message });
+            }
+        };
+        events.addEventListener('reminder', notify);
+        events.addEventListener('timer', notify);
+    }
+
+    if (window.Notification && Notification.permission === 'default') {
+        Notification.requestPermission();
+    }
+    subscribeToEvents();
+
+    // Dashboard lists stay current by polling /api/dashboard for what changed since
+    // the version they show; an unchanged dashboard answers 304 with no body.
+    // The synced state is kept for the tab, so a reload only revalidates it.
+    const DASHBOARD_POLL_MS = 15000;
+    const dashboardGrid = document.querySelector('.dashboard-grid[data-user]');
+    const dashboardLists = document.querySelectorAll('.item-list[data-widget]');
+    const dashboardKey = dashboardGrid ? `darek-dashboard-${dashboardGrid.dataset.user}` : null;
+    const dashboardState = loadDashboardState();
+
+    function loadDashboardState() {
+        try {
+            const saved = dashboardKey && JSON.parse(sessionStorage.getItem(dashboardKey));
+            if (saved && saved.widgets) {
+                return saved;
+            }
+        } catch (error) {
+            // Unreadable state is synced from scratch
+        }
+        return { version: null, etag: null, widgets: null };
+    }
+
+    function saveDashboardState() {
+        try {
+            sessionStorage.setItem(dashboardKey, JSON.stringify(dashboardState));
+        } catch (error) {
+            // Storage full or disabled: the next page load does a full sync
+        }
+    }
+
+    const widgetItems = {
+        reminders: (row) => [row.task + ' - ', timeSpan(row.remind_at)],
+        todos: (row) => [row.task],
+        shopping_items: (row) => [row.item_name],
+        notes: (row) => [row.content + ' - ', timeSpan(row.created_at)],
+        timers: (row) => [`${row.name} - ${row.duration}s`],
+    };
+
+    function timeSpan(text) {
+        const span = document.createElement('span');
+        span.className = 'time';
+        span.textContent = text;
+        return span;
+    }
+
+    function renderWidget(list) {
+        const rows = dashboardState.widgets[list.dataset.widget] || [];
+        const items = rows.map((row) => {
+            const li = document.createElement('li');
+            li.append(...widgetItems[list.dataset.widget](row));
+            return li;
+        });
+        if (!items.length) {
+            const li = document.createElement('li');
+            li.textContent = list.dataset.empty;
+            items.push(li);
+        }
+        list.replaceChildren(...items);
+    }
+
+    // Merge changed rows and reorder each changed widget by the ids it now shows.
+    // Returns false if a listed row is unknown here, so a full reload is needed.
+    function applyDashboardChanges(changes) {
+        const merged = {};
+        for (const [widget, change] of Object.entries(changes)) {
+            const rows = new Map((dashboardState.widgets[widget] || []).map((row) => [row.id, row]));
+            change.rows.forEach((row) => rows.set(row.id, row));
+            if (change.ids.some((id) => !rows.has(id))) {
+                return false;
+            }
+            merged[widget] = change.ids.map((id) => rows.get(id));
+        }
+        Object.assign(dashboardState.widgets, merged);
+        return Object.keys(merged);
+    }
+
+    function syncDashboard(full) {
+        const delta = !full && dashboardState.widgets !== null;
+        const headers = delta ? { 'If-None-Match': dashboardState.etag } : {};
+        const url = delta ? `/api/dashboard?since=${dashboardState.version}` : '/api/dashboard';
+        return fetch(url, { headers: headers, cache: 'no-store' })
+            .then((response) => {
+                if (response.status === 304 || !response.ok) {
+                    return null;
+                }
+                dashboardState.etag = response.headers.get('ETag');
+                return response.json();
+            })
+            .then((data) => {
+                if (!data) {
+                    return;
+                }
+                let changed;
+                if (data.full) {
+                    dashboardState.widgets = data.widgets;
+                    changed = Object.keys(data.widgets);
+                } else {
+                    changed = applyDashboardChanges(data.changes);
+                    if (changed === false) {
+                        return syncDashboard(true);
+                    }
+                }
+                dashboardState.version = data.version;
+                saveDashboardState();
+                dashboardLists.forEach((list) => {
+                    if (changed.includes(list.dataset.widget)) {
+                        renderWidget(list);
+                    }
+                });
+            })
+            .catch((error) => console.error('Error syncing dashboard:', error));
+    }
+
+    if (dashboardKey && dashboardLists.length) {
+        syncDashboard();
+        setInterval(() => {
+            if (!document.hidden) {
+                syncDashboard();
+            }
+        }, DASHBOARD_POLL_MS);
+        document.addEventListener('visibilitychange', () => {
+            if (!document.hidden) {
+                syncDashboard();
+            }
+        });
     }
 
     if (sendButton) {
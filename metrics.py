@@ -0,0 +1,313 @@
+"""
+In-process latency metrics for Darek AI
+
+Code wraps the work it wants measured in `with metrics.timed(family, label):`.
+Each (family, label) pair gets a histogram with fixed, geometrically spaced
+buckets, so recording a sample is one bisect and three additions under a lock
+and memory does not grow with traffic. Percentiles are estimated from the
+buckets when metrics are rendered, never on the request path.
+
+Once configure() has been called, as app.py does, each worker process writes
+a snapshot of its histograms and counters to DAREK_METRICS_DIR every few
+seconds. Scripts that only import the modules keep their numbers to
+themselves. /metrics merges the snapshots of every worker with the live
+numbers of the process serving the scrape and renders them in the Prometheus
+text format.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+ENABLED = os.getenv('DAREK_METRICS', '1') != '0'
+# Where workers leave their snapshots; empty keeps metrics per process
+METRICS_DIR = os.getenv('DAREK_METRICS_DIR', os.path.join('instance', 'metrics'))
+FLUSH_INTERVAL = float(os.getenv('DAREK_METRICS_FLUSH_INTERVAL', '5'))
+# Snapshots of exited workers still count towards totals for this long
+RETENTION = float(os.getenv('DAREK_METRICS_RETENTION', '3600'))
+
+# Bucket upper bounds: 2**(k/2) seconds, from ~1 us to 64 s. Samples above
+# the last bound land in an overflow bucket.
+BOUNDS = tuple(2 ** (k / 2) for k in range(-40, 13))
+
+# Every fourth bound (4**k seconds) is exported as a Prometheus bucket; the
+# exported percentiles still use them all
+EXPORT_EVERY = 4
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# family -> (label name, help text)
+FAMILIES = {
+    'request': ('endpoint', 'Time to handle an HTTP request'),
+    'match': ('intent', 'Time to normalize a command and pick its intent'),
+    'intent': ('intent', 'Time spent in intent handlers'),
+    'db': ('statement', 'Time spent executing SQLite statements and commits'),
+    'upstream': ('upstream', 'Time to answer an upstream lookup, cache hits included'),
+    'http': ('host', 'Time spent on outbound HTTP requests, retries included'),
+}
+
+
+class Histogram:
+    """Bucket counts, sum and error count for one family and label"""
+
+    __slots__ = ('counts', 'sum', 'errors')
+
+    def __init__(self, counts=None, total=0.0, errors=0):
+        self.counts = counts if counts is not None else [0] * (len(BOUNDS) + 1)
+        self.sum = total
+        self.errors = errors
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.errors += other.errors
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating inside its bucket"""
+        total = self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(BOUNDS):
+                    return BOUNDS[-1]
+                lower = BOUNDS[i - 1] if i else 0.0
+                return lower + (BOUNDS[i] - lower) * (rank - seen) / count
+            seen += count
+        return BOUNDS[-1]
+
+
+class Registry:
+    """Histograms and counter collectors of one process"""
+
+    def __init__(self, directory='', flush_interval=FLUSH_INTERVAL, enabled=ENABLED):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._pid = None
+        self._flusher_pid = None
+        atexit.register(self.flush)
+        # Checked at fork time rather than per sample, which would cost a getpid()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A forked child must not count what its parent already reported
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_started(self):
+        with self._lock:
+            self._pid = os.getpid()
+            if self.directory and self._flusher_pid != self._pid:
+                threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+                self._flusher_pid = self._pid
+
+    def observe(self, family, label, seconds, error=False):
+        """Record one sample of family/label taking seconds"""
+        if not self.enabled:
+            return
+        if self._pid is None:
+            self._ensure_started()
+        i = bisect_left(BOUNDS, seconds)
+        with self._lock:
+            histogram = self._histograms.get((family, label))
+            if histogram is None:
+                histogram = self._histograms[family, label] = Histogram()
+            histogram.counts[i] += 1
+            histogram.sum += seconds
+            if error:
+                histogram.errors += 1
+
+    def add_collector(self, collector):
+        """Register a callable returning [(metric, label name, label, value)] counters"""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        """This process's histograms and counters as plain JSON-ready data"""
+        with self._lock:
+            histograms = [[family, label, list(h.counts), h.sum, h.errors]
+                          for (family, label), h in self._histograms.items()]
+        counters = []
+        for collector in self._collectors:
+            counters.extend(list(row) for row in collector())
+        return {'pid': os.getpid(), 'histograms': histograms, 'counters': counters}
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def flush(self):
+        """Write this process's snapshot for other workers to merge"""
+        if not self.directory or self._pid != os.getpid() or not self._histograms:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            partial = self._path(os.getpid()) + '.tmp'
+            with open(partial, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(partial, self._path(os.getpid()))
+        except OSError:
+            pass
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def collect(self):
+        """Merged histograms and counters of every live (or recent) worker"""
+        snapshots = [self.snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json') or name == f'{os.getpid()}.json':
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    if not _pid_alive(int(name[:-5])) and time.time() - os.path.getmtime(path) > RETENTION:
+                        os.remove(path)
+                        continue
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        histograms = {}
+        counters = {}
+        for snapshot in snapshots:
+            for family, label, counts, total, errors in snapshot['histograms']:
+                if len(counts) != len(BOUNDS) + 1:
+                    continue
+                histograms.setdefault((family, label), Histogram()).merge(Histogram(counts, total, errors))
+            for metric, label_name, label, value in snapshot['counters']:
+                key = (metric, label_name, label)
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = Registry()
+
+
+class timed:
+    """Context manager recording how long its block took
+
+    An exception leaving the block, or setting `error = True` inside it,
+    counts the sample as an error.
+    """
+
+    __slots__ = ('family', 'label', 'started', 'error')
+
+    def __init__(self, family, label):
+        self.family = family
+        self.label = label
+        self.error = False
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(self.family, self.label, time.perf_counter() - self.started,
+                         self.error or exc_type is not None)
+        return False
+
+
+def configure(directory=METRICS_DIR):
+    """Share this process's metrics with the other workers through directory"""
+    registry.directory = directory
+    registry._ensure_started()
+    return registry
+
+
+# Record a sample measured by the caller: observe(family, label, seconds, error=False)
+observe = registry.observe
+add_collector = registry.add_collector
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _bound(value):
+    return f'{value:.6g}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    histograms, counters = registry.collect()
+    lines = []
+    for family, (label_name, help_text) in FAMILIES.items():
+        rows = sorted((label, h) for (f, label), h in histograms.items() if f == family)
+        if not rows:
+            continue
+        name = f'darek_{family}_seconds'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for label, h in rows:
+            tag = f'{label_name}="{_escape(label)}"'
+            cumulative = 0
+            for i, (bound, count) in enumerate(zip(BOUNDS, h.counts)):
+                cumulative += count
+                if i % EXPORT_EVERY == 0:
+                    lines.append(f'{name}_bucket{{{tag},le="{_bound(bound)}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{tag},le="+Inf"}} {cumulative + h.counts[-1]}')
+            lines.append(f'{name}_sum{{{tag}}} {h.sum:.9g}')
+            lines.append(f'{name}_count{{{tag}}} {h.count}')
+
+        # Precomputed percentiles for dashboards that do not run histogram_quantile
+        lines.append(f'# HELP {name}_quantile {help_text}, estimated percentiles')
+        lines.append(f'# TYPE {name}_quantile gauge')
+        for label, h in rows:
+            tag = f'{label_name}="{_escape(label)}"'
+            for q in QUANTILES:
+                lines.append(f'{name}_quantile{{{tag},quantile="{q}"}} {h.quantile(q):.9g}')
+
+        errors = f'darek_{family}_errors_total'
+        lines.append(f'# HELP {errors} {help_text} that ended in an error')
+        lines.append(f'# TYPE {errors} counter')
+        for label, h in rows:
+            lines.append(f'{errors}{{{label_name}="{_escape(label)}"}} {h.errors}')
+
+    metric_names = sorted({metric for metric, _, _ in counters})
+    for metric in metric_names:
+        lines.append(f'# TYPE {metric} counter')
+        for (name, label_name, label), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f'{name}{{{label_name}="{_escape(label)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def summary():
+    """Count, error and percentile figures per family and label, for humans"""
+    histograms, _ = registry.collect()
+    result = {}
+    for (family, label), h in sorted(histograms.items()):
+        result.setdefault(family, {})[label] = {
+            'count': h.count,
+            'errors': h.errors,
+            'mean_ms': round(h.sum / h.count * 1000, 3) if h.count else 0.0,
+            **{f'p{round(q * 100)}_ms': round(h.quantile(q) * 1000, 3) for q in QUANTILES},
+        }
+    return result
@@ -0,0 +1,351 @@
+"""
+Compiled phrase index for the translate intent
+
+translations.json lists phrases as rows of equivalent text per language. They
+are compiled into one token trie over every language's text and written to a
+binary index file made only of flat integer arrays and UTF-8 blobs:
+
+- tokens are interned to ids in sorted order, so a token is found by binary
+  search over the token blob instead of through a per-process dict
+- each node's children are a sorted slice of one shared array, searched with
+  bisect
+- terminal nodes point into a table of (phrase, language) matches
+
+Workers mmap the index, so every process shares one copy of it through the
+page cache and nothing is rebuilt unless translations.json changes. Lookup cost
+depends on the length of the input, not on the size of the dictionary.
+
+The same trie serves both directions: a sentence is segmented by longest match
+in any language, the source language is the one covering most of the input,
+and each segment is rewritten in the target language.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+TRANSLATIONS_PATH = os.getenv('DAREK_TRANSLATIONS_PATH',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translations.json'))
+INDEX_PATH = os.getenv('DAREK_PHRASEBOOK_INDEX', os.path.join('instance', 'translations.idx'))
+
+# Token ids remembered per process, so common words skip the binary search
+TOKEN_CACHE_SIZE = 4096
+
+INDEX_MAGIC = b'DAREKPB1'
+INDEX_VERSION = 1
+
+# Scripts written without spaces are matched one character at a time
+_UNSPACED = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff'
+TOKEN_PATTERN = re.compile(f'[{_UNSPACED}]|[^\\s{_UNSPACED}]+')
+UNSPACED_CHARACTER = re.compile(f'[{_UNSPACED}]')
+PUNCTUATION = '.,!?¿¡"“”«»:;()'
+
+# Arrays stored in the index file, in order
+SECTIONS = (
+    ('token_offsets', 'I'), ('token_blob', 'B'),
+    ('text_offsets', 'I'), ('text_blob', 'B'),
+    ('translations', 'i'),
+    ('child_start', 'I'), ('child_tokens', 'I'), ('child_nodes', 'I'),
+    ('match_start', 'I'), ('match_phrases', 'I'), ('match_languages', 'I'),
+)
+
+
+def tokenize(text):
+    """Lowercased tokens with surrounding punctuation removed"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        token = token.strip(PUNCTUATION)
+        if token:
+            tokens.append(token)
+    return tokens
+
+
+def join_tokens(tokens):
+    """Inverse of tokenize, up to punctuation and case"""
+    if all(UNSPACED_CHARACTER.fullmatch(token) for token in tokens):
+        return ''.join(tokens)
+    return ' '.join(tokens)
+
+
+def _pack_strings(strings):
+    offsets = array('I', [0])
+    blob = bytearray()
+    for string in strings:
+        blob += string.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets, array('B', blob)
+
+
+def compile_index(languages, phrases, digest=''):
+    """Compile phrase rows into the bytes of an index file"""
+    names = list(languages)
+    language_ids = {name: i for i, name in enumerate(names)}
+
+    vocabulary = set()
+    texts = {}
+    for row in phrases:
+        for text in row.values():
+            vocabulary.update(tokenize(text))
+            texts.setdefault(text, len(texts))
+
+    # Sorting by encoded bytes lets lookups binary search the token blob
+    tokens_sorted = sorted(vocabulary, key=lambda token: token.encode('utf-8'))
+    token_ids = {token: i for i, token in enumerate(tokens_sorted)}
+
+    translations = array('i', [-1]) * (len(phrases) * len(names))
+    trie = [{}]
+    terminals = {}
+    for phrase_id, row in enumerate(phrases):
+        for name, text in row.items():
+            language_id = language_ids[name]
+            translations[phrase_id * len(names) + language_id] = texts[text]
+            node = 0
+            for token in tokenize(text):
+                token_id = token_ids[token]
+                child = trie[node].get(token_id)
+                if child is None:
+                    child = trie[node][token_id] = len(trie)
+                    trie.append({})
+                node = child
+            terminals.setdefault(node, []).append((phrase_id, language_id))
+
+    sections = {'translations': translations}
+    sections['token_offsets'], sections['token_blob'] = _pack_strings(tokens_sorted)
+    sections['text_offsets'], sections['text_blob'] = _pack_strings(texts)
+    # Children of node n are child_tokens/child_nodes[child_start[n]:child_start[n + 1]]
+    child_start, child_tokens, child_nodes = array('I', [0]), array('I'), array('I')
+    # Matches of node n are match_phrases/match_languages[match_start[n]:match_start[n + 1]]
+    match_start, match_phrases, match_languages = array('I', [0]), array('I'), array('I')
+    for node, children in enumerate(trie):
+        for token_id in sorted(children):
+            child_tokens.append(token_id)
+            child_nodes.append(children[token_id])
+        child_start.append(len(child_tokens))
+        for phrase_id, language_id in terminals.get(node, ()):
+            match_phrases.append(phrase_id)
+            match_languages.append(language_id)
+        match_start.append(len(match_phrases))
+    sections.update(child_start=child_start, child_tokens=child_tokens, child_nodes=child_nodes,
+                    match_start=match_start, match_phrases=match_phrases, match_languages=match_languages)
+
+    header = json.dumps({
+        'version': INDEX_VERSION,
+        'digest': digest,
+        'byteorder': sys.byteorder,
+        'languages': names,
+        'separators': [languages[name].get('separator', ' ') for name in names],
+        'phrase_count': len(phrases),
+        'node_count': len(trie),
+        'lengths': [len(sections[name]) for name, _ in SECTIONS],
+    }).encode('utf-8')
+
+    out = bytearray(INDEX_MAGIC)
+    out += struct.pack('<I', len(header))
+    out += header
+    for name, _ in SECTIONS:
+        out += b'\0' * (-len(out) % 4)
+        out += sections[name].tobytes()
+    return bytes(out)
+
+
+def read_header(buffer):
+    """Header dict of an index buffer, or None if it is not an index"""
+    if buffer[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+        return None
+    start = len(INDEX_MAGIC) + 4
+    (length,) = struct.unpack('<I', buffer[len(INDEX_MAGIC):start])
+    header = json.loads(bytes(buffer[start:start + length]))
+    header['sections_at'] = start + length
+    return header
+
+
+class Segment:
+    """A run of input tokens and the phrases it matched, if any"""
+
+    __slots__ = ('text', 'matches')
+
+    def __init__(self, text, matches):
+        self.text = text
+        self.matches = matches
+
+
+class Phrasebook:
+    """Read-only view over a compiled index held in bytes or an mmap"""
+
+    def __init__(self, buffer):
+        header = read_header(buffer)
+        if header is None or header['version'] != INDEX_VERSION or header['byteorder'] != sys.byteorder:
+            raise ValueError('Not a phrasebook index for this version')
+        self.digest = header['digest']
+        self.languages = header['languages']
+        self.separators = header['separators']
+        self.phrase_count = header['phrase_count']
+        self.node_count = header['node_count']
+        self._language_ids = {name: i for i, name in enumerate(self.languages)}
+        self._buffer = buffer
+
+        view = memoryview(buffer)
+        offset = header['sections_at']
+        starts = {}
+        for (name, typecode), length in zip(SECTIONS, header['lengths']):
+            offset += -offset % 4
+            size = length * array(typecode).itemsize
+            setattr(self, '_' + name, view[offset:offset + size].cast(typecode))
+            starts[name] = offset
+            offset += size
+        self._token_count = len(self._token_offsets) - 1
+        # Slicing the buffer itself yields bytes without a memoryview round trip
+        self._token_blob_at = starts['token_blob']
+        self._text_blob_at = starts['text_blob']
+        self.token_id = lru_cache(maxsize=TOKEN_CACHE_SIZE)(self._find_token)
+
+    @classmethod
+    def build(cls, languages, phrases):
+        """Compile in memory, without an index file"""
+        return cls(compile_index(languages, phrases))
+
+    @classmethod
+    def load(cls, source=TRANSLATIONS_PATH, index=INDEX_PATH):
+        """Map the compiled index for source, rebuilding it if source changed"""
+        with open(source, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+
+        try:
+            with open(index, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            header = read_header(mapped)
+            if header is not None and header['digest'] == digest:
+                return cls(mapped)
+            mapped.close()
+        except (OSError, ValueError):
+            pass
+
+        data = json.loads(raw)
+        compiled = compile_index(data['languages'], data['phrases'], digest)
+        try:
+            directory = os.path.dirname(index)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Write then rename so a worker never maps a half-written file
+            partial = f'{index}.{os.getpid()}.tmp'
+            with open(partial, 'wb') as f:
+                f.write(compiled)
+            os.replace(partial, index)
+        except OSError:
+            pass
+        return cls(compiled)
+
+    def _token(self, token_id):
+        at = self._token_blob_at
+        return self._buffer[at + self._token_offsets[token_id]:at + self._token_offsets[token_id + 1]]
+
+    def _find_token(self, token):
+        """Id of token, or None if no phrase uses it"""
+        encoded = token.encode('utf-8')
+        low, high = 0, self._token_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._token(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._token_count and self._token(low) == encoded:
+            return low
+        return None
+
+    def _text(self, text_id):
+        at = self._text_blob_at
+        return self._buffer[at + self._text_offsets[text_id]:at + self._text_offsets[text_id + 1]].decode('utf-8')
+
+    def _child(self, node, token_id):
+        start, end = self._child_start[node], self._child_start[node + 1]
+        i = bisect_left(self._child_tokens, token_id, start, end)
+        if i < end and self._child_tokens[i] == token_id:
+            return self._child_nodes[i]
+        return None
+
+    def _matches(self, node):
+        start, end = self._match_start[node], self._match_start[node + 1]
+        return [(self._match_phrases[i], self._match_languages[i]) for i in range(start, end)]
+
+    def segment(self, text):
+        """Split text into the longest known phrases, left to right"""
+        tokens = tokenize(text)
+        token_ids = [self.token_id(token) for token in tokens]
+        segments = []
+        position = 0
+        while position < len(tokens):
+            node = 0
+            longest = None
+            for end in range(position, len(tokens)):
+                token_id = token_ids[end]
+                node = None if token_id is None else self._child(node, token_id)
+                if node is None:
+                    break
+                if self._match_start[node] != self._match_start[node + 1]:
+                    longest = (end + 1, node)
+            if longest is None:
+                segments.append(Segment(tokens[position], []))
+                position += 1
+            else:
+                end, node = longest
+                segments.append(Segment(join_tokens(tokens[position:end]), self._matches(node)))
+                position = end
+        return segments
+
+    def detect_language(self, segments):
+        """Language covering the most matched segments, preferring the first listed"""
+        votes = [0] * len(self.languages)
+        for segment in segments:
+            for language_id in {language_id for _, language_id in segment.matches}:
+                votes[language_id] += 1
+        best = max(range(len(votes)), key=lambda i: (votes[i], -i))
+        return self.languages[best] if votes[best] else None
+
+    def translate(self, text, target):
+        """Translate text into target; returns (translation, source, unknown tokens)"""
+        target_id = self._language_ids[target]
+        segments = self.segment(text)
+        source = self.detect_language(segments)
+        source_id = self._language_ids.get(source)
+
+        words = []
+        unknown = []
+        for segment in segments:
+            if not segment.matches:
+                words.append(segment.text)
+                unknown.append(segment.text)
+                continue
+            # Prefer the reading in the detected source language
+            phrase_id = next((p for p, language_id in segment.matches if language_id == source_id),
+                             segment.matches[0][0])
+            text_id = self._translations[phrase_id * len(self.languages) + target_id]
+            if text_id < 0:
+                words.append(segment.text)
+                unknown.append(segment.text)
+            else:
+                words.append(self._text(text_id))
+        return self.separators[target_id].join(words), source, unknown
+
+    def phrases(self, language, limit=None):
+        """Known phrases in language, in file order"""
+        language_id = self._language_ids[language]
+        texts = []
+        for phrase_id in range(self.phrase_count):
+            text_id = self._translations[phrase_id * len(self.languages) + language_id]
+            if text_id >= 0:
+                texts.append(self._text(text_id))
+                if limit is not None and len(texts) >= limit:
+                    break
+        return texts
+
+
+phrasebook = Phrasebook.load()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Command-history retention: daily usage rollups and pruning of old raw rows
+
+Every /chat message adds a command_history row. A background worker folds new
+rows into command_usage_daily (one row per user, UTC day and intent), which
+/stats reads, then deletes raw rows older than the retention period, optionally
+appending them to gzipped JSON-lines archives first. Both jobs work in small
+batches, each in its own short write transaction, and only raw rows that have
+already been rolled up are ever pruned. A watermark in rollup_state records the
+last history id rolled up, so a row is counted exactly once even when several
+processes run the worker.
+
+    python retention.py            # run both jobs once, e.g. from cron
+    python retention.py --rollup   # only fold new history into the rollups
+"""
+
+import argparse
+import datetime
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import db
+
+log = logging.getLogger('darek.retention')
+
+# Raw history older than this is pruned; 0 keeps it forever
+RETENTION_DAYS = int(os.getenv('DAREK_HISTORY_RETENTION_DAYS', '90'))
+# Pruned rows are appended here as history-YYYY-MM.jsonl.gz; empty means just delete
+ARCHIVE_DIR = os.getenv('DAREK_HISTORY_ARCHIVE_DIR', '')
+BATCH_SIZE = int(os.getenv('DAREK_RETENTION_BATCH_SIZE', '500'))
+# Seconds between runs of the worker, and the pause between batches so other
+# writers get the lock
+INTERVAL = float(os.getenv('DAREK_RETENTION_INTERVAL', '300'))
+BATCH_PAUSE = int(os.getenv('DAREK_RETENTION_PAUSE_MS', '20')) / 1000
+
+QUERIES = {
+    'stats': '''
+        SELECT day, intent, count, failures FROM command_usage_daily
+        WHERE user_id = ? AND day >= ?
+        ORDER BY day
+    ''',
+}
+
+WATERMARK = 'command_usage_daily'
+
+ROLLUP = '''
+    INSERT INTO command_usage_daily (user_id, day, intent, count, failures)
+    SELECT user_id, date(timestamp), coalesce(intent, 'unknown'), count(*), sum(NOT success)
+    FROM command_history WHERE id > ? AND id <= ?
+    GROUP BY user_id, date(timestamp), coalesce(intent, 'unknown')
+    ON CONFLICT (user_id, day, intent) DO UPDATE SET
+        count = count + excluded.count, failures = failures + excluded.failures
+'''
+
+
+def watermark(conn):
+    """Id of the last command_history row folded into the rollups"""
+    row = conn.execute('SELECT last_id FROM rollup_state WHERE name = ?', (WATERMARK,)).fetchone()
+    return row[0] if row else 0
+
+
+def rollup(conn, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Fold every new history row into command_usage_daily; returns the row count"""
+    total = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            last = watermark(conn)
+            upto, count = conn.execute(
+                'SELECT max(id), count(*) FROM (SELECT id FROM command_history WHERE id > ? ORDER BY id LIMIT ?)',
+                (last, batch_size)).fetchone()
+            if not count:
+                conn.rollback()
+                return total
+            conn.execute(ROLLUP, (last, upto))
+            conn.execute('INSERT INTO rollup_state (name, last_id) VALUES (?, ?) '
+                         'ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id, '
+                         'updated_at = CURRENT_TIMESTAMP', (WATERMARK, upto))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += count
+        if count < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def archive(rows, directory):
+    """Append pruned history rows to the monthly archive files in directory"""
+    os.makedirs(directory, exist_ok=True)
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(str(row['timestamp'])[:7], []).append(row)
+    for month, month_rows in by_month.items():
+        # Appending makes another gzip member; readers see one continuous stream
+        with gzip.open(os.path.join(directory, f'history-{month}.jsonl.gz'), 'at', encoding='utf-8') as f:
+            for row in month_rows:
+                f.write(json.dumps(dict(row), default=str) + '\n')
+
+
+def prune(conn, days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Delete rolled-up history rows older than days, oldest first; returns the row count"""
+    if days <= 0:
+        return 0
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    total = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Ids follow insertion time, so old rows are a prefix of the table:
+            # read one batch from the start and stop at the first row to keep
+            rows = conn.execute(
+                'SELECT id, user_id, command, timestamp, success, intent FROM command_history '
+                'WHERE id <= ? ORDER BY id LIMIT ?', (watermark(conn), batch_size)).fetchall()
+            expired = []
+            for row in rows:
+                if str(row['timestamp']) >= cutoff:
+                    break
+                expired.append(row)
+            if not expired:
+                conn.rollback()
+                return total
+            if archive_dir:
+                archive(expired, archive_dir)
+            conn.execute('DELETE FROM command_history WHERE id BETWEEN ? AND ?', (expired[0]['id'], expired[-1]['id']))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += len(expired)
+        if len(expired) < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def run_once(jobs=('rollup', 'prune')):
+    """Run the retention jobs now; returns {job: rows}"""
+    done = {}
+    conn = db.get_connection()
+    try:
+        if 'rollup' in jobs:
+            done['rollup'] = rollup(conn)
+        if 'prune' in jobs:
+            done['prune'] = prune(conn)
+    finally:
+        conn.close()
+    return done
+
+
+def usage(user_id, days=30):
+    """A user's command counts for the last days UTC days, from the rollups alone"""
+    since = (datetime.datetime.utcnow().date() - datetime.timedelta(days=days - 1)).isoformat()
+    conn = db.get_connection()
+    try:
+        rows = conn.execute(QUERIES['stats'], (user_id, since)).fetchall()
+        updated = conn.execute('SELECT updated_at FROM rollup_state WHERE name = ?', (WATERMARK,)).fetchone()
+    finally:
+        conn.close()
+    per_day = {}
+    per_intent = {}
+    failures = 0
+    for row in rows:
+        per_day[row['day']] = per_day.get(row['day'], 0) + row['count']
+        per_intent[row['intent']] = per_intent.get(row['intent'], 0) + row['count']
+        failures += row['failures']
+    return {
+        'since': since,
+        'total': sum(per_day.values()),
+        'failures': failures,
+        'days': [{'day': day, 'count': count} for day, count in per_day.items()],
+        'intents': dict(sorted(per_intent.items(), key=lambda item: -item[1])),
+        'updated_at': updated[0] if updated else None,
+    }
+
+
+class RetentionWorker:
+    """Runs the retention jobs every interval seconds on one background thread"""
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self._pid = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread in this process; cheap to call on every request"""
+        if self._pid == os.getpid() or self.interval <= 0:
+            return
+        with self._lock:
+            # The thread does not survive a fork; each process starts its own
+            if self._pid == os.getpid():
+                return
+            self._stopping = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._pid = None
+            self._stopping.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self):
+        stopping = self._stopping
+        while not stopping.wait(self.interval):
+            try:
+                done = run_once()
+                if any(done.values()):
+                    log.info('Retention run', extra=done)
+            except Exception:
+                log.exception('Retention run failed')
+
+
+worker = RetentionWorker()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Roll up and prune command history')
+    parser.add_argument('--rollup', action='store_true', help='only fold new history into the rollups')
+    parser.add_argument('--prune', action='store_true', help='only prune old raw history')
+    args = parser.parse_args()
+    jobs = [job for job in ('rollup', 'prune') if getattr(args, job)] or ['rollup', 'prune']
+
+    from init_db import create_database
+    create_database()
+    started = time.perf_counter()
+    done = run_once(jobs)
+    print(', '.join(f'{job}: {rows} rows' for job, rows in done.items())
+          + f' ({time.perf_counter() - started:.1f} s)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
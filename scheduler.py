@@ -0,0 +1,350 @@
+"""
+Server-side scheduler for reminders and timers
+
+Pending reminders and timers are loaded from the database once, kept in a
+min-heap ordered by due time and fired by a single background thread that
+sleeps until the earliest item is due. New items are pushed onto the heap as
+they are created (O(log n)), so the database is never polled. Firing a reminder
+marks it completed and firing a timer marks it inactive; the UPDATE only
+matches rows still pending, so an item is fired exactly once even if several
+processes schedule it. If the claim fails (say the database is locked), the
+items go back on the heap and are claimed again shortly. Fired items are
+published to the user's connected event streams (see the /events route).
+
+With several worker processes, each one runs a scheduler and the claim
+decides which fires an item. The user's event stream may be held by another
+worker, so when the host-wide tier in shared_cache is on, fired events go
+through its event log and every worker delivers the new entries to its own
+listeners. A client that reconnects is replayed its events from the log, from
+where its last stream stopped reading, so an event one worker delivered is
+not replayed again by another.
+"""
+
+import datetime
+import heapq
+import json
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+
+import dashboard
+import db
+import shared_cache
+
+log = logging.getLogger('darek.scheduler')
+
+# Fired events kept per user for a client that is not connected right now
+MISSED_EVENTS = int(os.getenv('DAREK_SCHEDULER_MISSED_EVENTS', '20'))
+# Seconds a user's missed events are kept for them to reconnect
+MISSED_EVENT_TTL = shared_cache.EVENT_RETENTION
+
+# Seconds between keep-alive comments on an idle event stream
+HEARTBEAT_INTERVAL = 15
+
+# How often each worker reads the shared event log, when there is one
+EVENT_POLL_INTERVAL = int(os.getenv('DAREK_EVENT_POLL_MS', '250')) / 1000
+
+# Seconds before due items are claimed again after a failed claim
+CLAIM_RETRY_DELAY = int(os.getenv('DAREK_SCHEDULER_RETRY_MS', '2000')) / 1000
+
+PENDING_QUERIES = {
+    'reminder': 'SELECT id, task, remind_at, user_id FROM reminder WHERE completed = 0',
+    'timer': 'SELECT id, name, duration, start_time, user_id FROM timer WHERE active = 1',
+}
+
+CLAIM_QUERIES = {
+    'reminder': f'UPDATE reminder SET completed = 1, version = {dashboard.next_version("reminder.user_id")} '
+                'WHERE id = ? AND completed = 0',
+    'timer': f'UPDATE timer SET active = 0, version = {dashboard.next_version("timer.user_id")} '
+             'WHERE id = ? AND active = 1',
+}
+
+
+def reminder_due(remind_at):
+    """Epoch seconds for a reminder's remind_at (naive local time)"""
+    if isinstance(remind_at, str):
+        remind_at = datetime.datetime.fromisoformat(remind_at)
+    return remind_at.timestamp()
+
+
+def timer_due(start_time, duration):
+    """Epoch seconds at which a timer started at start_time (UTC) runs out"""
+    if isinstance(start_time, str):
+        start_time = datetime.datetime.fromisoformat(start_time)
+    return start_time.replace(tzinfo=datetime.timezone.utc).timestamp() + duration
+
+
+def format_event(event):
+    """Encode a fired event as a server-sent event frame"""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+class EventBroker:
+    """Fan fired events out to each user's connected listeners"""
+
+    def __init__(self, missed_events=MISSED_EVENTS, shared=None, missed_ttl=MISSED_EVENT_TTL):
+        self.missed_events = missed_events
+        self.missed_ttl = missed_ttl
+        self.shared = shared if shared is not None else shared_cache.store
+        self._listeners = defaultdict(set)
+        # user_id -> (when the last one was missed, events), least recently missed first
+        self._missed = OrderedDict()
+        self._lock = threading.Lock()
+        self._poller_pid = None
+        # Last event of the shared log this worker has delivered
+        self._polled = None
+
+    def start(self):
+        """Follow the shared event log from now on, if there is one"""
+        if not self.shared.enabled or self._poller_pid == os.getpid():
+            return
+        with self._lock:
+            if self._poller_pid == os.getpid():
+                return
+            self._poller_pid = os.getpid()
+        try:
+            last = self.shared.last_event_id()
+        except Exception:
+            log.exception('Failed to open the shared event log')
+            self._poller_pid = None
+            return
+        with self._lock:
+            self._polled = last
+        threading.Thread(target=self._poll, args=(last,), name='event-log', daemon=True).start()
+
+    def _following(self):
+        return self._poller_pid == os.getpid() and self._polled is not None
+
+    def _poll(self, last):
+        while self._poller_pid == os.getpid():
+            time.sleep(EVENT_POLL_INTERVAL)
+            try:
+                for last, user_id, event in self.shared.events_after(last):
+                    self._deliver(user_id, event, last)
+            except Exception:
+                log.exception('Failed to read the shared event log')
+
+    def subscribe(self, user_id, deliver):
+        """Register deliver(event) for user_id and replay events it missed"""
+        self.start()
+        with self._lock:
+            self._listeners[user_id].add(deliver)
+            missed_at, missed = self._missed.pop(user_id, (None, ()))
+            # Events up to here are replayed below, later ones the poller delivers
+            polled = self._polled if self._following() else None
+        if missed_at is not None and time.monotonic() - missed_at >= self.missed_ttl:
+            missed = ()
+        if polled is not None:
+            missed = list(missed) + self._logged_missed(user_id, polled)
+        for event in missed:
+            deliver(event)
+
+    def _logged_missed(self, user_id, polled):
+        """user_id's events in the shared log after their last stream stopped, up to polled"""
+        try:
+            seen = self.shared.get(f'events-seen:{user_id}') or 0
+            return self.shared.user_events(user_id, seen, polled, self.missed_events)
+        except Exception:
+            log.exception('Failed to replay missed events from the shared log')
+            return []
+
+    def unsubscribe(self, user_id, deliver):
+        seen = None
+        with self._lock:
+            listeners = self._listeners.get(user_id)
+            if listeners is not None:
+                listeners.discard(deliver)
+                if not listeners:
+                    del self._listeners[user_id]
+                    if self._following():
+                        seen = self._polled
+        if seen is not None:
+            # Outlives the log, so no event the user saw is replayed once the key expires
+            self.shared.set(f'events-seen:{user_id}', seen, shared_cache.EVENT_RETENTION * 2)
+
+    def publish(self, user_id, event):
+        if self.shared.enabled:
+            try:
+                # Every worker's poller, this one's included, delivers it
+                self.shared.publish_event(user_id, event)
+                return
+            except Exception:
+                log.exception('Failed to log event; delivering it in this process only')
+        self._deliver(user_id, event)
+
+    def _deliver(self, user_id, event, event_id=None):
+        with self._lock:
+            if event_id is not None:
+                self._polled = event_id
+            listeners = list(self._listeners.get(user_id, ()))
+            if not listeners:
+                # An event from the shared log stays there for subscribe to replay
+                if event_id is None:
+                    self._keep_missed(user_id, event)
+                return
+        for deliver in listeners:
+            deliver(event)
+
+    def _keep_missed(self, user_id, event):
+        now = time.monotonic()
+        _, events = self._missed.pop(user_id, (None, None))
+        if events is None:
+            events = deque(maxlen=self.missed_events)
+        events.append(event)
+        self._missed[user_id] = (now, events)
+        # Forget users who have not come back for missed_ttl
+        while self._missed:
+            oldest, (missed_at, _) = next(iter(self._missed.items()))
+            if now - missed_at < self.missed_ttl:
+                break
+            del self._missed[oldest]
+
+    def listener_count(self):
+        with self._lock:
+            return sum(len(listeners) for listeners in self._listeners.values())
+
+
+class Scheduler:
+    """Min-heap of pending reminders and timers fired by one thread"""
+
+    def __init__(self, broker=None):
+        self.broker = broker or EventBroker()
+        self.fired = 0
+        self._heap = []
+        self._scheduled = set()
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+
+    def start(self):
+        """Load pending items and start the firing thread; safe to call again"""
+        with self._condition:
+            # The thread does not survive a fork; the child reloads and restarts
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._heap = []
+            self._scheduled = set()
+            self._stopping = False
+            self._pid = os.getpid()
+            self.broker.start()
+            self._load()
+            self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._condition.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _load(self):
+        conn = db.get_connection()
+        try:
+            for row in conn.execute(PENDING_QUERIES['reminder']):
+                self._heap.append(self._entry(reminder_due(row['remind_at']), 'reminder',
+                                              row['id'], row['user_id'], row['task']))
+            for row in conn.execute(PENDING_QUERIES['timer']):
+                self._heap.append(self._entry(timer_due(row['start_time'], row['duration']), 'timer',
+                                              row['id'], row['user_id'], row['name']))
+        finally:
+            conn.close()
+        heapq.heapify(self._heap)
+
+    def _entry(self, due, kind, item_id, user_id, label):
+        self._scheduled.add((kind, item_id))
+        return (due, next(self._counter), kind, item_id, user_id, label)
+
+    def schedule(self, kind, item_id, user_id, label, due):
+        """Add a reminder or timer that fires at due (epoch seconds)"""
+        self.start()
+        with self._condition:
+            # Already loaded from the database when start() ran just now
+            if (kind, item_id) in self._scheduled:
+                return
+            entry = self._entry(due, kind, item_id, user_id, label)
+            heapq.heappush(self._heap, entry)
+            # Only wake the thread if the new item is now the earliest one
+            if self._heap[0] is entry:
+                self._condition.notify()
+
+    def schedule_reminder(self, reminder_id, user_id, task, remind_at):
+        self.schedule('reminder', reminder_id, user_id, task, reminder_due(remind_at))
+
+    def schedule_timer(self, timer_id, user_id, name, duration):
+        self.schedule('timer', timer_id, user_id, name, time.time() + duration)
+
+    def pending(self):
+        with self._condition:
+            return len(self._heap)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    if self._heap:
+                        delay = self._heap[0][0] - time.time()
+                        if delay <= 0:
+                            break
+                        self._condition.wait(delay)
+                    else:
+                        self._condition.wait()
+                if self._stopping:
+                    return
+                now = time.time()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    item = heapq.heappop(self._heap)
+                    self._scheduled.discard((item[2], item[3]))
+                    due.append(item)
+            try:
+                self._fire(due)
+            except Exception:
+                log.exception('Failed to fire %d scheduled items', len(due))
+
+    def _retry(self, items):
+        """Put items whose claim failed back on the heap, due again after CLAIM_RETRY_DELAY"""
+        due = time.time() + CLAIM_RETRY_DELAY
+        with self._condition:
+            for _, _, kind, item_id, user_id, label in items:
+                # Scheduled again meanwhile, e.g. reloaded by a restart
+                if (kind, item_id) not in self._scheduled:
+                    heapq.heappush(self._heap, self._entry(due, kind, item_id, user_id, label))
+
+    def _fire(self, items):
+        # Claim every due row in one transaction, then notify outside it
+        claimed = []
+        try:
+            conn = db.get_connection()
+            try:
+                for due, _, kind, item_id, user_id, label in items:
+                    if conn.execute(CLAIM_QUERIES[kind], (item_id,)).rowcount:
+                        claimed.append((due, kind, item_id, user_id, label))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception:
+            # Nothing was committed, so none of them is claimed yet
+            log.exception('Failed to claim %d due items; retrying in %g s', len(items), CLAIM_RETRY_DELAY)
+            self._retry(items)
+            return
+
+        for due, kind, item_id, user_id, label in claimed:
+            self.fired += 1
+            dashboard.invalidate(user_id)
+            self.broker.publish(user_id, {
+                'type': kind,
+                'id': item_id,
+                'label': label,
+                'due': due,
+                'message': f"🔔 Reminder: {label}" if kind == 'reminder' else f"⏰ Your {label} is done!",
+            })
+
+
+scheduler = Scheduler()
@@ -0,0 +1,183 @@
+"""
+Host-wide cache shared by every worker process
+
+A small SQLite file (DAREK_SHARED_CACHE_PATH) holds key -> JSON value entries
+with an absolute expiry time. Every worker on the host reads and writes the
+same file, so an upstream answer fetched by one worker serves all of them and
+survives worker restarts, and a per-user view invalidated by one worker is
+invalidated for all. Each write is a single statement, so an entry is always
+replaced whole. The file is separate from the main database so cache traffic
+never waits on application writes, and it is only a cache: durability is
+traded for speed and any error reads as a miss.
+
+The same file carries a short log of scheduler events, so a reminder fired by
+one worker reaches a user whose event stream is held by another (see
+scheduler.EventBroker).
+
+An empty path turns the tier off; callers then keep to their in-process caches.
+"""
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger('darek.shared_cache')
+
+SHARED_CACHE_PATH = os.getenv('DAREK_SHARED_CACHE_PATH', '')
+
+# Scheduler events older than this are trimmed from the log; it is also as far
+# back as a reconnecting client is replayed what it missed
+EVENT_RETENTION = int(os.getenv('DAREK_SHARED_EVENT_RETENTION', '3600'))
+
+# One write in this many also deletes expired entries
+PURGE_EVERY = 1000
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS entry (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL) '
+    'WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS ix_entry_expires_at ON entry (expires_at)',
+    'CREATE TABLE IF NOT EXISTS event (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+    'payload TEXT NOT NULL, created_at REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS ix_event_user_id ON event (user_id, id)',
+)
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    # Losing the last writes in a power cut only costs cache misses
+    'PRAGMA synchronous=OFF',
+    'PRAGMA mmap_size=67108864',
+    'PRAGMA busy_timeout=1000',
+)
+
+
+class SharedCache:
+    """TTL key-value store in a SQLite file shared by the processes on a host"""
+
+    def __init__(self, path):
+        self.path = path
+        self.enabled = bool(path)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread, and never one inherited across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        for statement in SCHEMA:
+            conn.execute(statement)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _failed(self, action):
+        self.errors += 1
+        log.warning('Shared cache %s failed', action, exc_info=True)
+
+    def get(self, key):
+        """The live value stored under key, or None"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """{key: value} for the keys that have a live entry"""
+        if not self.enabled:
+            return {}
+        try:
+            rows = self._connection().execute(
+                f"SELECT key, value FROM entry WHERE key IN ({', '.join('?' * len(keys))}) AND expires_at > ?",
+                (*keys, time.time())).fetchall()
+        except sqlite3.Error:
+            self._failed('read')
+            return {}
+        self.hits += len(rows)
+        self.misses += len(keys) - len(rows)
+        return {key: json.loads(value) for key, value in rows}
+
+    def set(self, key, value, ttl):
+        """Store value (anything JSON can encode) under key for ttl seconds"""
+        if not self.enabled:
+            return
+        try:
+            conn = self._connection()
+            conn.execute('INSERT OR REPLACE INTO entry (key, value, expires_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(value), time.time() + ttl))
+            if random.randrange(PURGE_EVERY) == 0:
+                conn.execute('DELETE FROM entry WHERE expires_at <= ?', (time.time(),))
+        except sqlite3.Error:
+            self._failed('write')
+
+    def delete(self, key):
+        if not self.enabled:
+            return
+        try:
+            self._connection().execute('DELETE FROM entry WHERE key = ?', (key,))
+        except sqlite3.Error:
+            self._failed('write')
+
+    def incr(self, key, ttl):
+        """Atomically add one to the counter under key and return it (None if off)"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            # An expired counter starts again from 1
+            row = self._connection().execute(
+                "INSERT INTO entry (key, value, expires_at) VALUES (?, '1', ?) "
+                'ON CONFLICT (key) DO UPDATE SET '
+                'value = CASE WHEN expires_at > ? THEN CAST(value AS INTEGER) + 1 ELSE 1 END, '
+                'expires_at = excluded.expires_at RETURNING value', (key, now + ttl, now)).fetchone()
+        except sqlite3.Error:
+            self._failed('write')
+            return None
+        return int(row[0])
+
+    def clear(self):
+        if self.enabled:
+            self._connection().execute('DELETE FROM entry')
+
+    def publish_event(self, user_id, event):
+        """Append a scheduler event to the log every worker reads"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute('INSERT INTO event (user_id, payload, created_at) VALUES (?, ?, ?)',
+                     (user_id, json.dumps(event), now))
+        if random.randrange(100) == 0:
+            conn.execute('DELETE FROM event WHERE created_at < ?', (now - EVENT_RETENTION,))
+
+    def last_event_id(self):
+        return self._connection().execute('SELECT coalesce(max(id), 0) FROM event').fetchone()[0]
+
+    def events_after(self, event_id):
+        """[(id, user_id, event)] logged after event_id, oldest first"""
+        rows = self._connection().execute(
+            'SELECT id, user_id, payload FROM event WHERE id > ? ORDER BY id', (event_id,)).fetchall()
+        return [(row_id, user_id, json.loads(payload)) for row_id, user_id, payload in rows]
+
+    def user_events(self, user_id, after, until, limit):
+        """The last limit of user_id's events logged after id after up to until, oldest first
+
+        Events older than EVENT_RETENTION are left out even if not trimmed yet.
+        """
+        rows = self._connection().execute(
+            'SELECT payload FROM event WHERE user_id = ? AND id > ? AND id <= ? AND created_at >= ? '
+            'ORDER BY id DESC LIMIT ?', (user_id, after, until, time.time() - EVENT_RETENTION, limit)).fetchall()
+        return [json.loads(payload) for payload, in reversed(rows)]
+
+    def stats(self):
+        return {'enabled': self.enabled, 'path': self.path, 'hits': self.hits,
+                'misses': self.misses, 'errors': self.errors}
+
+
+store = SharedCache(SHARED_CACHE_PATH)
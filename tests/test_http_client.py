@@ -0,0 +1,87 @@
+"""
+Circuit breaker of http_client against a local stub upstream
+
+    python -m pytest tests/test_http_client.py
+"""
+
+import time
+
+import pytest
+
+import http_client
+from benchmarks.stub_upstream import StubServer
+
+RESET_TIMEOUT = 0.05
+
+
+@pytest.fixture
+def server():
+    server = StubServer(error_rate=1.0).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    return http_client.HttpClient(max_retries=0, failure_threshold=2, reset_timeout=RESET_TIMEOUT)
+
+
+def url(server):
+    return server.base_url + '/search'
+
+
+def breaker(client, server):
+    return client.breaker(server.base_url.split('//')[1])
+
+
+def open_circuit(client, server):
+    for _ in range(2):
+        assert client.get(url(server)).status_code == 503
+    assert breaker(client, server).state == 'open'
+
+
+def test_opens_after_consecutive_failures_and_fails_fast(client, server):
+    open_circuit(client, server)
+    served = server.requests
+    with pytest.raises(http_client.CircuitOpenError):
+        client.get(url(server))
+    assert server.requests == served
+
+
+def test_half_open_probe_that_succeeds_closes(client, server):
+    open_circuit(client, server)
+    time.sleep(RESET_TIMEOUT)
+    server.error_rate = 0.0
+    assert client.get(url(server)).status_code == 200
+    assert breaker(client, server).state == 'closed'
+    assert breaker(client, server).failures == 0
+
+
+def test_half_open_probe_that_fails_opens_again(client, server):
+    open_circuit(client, server)
+    time.sleep(RESET_TIMEOUT)
+    assert client.get(url(server)).status_code == 503
+    assert breaker(client, server).state == 'open'
+    with pytest.raises(http_client.CircuitOpenError):
+        client.get(url(server))
+
+
+def test_half_open_probe_that_raises_anything_else_opens_again(client, server, monkeypatch):
+    open_circuit(client, server)
+    time.sleep(RESET_TIMEOUT)
+
+    def broken(*args, **kwargs):
+        raise ValueError('not a connection error')
+
+    monkeypatch.setattr(client.session, 'get', broken)
+    with pytest.raises(ValueError):
+        client.get(url(server))
+    # Without recording the failure the breaker stays half-open and rejects every call
+    assert breaker(client, server).state == 'open'
+    monkeypatch.undo()
+
+    time.sleep(RESET_TIMEOUT)
+    server.error_rate = 0.0
+    assert client.get(url(server)).status_code == 200
+    assert breaker(client, server).state == 'closed'
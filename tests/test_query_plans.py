@@ -0,0 +1,19 @@
+"""
+Hot queries of a freshly migrated database are served from an index
+
+    python -m pytest tests/test_query_plans.py
+"""
+
+import db
+import init_db
+
+
+def test_hot_queries_use_an_index(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / 'darek_ai.db'))
+    conn = pool.acquire()
+    try:
+        init_db.migrate(conn)
+        assert init_db.schema_version(conn) == init_db.MIGRATIONS[-1][0]
+        assert init_db.full_scans(conn) == []
+    finally:
+        conn.close_connection()
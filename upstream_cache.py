@@ -0,0 +1,230 @@
+"""
+Bounded TTL + LRU cache for upstream API responses
+
+Entries are fresh for `ttl` seconds. For `stale_ttl` seconds after that they
+are still served while one background refresh runs (stale-while-revalidate).
+Concurrent misses for the same key share a single fetch (single-flight).
+
+When the host-wide tier in shared_cache is on, a miss here is looked up there
+before fetching, and every fetched value is written there too, so one worker's
+fetch serves every worker on the host and a restarted worker starts warm.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+import shared_cache
+
+# Every cache created in this process, by name, for stats()
+caches = {}
+
+_MISS = object()
+
+
+def normalize_key(key):
+    """Case-fold and collapse whitespace so equivalent queries share an entry"""
+    return ' '.join(str(key).casefold().split())
+
+
+class _Flight:
+    """A fetch in progress that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class UpstreamCache:
+    """TTL cache with LRU eviction, stale-while-revalidate and single-flight"""
+
+    def __init__(self, name, ttl, stale_ttl=0, max_entries=1024, shared=None):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.evictions = 0
+        # Misses here answered by the host-wide tier (also counted as hits)
+        self.shared_hits = 0
+        self.shared = shared if shared is not None else shared_cache.store
+        # key -> (value, fetched_at)
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        caches[name] = self
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached value for key, calling fetch() on a miss
+
+        A fetch that returns None is passed through but not cached, so
+        failures and "not found" answers are retried on the next call.
+        """
+        key = normalize_key(key)
+        value = self._lookup(key, fetch)
+        if value is not _MISS:
+            return value
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = _Flight()
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        return self._fetch(key, fetch, flight)
+
+    def peek(self, key, fetch):
+        """The value get_or_fetch would return without fetching, or None on a miss
+
+        For callers that fetch in their own way, e.g. streaming the response,
+        and put() the result; misses here are not coalesced. fetch is only
+        used to refresh a stale entry in the background.
+        """
+        key = normalize_key(key)
+        value = self._lookup(key, fetch)
+        if value is _MISS:
+            with self._lock:
+                self.misses += 1
+            return None
+        return value
+
+    def put(self, key, value):
+        """Cache value for key as if get_or_fetch had fetched it"""
+        key = normalize_key(key)
+        with self._lock:
+            self._store(key, value)
+        self._share(key, value)
+
+    def _lookup(self, key, fetch):
+        """The value to serve for key from this process or the host-wide tier, or _MISS"""
+        with self._lock:
+            value = self._cached(key, fetch)
+        if value is not _MISS or not self.shared.enabled:
+            return value
+        # Outside the lock: this reads a file that other processes write
+        entry = self.shared.get(self._shared_key(key))
+        if entry is None:
+            return _MISS
+        age = time.time() - entry['fetched_at']
+        with self._lock:
+            self._store(key, entry['value'], time.monotonic() - age)
+            self.shared_hits += 1
+            return self._cached(key, fetch)
+
+    def _cached(self, key, fetch):
+        """The value to serve for key from this process, or _MISS; call under the lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISS
+        value, fetched_at = entry
+        age = time.monotonic() - fetched_at
+        if age < self.ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+        if age < self.ttl + self.stale_ttl:
+            self._entries.move_to_end(key)
+            self.stale_hits += 1
+            if key not in self._inflight:
+                self._inflight[key] = _Flight()
+                threading.Thread(target=self._refresh, args=(key, fetch),
+                                 name=f'{self.name}-refresh', daemon=True).start()
+            return value
+        return _MISS
+
+    def _shared_key(self, key):
+        return f'upstream:{self.name}:{key}'
+
+    def _fetch(self, key, fetch, flight):
+        try:
+            value = fetch()
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self.errors += 1
+                self._inflight.pop(key, None)
+            flight.done.set()
+            raise
+        flight.value = value
+        with self._lock:
+            if value is not None:
+                self._store(key, value)
+            self._inflight.pop(key, None)
+        flight.done.set()
+        if value is not None:
+            self._share(key, value)
+        return value
+
+    def _share(self, key, value):
+        if self.shared.enabled:
+            self.shared.set(self._shared_key(key), {'value': value, 'fetched_at': time.time()},
+                            self.ttl + self.stale_ttl)
+
+    def _refresh(self, key, fetch):
+        with self._lock:
+            flight = self._inflight.get(key)
+        try:
+            self._fetch(key, fetch, flight)
+        except Exception:
+            pass  # Keep serving the stale value until it expires
+
+    def _store(self, key, value, fetched_at=None):
+        self._entries[key] = (value, time.monotonic() if fetched_at is None else fetched_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'stale_ttl': self.stale_ttl,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'evictions': self.evictions,
+                'shared_hits': self.shared_hits,
+                'hit_ratio': round((self.hits + self.stale_hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+
+def stats():
+    """Counters for every upstream cache, keyed by cache name"""
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def counters():
+    """Cache counters of every upstream, as metrics counter rows"""
+    rows = []
+    for name, cache in list(caches.items()):
+        for field in ('hits', 'stale_hits', 'misses', 'coalesced', 'errors', 'evictions', 'shared_hits'):
+            rows.append((f'darek_upstream_cache_{field}_total', 'upstream', name, getattr(cache, field)))
+    return rows
+
+
+metrics.add_collector(counters)
@@ -0,0 +1,147 @@
+"""
+Upstream API calls shared by app.py and darek_core.py
+
+Every call goes through an UpstreamCache, so repeated questions ("weather in
+London") within the TTL are answered without an outbound request. Misses go
+out through the pooled, timeout-bounded client in http_client. Functions return
+the decoded JSON, or None when the upstream has no answer.
+"""
+
+import codecs
+import json
+import os
+import re
+
+import http_client
+import metrics
+from upstream_cache import UpstreamCache
+
+WEATHER_API_URL = os.getenv('WEATHER_API_URL', 'http://api.openweathermap.org/data/2.5/weather')
+NEWS_API_URL = os.getenv('NEWS_API_URL', 'https://newsapi.org/v2/top-headlines')
+SEARCH_API_URL = os.getenv('SEARCH_API_URL', 'https://api.duckduckgo.com/')
+
+weather_cache = UpstreamCache(
+    'weather',
+    ttl=int(os.getenv('DAREK_WEATHER_TTL', '600')),
+    stale_ttl=int(os.getenv('DAREK_WEATHER_STALE_TTL', '300')),
+    max_entries=2048)
+
+news_cache = UpstreamCache(
+    'news',
+    ttl=int(os.getenv('DAREK_NEWS_TTL', '1800')),
+    stale_ttl=int(os.getenv('DAREK_NEWS_STALE_TTL', '900')),
+    max_entries=16)
+
+search_cache = UpstreamCache(
+    'search',
+    ttl=int(os.getenv('DAREK_SEARCH_TTL', '21600')),
+    stale_ttl=int(os.getenv('DAREK_SEARCH_STALE_TTL', '86400')),
+    max_entries=4096)
+
+
+def get_weather(city, api_key):
+    """Current weather for city from OpenWeatherMap"""
+    def fetch():
+        response = http_client.get(WEATHER_API_URL,
+                                   params={'q': city, 'appid': api_key, 'units': 'metric'})
+        if response.status_code != 200:
+            return None
+        return response.json()
+    with metrics.timed('upstream', 'weather'):
+        return weather_cache.get_or_fetch(city, fetch)
+
+
+# Where the articles array starts in a News API response, and what separates its items
+_ARTICLES = re.compile(r'"articles"\s*:\s*\[')
+_BETWEEN_ITEMS = re.compile(r'[\s,]*')
+_decoder = json.JSONDecoder()
+
+
+def _news_fetch(api_key, country):
+    def fetch():
+        response = http_client.get(NEWS_API_URL,
+                                   params={'country': country, 'apiKey': api_key})
+        if response.status_code != 200:
+            return None
+        return response.json()
+    return fetch
+
+
+def get_news(api_key, country='us'):
+    """Top headlines from News API"""
+    with metrics.timed('upstream', 'news'):
+        return news_cache.get_or_fetch(country, _news_fetch(api_key, country))
+
+
+def iter_news(api_key, country='us', limit=None, stream=True):
+    """Iterator over the first limit top headline articles, or None when News API has no answer
+
+    A cached response is replayed. Otherwise, with stream, each article is
+    yielded as soon as it has downloaded; the rest of the response is still
+    read, and all of it is cached (for get_news as well) once the iterator is
+    exhausted. Without stream this is get_news: decoding the whole body at
+    once is cheaper when nothing is shown before the last article anyway.
+    """
+    if not stream:
+        data = get_news(api_key, country)
+        return iter(data.get('articles', [])[:limit]) if data is not None else None
+    with metrics.timed('upstream', 'news'):
+        data = news_cache.peek(country, _news_fetch(api_key, country))
+        if data is not None:
+            return iter(data.get('articles', [])[:limit])
+        response = http_client.get(NEWS_API_URL, params={'country': country, 'apiKey': api_key}, stream=True)
+    if response.status_code != 200:
+        response.close()
+        return None
+    return _read_articles(response, country, limit)
+
+
+def _read_articles(response, country, limit):
+    """Yield the articles of a streamed response as they arrive, then cache all of it"""
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+    skip = _BETWEEN_ITEMS.match
+    text = ''
+    articles = []
+    # Where the array starts and where the next article starts, once it is reached
+    match = start = None
+    try:
+        for chunk in response.iter_content(chunk_size=4096):
+            text += decode(chunk)
+            if match is None:
+                match = _ARTICLES.search(text)
+                if match is None:
+                    continue
+                start = match.end()
+            while True:
+                start = skip(text, start).end()
+                if start == len(text) or text[start] == ']':
+                    break
+                try:
+                    article, start = _decoder.raw_decode(text, start)
+                except json.JSONDecodeError:
+                    break  # The rest of it has not arrived yet
+                articles.append(article)
+                if limit is None or len(articles) <= limit:
+                    yield article
+        text += decode(b'', True)
+    finally:
+        response.close()
+    if match is None or start == len(text):
+        raise ValueError('News API response has no complete articles array')
+    # The fields around the array, without decoding the articles a second time
+    data = json.loads(text[:match.start()].rstrip().rstrip(',') + '}')
+    data.update(json.loads('{' + text[start + 1:].lstrip().lstrip(',')))
+    data['articles'] = articles
+    news_cache.put(country, data)
+
+
+def search(query):
+    """DuckDuckGo Instant Answer for query"""
+    def fetch():
+        response = http_client.get(SEARCH_API_URL,
+                                   params={'q': query, 'format': 'json', 'no_html': 1, 'skip_disambig': 1})
+        if response.status_code != 200:
+            return None
+        return response.json()
+    with metrics.timed('upstream', 'search'):
+        return search_cache.get_or_fetch(query, fetch)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Full-text search over a user's notes, to-dos, shopping items and command history
+
+Every searchable row has a search_document row and search_fts indexes its
+text, and nothing else. Each user's documents are numbered in a range of their
+own, from user_id << 32 up, so scoping a query to one user is a rowid range of
+the index rather than a filter over every user's hits. Results come newest
+first and pages are keyed on the document id, so the next page is a narrower
+rowid range, not an OFFSET.
+
+An FTS5 write costs several times the row it indexes, so nothing is indexed
+as it is written, and writing a note, to-do or shopping item touches no table
+but its own. index() adds every row of each kind past the last one indexed in
+one write: with every batch the history writer commits, and before each
+search, which therefore still finds everything committed.
+
+    python user_search.py 1 dentist --kind note
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+
+import db
+
+# Bits of a document id numbering the documents within one user's range
+ID_BITS = 32
+
+
+def next_document_id(user_id):
+    """SQL for the next document id in the range of user_id, itself an SQL expression"""
+    return (f'(SELECT coalesce(max(id), {user_id} << {ID_BITS}) + 1 FROM search_document '
+            f'WHERE id > {user_id} << {ID_BITS} AND id < ({user_id} + 1) << {ID_BITS})')
+
+
+_SEARCH = '''
+        SELECT d.id, d.kind, d.source_id, d.created_at,
+               snippet(search_fts, 0, ?, ?, '…', ?) AS snippet
+        FROM search_fts JOIN search_document d ON d.id = search_fts.rowid
+        WHERE search_fts MATCH ? AND search_fts.rowid > ? AND search_fts.rowid < ?{kinds}
+        ORDER BY search_fts.rowid DESC
+        LIMIT ?
+    '''
+
+QUERIES = {
+    'search': _SEARCH.format(kinds=''),
+    'search_kinds': _SEARCH.format(kinds=' AND d.kind IN (SELECT value FROM json_each(?))'),
+}
+
+# Command history is indexed in batches too (see index_history)
+HISTORY_QUERIES = {
+    'unindexed': '''
+        SELECT 'command', id, user_id, command, timestamp FROM command_history
+        WHERE id > (SELECT coalesce(max(source_id), 0) FROM search_document WHERE kind = 'command')
+        ORDER BY id
+    ''',
+    'last_document': 'SELECT coalesce(max(id), ?) FROM search_document WHERE id > ? AND id < ?',
+}
+
+# Last source row indexed of a kind; ids only grow, and deleting a row deletes its document
+_INDEXED = "(SELECT coalesce(max(source_id), 0) FROM search_document WHERE kind = '{kind}')"
+
+# Notes, to-dos and shopping items written since the last index (see index_pending)
+INDEX_QUERIES = {
+    'pending': f'''
+        SELECT (SELECT max(id) FROM note) > {_INDEXED.format(kind='note')}
+            OR (SELECT max(id) FROM todo_item) > {_INDEXED.format(kind='todo')}
+            OR (SELECT max(id) FROM shopping_item) > {_INDEXED.format(kind='shopping')}
+    ''',
+    # Kind by kind, each in the order it was written
+    'documents': f'''
+        SELECT * FROM (SELECT 'note', id, user_id, trim(coalesce(title, '') || ' ' || content), created_at
+                       FROM note WHERE id > {_INDEXED.format(kind='note')} ORDER BY id)
+        UNION ALL
+        SELECT * FROM (SELECT 'todo', id, user_id, task, NULL
+                       FROM todo_item WHERE id > {_INDEXED.format(kind='todo')} ORDER BY id)
+        UNION ALL
+        SELECT * FROM (SELECT 'shopping', id, user_id, item_name, NULL
+                       FROM shopping_item WHERE id > {_INDEXED.format(kind='shopping')} ORDER BY id)
+    ''',
+}
+
+INSERT_DOCUMENT = '''
+    INSERT INTO search_document (id, kind, source_id, user_id, body, created_at)
+    VALUES (?, ?, ?, ?, ?, coalesce(?, CURRENT_TIMESTAMP))
+'''
+
+# Document kind -> source table, as written to search_document (see init_db.py)
+KINDS = {
+    'note': 'note',
+    'todo': 'todo_item',
+    'shopping': 'shopping_item',
+    'command': 'command_history',
+}
+
+# Words that name a kind in a spoken query ("find my notes about ...")
+KIND_WORDS = {
+    'note': 'note', 'notes': 'note',
+    'todo': 'todo', 'todos': 'todo', 'to-do': 'todo', 'to-dos': 'todo',
+    'shopping': 'shopping',
+    'history': 'command', 'commands': 'command',
+}
+
+# Words beyond this are ignored; each one is another posting list to intersect
+MAX_QUERY_WORDS = 8
+MAX_LIMIT = 100
+SNIPPET_WORDS = 12
+# Matched words in snippets are wrapped in these, as in chat responses
+HIGHLIGHT = ('**', '**')
+
+# Dropped from queries unless nothing else is left
+STOP_WORDS = frozenset(['a', 'an', 'the', 'my', 'me', 'i', 'of', 'to', 'in', 'on', 'for', 'and', 'or', 'that'])
+
+# A trailing * asks for a prefix match ("dent*")
+_WORD = re.compile(r'\w+\*?')
+
+
+def query_words(text):
+    """Case-folded words of text worth searching for"""
+    words = _WORD.findall(text.casefold())
+    kept = [word for word in words if word.rstrip('*') not in STOP_WORDS]
+    return (kept or words)[:MAX_QUERY_WORDS]
+
+
+def match_expression(text):
+    """FTS5 query for text, or None if text has no words"""
+    words = query_words(text)
+    if not words:
+        return None
+    # Prefixes only on request: a common prefix merges the posting lists of
+    # every word it starts, which costs more than the rest of the query
+    terms = [f'"{word[:-1]}"*' if word.endswith('*') else f'"{word}"' for word in words]
+    return ' AND '.join(terms)
+
+
+def add_documents(conn, rows):
+    """Insert a search document for each (kind, source_id, user_id, body, created_at)
+
+    Each one gets the next id in its user's range. Returns the row count.
+    """
+    last = {}
+    documents = []
+    for kind, source_id, user_id, body, created_at in rows:
+        if user_id not in last:
+            first = user_id << ID_BITS
+            last[user_id] = conn.execute(HISTORY_QUERIES['last_document'],
+                                         (first, first, first + (1 << ID_BITS))).fetchone()[0]
+        last[user_id] += 1
+        documents.append((last[user_id], kind, source_id, user_id, body, created_at))
+    conn.executemany(INSERT_DOCUMENT, documents)
+    return len(documents)
+
+
+def index_history(conn):
+    """Index the command history written since the last call; returns the row count"""
+    return add_documents(conn, conn.execute(HISTORY_QUERIES['unindexed']).fetchall())
+
+
+def index_pending(conn):
+    """Index the notes, to-dos and shopping items written since the last call; returns the row count"""
+    return add_documents(conn, conn.execute(INDEX_QUERIES['documents']).fetchall())
+
+
+def index(conn):
+    """Index new command history, notes, to-dos and shopping items in conn's transaction
+
+    Run it in the transaction that wrote the history, so a batch is searchable
+    as soon as it is committed; the history writer runs it with every batch.
+    """
+    return index_history(conn) + index_pending(conn)
+
+
+def catch_up():
+    """Index any unindexed notes, to-dos and shopping items, so a search sees every committed write"""
+    conn = db.get_connection()
+    try:
+        pending = conn.execute(INDEX_QUERIES['pending']).fetchone()[0]
+    finally:
+        conn.close()
+    if pending:
+        with db.transaction():
+            index(db.get_connection())
+
+
+def search(user_id, text, kinds=None, limit=20, before=None):
+    """(results, next cursor) for text among user_id's documents, newest first
+
+    Pass the returned cursor as before to get the next page; it is None on the
+    last page. Each result is a dict with kind, id (of the source row),
+    created_at and a snippet with the matched words highlighted.
+    """
+    unknown = set(kinds or ()) - set(KINDS)
+    if unknown:
+        raise ValueError(f"Unknown kind: {', '.join(sorted(unknown))}")
+    expression = match_expression(text)
+    if expression is None:
+        return [], None
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    catch_up()
+    conn = db.get_connection()
+    try:
+        # One row past the page says whether there is another page
+        first = int(user_id) << ID_BITS
+        end = (int(user_id) + 1) << ID_BITS
+        params = [HIGHLIGHT[0], HIGHLIGHT[1], SNIPPET_WORDS, expression,
+                  first, min(before, end) if before is not None else end]
+        if kinds:
+            params.append(json.dumps(sorted(set(kinds))))
+        params.append(limit + 1)
+        rows = conn.execute(QUERIES['search_kinds' if kinds else 'search'], params).fetchall()
+    except sqlite3.OperationalError:
+        # Malformed MATCH syntax can still get through, e.g. from unusual tokenizer input
+        return [], None
+    finally:
+        conn.close()
+    results = [{'kind': row['kind'], 'id': row['source_id'], 'created_at': row['created_at'],
+                'snippet': row['snippet']} for row in rows[:limit]]
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return results, next_cursor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search one user's notes, to-dos, shopping and history")
+    parser.add_argument('user_id', type=int)
+    parser.add_argument('query')
+    parser.add_argument('--kind', action='append', choices=sorted(KINDS))
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    results, _ = search(args.user_id, args.query, args.kind, args.limit)
+    for result in results:
+        print(f"{result['kind']:<9} {result['id']:>7} {result['created_at']}  {result['snippet']}")
+    return 0 if results else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())